@@ -17,6 +17,7 @@ import OpenGL.GL as gl
 import OpenGL.GLUT as glut
 sys.path.append('../lib/')
 import utils as ut
+import scheduler as sc
 from ctypes import c_void_p
 
 
@@ -34,8 +35,12 @@ VBO = None
 
 ## Rotation angle.
 angle = 0.0
-## Rotation increment.
-angle_inc = 0.05
+## Rotation speed, in degrees per second.
+angle_speed = 30.0
+## Target frame rate of the rotation.
+frame_rate = sc.FRAME_RATE
+## Frame scheduler (draws only when something changed).
+scheduler = sc.FrameScheduler(frame_rate)
 ## Rotation mode.
 mode = 1
 
@@ -74,6 +79,8 @@ void main()
 # Draws primitive.
 def display():
 
+    scheduler.beginFrame()
+
     gl.glClearColor(0.2, 0.3, 0.3, 1.0)
     gl.glClear(gl.GL_COLOR_BUFFER_BIT)
 
@@ -115,7 +122,7 @@ def reshape(width,height):
     win_width = width
     win_height = height
     gl.glViewport(0, 0, width, height)
-    glut.glutPostRedisplay()
+    scheduler.markDirty()
 
 
 ## Keyboard function.
@@ -137,17 +144,20 @@ def keyboard(key, x, y):
     if key == b'2':
         mode = 2
 
-    glut.glutPostRedisplay()
+    scheduler.markDirty()
 
-## Idle function.
+## Spin function.
+#
+# Animation step, called by the scheduler at the target frame rate.
 #
-# Called continuously.
-def idle():
+# @param dt Seconds since the previous step.
+# @return Whether the scene changed.
+def spin(dt):
     global angle
 
-    angle = angle+angle_inc if (angle+angle_inc) < 360.0 else (360.0-angle+angle_inc)
+    angle = (angle + angle_speed*dt) % 360.0
 
-    glut.glutPostRedisplay()
+    return True
 
 
 ## Init vertex data.
@@ -222,7 +232,7 @@ def main():
     glut.glutReshapeFunc(reshape)
     glut.glutDisplayFunc(display)
     glut.glutKeyboardFunc(keyboard)
-    glut.glutIdleFunc(idle);
+    scheduler.animate(spin)
 
     glut.glutMainLoop()
 
@@ -13,6 +13,7 @@ import OpenGL.GL as gl
 import OpenGL.GLUT as glut
 sys.path.append('../lib/')
 import utils as ut
+import culling as cl
 from ctypes import c_void_p
 
 
@@ -54,6 +55,17 @@ cz_angle = 0.0
 ## Cube z angle increment
 cz_inc = 0.02
 
+## Bounds (lo, hi, center, radius) of the cube vertices.
+cube_bounds = None
+## Bounds (lo, hi, center, radius) of the pyramid vertices.
+pyramid_bounds = None
+## Positions of the extra cubes added with the '+' key.
+extra_cubes = np.zeros((0, 3), dtype='float32')
+## Number of extra cubes added per key press.
+EXTRA_CUBES = 100
+## Drawn and culled object counters.
+cull_stats = cl.CullStats()
+
 
 ## Vertex shader.
 vertex_code = """
@@ -113,10 +125,7 @@ def display():
     # Send matrix to shader.
     gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, projection.transpose())
 
-    # Pyramid.
-    gl.glBindVertexArray(VAO2)
-
-    # Define model matrix.
+    # Pyramid model matrix.
     S = ut.matScale(0.5, 0.5, 0.5)
     Rx = ut.matRotateX(np.radians(px_angle))
     Ry = ut.matRotateY(np.radians(py_angle))
@@ -124,19 +133,9 @@ def display():
     model = np.matmul(Rx,S)
     model = np.matmul(Ry,model)
     model = np.matmul(T,model)
+    models = [model]
 
-    # Retrieve location of model variable in shader.
-    loc = gl.glGetUniformLocation(program, "model")
-    # Send matrix to shader.
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, model.transpose())
-
-    gl.glDrawArrays(gl.GL_TRIANGLES, 0, 12)
-
-
-    # Cube.
-    gl.glBindVertexArray(VAO1)
-
-    # Define model matrix.
+    # Cube model matrix.
     S = ut.matScale(0.3, 0.3, 0.3)
     Rx = ut.matRotateX(np.radians(cx_angle))
     Ry = ut.matRotateY(np.radians(cy_angle))
@@ -147,13 +146,33 @@ def display():
     model = np.matmul(T,model)
     model = np.matmul(Ry,model)
     model = np.matmul(T,model)
+    models.append(model)
+
+    # Extra cubes model matrices (scaled and translated).
+    extra = np.tile(S, (len(extra_cubes), 1, 1))
+    extra[:, :3, 3] = extra_cubes
+    models = np.concatenate([np.array(models), extra])
+
+    # Objects: pyramid, cube and extra cubes.
+    n = len(models)
+    vaos = [VAO2] + [VAO1]*(n - 1)
+    counts = [12] + [36]*(n - 1)
+    lo, hi, center, radius = [np.array([p] + [c]*(n - 1)) for p, c in zip(pyramid_bounds, cube_bounds)]
+
+    # Frustum culling of all objects at once, with the planes of each
+    # projection * view * model matrix.
+    visible = cl.visible(np.matmul(np.matmul(projection, view), models), lo, hi, center, radius)
+    if cull_stats.update(visible):
+        glut.glutSetWindowTitle('Perspective Projection (%s)' % cull_stats)
 
     # Retrieve location of model variable in shader.
     loc = gl.glGetUniformLocation(program, "model")
-    # Send matrix to shader.
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, model.transpose())
 
-    gl.glDrawArrays(gl.GL_TRIANGLES, 0, 36)
+    for i in np.flatnonzero(visible):
+        gl.glBindVertexArray(vaos[i])
+        # Send matrix to shader.
+        gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, models[i].transpose())
+        gl.glDrawArrays(gl.GL_TRIANGLES, 0, counts[i])
 
     glut.glutSwapBuffers()
 
@@ -184,8 +203,15 @@ def keyboard(key, x, y):
     # global type_primitive
     # global mode
 
+    global extra_cubes
+
     if key == b'\x1b'or key == b'q':
         sys.exit( )
+    # Adds cubes around the camera, most of them out of view.
+    elif key == b'+':
+        cubes = np.random.uniform(-20.0, 20.0, (EXTRA_CUBES, 3)).astype('float32')
+        extra_cubes = np.vstack([extra_cubes, cubes])
+        print('%d extra cubes' % len(extra_cubes))
 
     glut.glutPostRedisplay()
 
@@ -220,6 +246,8 @@ def initData():
     global VBO1
     global VAO2
     global VBO2
+    global cube_bounds
+    global pyramid_bounds
 
     # Set cube vertices.
     cube = np.array([
@@ -273,6 +301,7 @@ def initData():
          0.5, -0.5, -0.5,  1.0, 1.0, 1.0,
          0.5, -0.5,  0.5,  1.0, 1.0, 1.0
     ], dtype='float32')
+    cube_bounds = cl.bounds(cube.reshape(-1, 6)[:, :3])
 
     # Vertex array.
     VAO1 = gl.glGenVertexArrays(1)
@@ -309,6 +338,7 @@ def initData():
          1.0, -1.0,  0.0, 1.0, 0.0, 0.0,
          0.0, -1.0, -1.0, 1.0, 0.0, 0.0
     ], dtype='float32')
+    pyramid_bounds = cl.bounds(pyramid.reshape(-1, 6)[:, :3])
 
     # Vertex array.
     VAO2 = gl.glGenVertexArrays(1)
@@ -13,6 +13,7 @@ import OpenGL.GL as gl
 import OpenGL.GLUT as glut
 sys.path.append('../lib/')
 import utils as ut
+import shader as sh
 from ctypes import c_void_p
 
 
@@ -65,29 +66,24 @@ def display():
     gl.glClearColor(0.2, 0.3, 0.3, 1.0)
     gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
 
-    gl.glUseProgram(program)
+    program.use()
     gl.glBindVertexArray(VAO)
 
     Rx = ut.matRotateX(np.radians(10.0))
     Ry = ut.matRotateY(np.radians(-30.0))
     model=np.matmul(Rx,Ry)
-    loc = gl.glGetUniformLocation(program, "model");
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, model.transpose())
+    program.set("model", model)
 
     view = ut.matTranslate(0.0, 0.0, -5.0)
-    loc = gl.glGetUniformLocation(program, "view");
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, view.transpose())
+    program.set("view", view)
     
     projection = ut.matPerspective(np.radians(45.0), win_width/win_height, 0.1, 100.0)
-    loc = gl.glGetUniformLocation(program, "projection");
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, projection.transpose())
+    program.set("projection", projection)
 
     # Object color.
-    loc = gl.glGetUniformLocation(program, "objectColor")
-    gl.glUniform3f(loc, 0.5, 0.1, 0.1)
+    program.set("objectColor", (0.5, 0.1, 0.1))
     # Light color.
-    loc = gl.glGetUniformLocation(program, "lightColor")
-    gl.glUniform3f(loc, 1.0, 1.0, 1.0)
+    program.set("lightColor", (1.0, 1.0, 1.0))
 
     gl.glDrawArrays(gl.GL_TRIANGLES, 0, 12*3)
 
@@ -201,7 +197,7 @@ def initShaders():
 
     global program
 
-    program = ut.createShaderProgram(vertex_code, fragment_code)
+    program = sh.ShaderProgram(vertex_code, fragment_code)
 
 
 ## Main function.
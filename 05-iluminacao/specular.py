@@ -13,6 +13,8 @@ import OpenGL.GL as gl
 import OpenGL.GLUT as glut
 sys.path.append('../lib/')
 import utils as ut
+import shader as sh
+import uniformblock as ub
 from ctypes import c_void_p
 
 
@@ -23,6 +25,10 @@ win_height = 600
 
 ## Program variable.
 program = None
+## Camera uniform block.
+camera = None
+## Light uniform block.
+lights = None
 ## Vertex array object.
 VAO = None
 ## Vertex buffer object.
@@ -35,8 +41,12 @@ layout (location = 0) in vec3 position;
 layout (location = 1) in vec3 normal;
 
 uniform mat4 model;
-uniform mat4 view;
-uniform mat4 projection;
+layout (std140, row_major) uniform Camera
+{
+    mat4 view;
+    mat4 projection;
+    vec3 cameraPosition;
+};
 
 out vec3 vNormal;
 out vec3 fragPosition;
@@ -58,9 +68,17 @@ in vec3 fragPosition;
 out vec4 fragColor;
 
 uniform vec3 objectColor;
-uniform vec3 lightColor;
-uniform vec3 lightPosition;
-uniform vec3 cameraPosition;
+layout (std140) uniform Lights
+{
+    vec3 lightPosition;
+    vec3 lightColor;
+};
+layout (std140, row_major) uniform Camera
+{
+    mat4 view;
+    mat4 projection;
+    vec3 cameraPosition;
+};
 
 void main()
 {
@@ -86,35 +104,31 @@ def display():
     gl.glClearColor(0.2, 0.3, 0.3, 1.0)
     gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
 
-    gl.glUseProgram(program)
+    program.use()
     gl.glBindVertexArray(VAO)
 
     Rx = ut.matRotateX(np.radians(10.0))
     Ry = ut.matRotateY(np.radians(-30.0))
     model=np.matmul(Rx,Ry)
-    loc = gl.glGetUniformLocation(program, "model")
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, model.transpose())
+    program.set("model", model)
 
     view = ut.matTranslate(0.0, 0.0, -5.0)
-    loc = gl.glGetUniformLocation(program, "view")
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, view.transpose())
+    camera["view"] = view
     
     projection = ut.matPerspective(np.radians(45.0), win_width/win_height, 0.1, 100.0)
-    loc = gl.glGetUniformLocation(program, "projection")
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, projection.transpose())
+    camera["projection"] = projection
 
     # Object color.
-    loc = gl.glGetUniformLocation(program, "objectColor")
-    gl.glUniform3f(loc, 0.5, 0.1, 0.1)
+    program.set("objectColor", (0.5, 0.1, 0.1))
     # Light color.
-    loc = gl.glGetUniformLocation(program, "lightColor")
-    gl.glUniform3f(loc, 1.0, 1.0, 1.0)
+    lights["lightColor"] = (1.0, 1.0, 1.0)
     # Light position.
-    loc = gl.glGetUniformLocation(program, "lightPosition")
-    gl.glUniform3f(loc, 1.0, 0.0, 2.0)
+    lights["lightPosition"] = (1.0, 0.0, 2.0)
     # Camera position.
-    loc = gl.glGetUniformLocation(program, "cameraPosition")
-    gl.glUniform3f(loc, 0.0, 0.0, 0.0)
+    camera["cameraPosition"] = (0.0, 0.0, 0.0)
+    # Camera and light blocks (sent only if they changed).
+    camera.update()
+    lights.update()
 
     gl.glDrawArrays(gl.GL_TRIANGLES, 0, 12*3)
 
@@ -225,9 +239,13 @@ def initData():
 # Compile shaders and create programs.
 def initShaders():
 
-    global program
+    global program, camera, lights
 
-    program = ut.createShaderProgram(vertex_code, fragment_code)
+    program = sh.ShaderProgram(vertex_code, fragment_code)
+    camera = ub.cameraBlock()
+    lights = ub.lightBlock()
+    camera.bind(program)
+    lights.bind(program)
 
 
 ## Main function.
@@ -7,6 +7,7 @@ import OpenGL.GL as gl
 import OpenGL.GLUT as glut
 sys.path.append('../lib/')
 import utils as ut
+import scheduler as sc
 from ctypes import c_void_p
 
 
@@ -22,10 +23,14 @@ VAO = None
 ## Vertex buffer object.
 VBO = None
 
-## Rotation angle.
-angle = 0.0
-## Rotation increment.
-angle_inc = 0.05
+## Constant rotation speed, in degrees per second.
+angle_speed = 30.0
+## Axis of the constant rotation of each mode.
+spin_axis = {3: 'x', 4: 'y', 5: 'z'}
+## Target frame rate of the constant rotation.
+frame_rate = sc.FRAME_RATE
+## Frame scheduler (draws only when something changed).
+scheduler = sc.FrameScheduler(frame_rate)
 ## Rotation mode.
 mode = 1
 ## Transform Matrix
@@ -67,6 +72,8 @@ void main()
 def display():
     global M
 
+    scheduler.beginFrame()
+
     gl.glClearColor(0.2, 0.3, 0.3, 1.0)
     gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
 
@@ -94,7 +101,7 @@ def reshape(width,height):
     win_width = width
     win_height = height
     gl.glViewport(0, 0, win_width, win_height)
-    glut.glutPostRedisplay()
+    scheduler.markDirty()
 
 
 ## Keyboard function.
@@ -109,6 +116,7 @@ def keyboard(key, x, y):
     global type_primitive
     global mode
 
+    anterior = mode
     # Primeiro verifica modo de exibição
     if key == b'\x1b':
         sys.exit( )
@@ -124,6 +132,9 @@ def keyboard(key, x, y):
         mode = 4 # Rotação Y constante
     if key == b'5':
         mode = 5 # Rotação Z constante
+    # Só os modos 3, 4 e 5 animam; nos outros o programa dorme até o próximo evento
+    if mode != anterior:
+        scheduler.animate(spin if mode in spin_axis else None)
 
     # TRANSFORMAÇÕES
     #
@@ -164,7 +175,7 @@ def keyboard(key, x, y):
         rotation('z')
     
 
-    glut.glutPostRedisplay()
+    scheduler.markDirty()
 
 
 # Método que caclula a translação do cubo em e, y e z
@@ -173,7 +184,7 @@ def translation(x, y, z):
 
     T = ut.matTranslate(x, y, z) # Configura a matriz de translação com os valores
     M = np.matmul(T,M) # Multiplica a matriz T pela "geral" M
-    glut.glutPostRedisplay() # Chama a redisplay para redesenhar
+    scheduler.markDirty() # Pede um novo quadro para redesenhar
 
 # Método que calcula a escala do cubo em x, y e z
 def scaling(x, y, z):
@@ -181,7 +192,7 @@ def scaling(x, y, z):
 
     S = ut.matScale(x, y, z) # Gera a matriz de scala com os valores
     M = np.matmul(S,M) # Multiplica a matriz S pela "geral" M
-    glut.glutPostRedisplay() # Chama a redisplay para redesenhar
+    scheduler.markDirty() # Pede um novo quadro para redesenhar
 
 def rotation(axis, angle=10.0):
     global M
@@ -194,22 +205,23 @@ def rotation(axis, angle=10.0):
         R = ut.matRotateZ(np.radians(angle))
 
     M = np.matmul(R,M)
-    glut.glutPostRedisplay()
+    scheduler.markDirty()
 
 
 
 
-## Idle function.
+## Spin function.
+#
+# Animation step, called by the scheduler at the target frame rate. Rotates
+# the cube around the axis of the current mode (3, 4 or 5).
 #
-# Called continuously.
-# idle foi definida para continuar a incrementar o ângulo em determinado modo de execição do programa
-def idle():
-    global angle
+# @param dt Seconds since the previous step.
+# @return Whether the scene changed.
+def spin(dt):
 
-    if mode == 3:
-        angle = angle+angle_inc if (angle+angle_inc) < 360.0 else (360.0-angle+angle_inc)
+    rotation(spin_axis[mode], angle_speed*dt)
 
-    glut.glutPostRedisplay()
+    return True
 
 
 ## Init vertex data.
@@ -302,7 +314,6 @@ def main():
     glut.glutReshapeFunc(reshape)
     glut.glutDisplayFunc(display)
     glut.glutKeyboardFunc(keyboard)
-    glut.glutIdleFunc(idle)
 
     glut.glutMainLoop()
 
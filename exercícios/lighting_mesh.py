@@ -8,6 +8,10 @@ import OpenGL.GLUT as glut
 import utils as ut
 
 sys.path.append('../lib/')
+import objloader as ol
+import normals as nm
+import shader as sh
+import uniformblock as ub
 
 from ctypes import c_void_p
 
@@ -45,6 +49,10 @@ z_max = sys.float_info.min
 
 ## Variável do programa
 program = None
+## Bloco de uniforms da câmera
+camera = None
+## Bloco de uniforms da luz
+lights = None
 ## Vertex Array Object
 VAO = None
 ## Vertex Buffer Object
@@ -57,8 +65,12 @@ layout (location = 0) in vec3 position;
 layout (location = 1) in vec3 normal;
 
 uniform mat4 transform;
-uniform mat4 view;
-uniform mat4 projection;
+layout (std140, row_major) uniform Camera
+{
+    mat4 view;
+    mat4 projection;
+    vec3 cameraPosition;
+};
 
 out vec3 vNormal;
 out vec3 fragPosition;
@@ -80,9 +92,17 @@ in vec3 fragPosition;
 out vec4 fragColor;
 
 uniform vec3 objectColor;
-uniform vec3 lightColor;
-uniform vec3 lightPosition;
-uniform vec3 cameraPosition;
+layout (std140) uniform Lights
+{
+    vec3 lightPosition;
+    vec3 lightColor;
+};
+layout (std140, row_major) uniform Camera
+{
+    mat4 view;
+    mat4 projection;
+    vec3 cameraPosition;
+};
 
 void main()
 {
@@ -117,13 +137,12 @@ def display():
     gl.glClearColor(0.2, 0.3, 0.3, 1.0)
     gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
 
-    gl.glUseProgram(program)
+    program.use()
     gl.glBindVertexArray(VAO)
 
     # Aplicação da matriz de transformações
     # print("Matriz de transforamação:\n", M)
-    loc = gl.glGetUniformLocation(program, "transform")
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, M.transpose())
+    program.set("transform", M)
 
     # Definição da visão
     # z_near = z_min + (y_max-y_min)/np.tan(fovy)
@@ -139,25 +158,22 @@ def display():
     #gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, projection.transpose())
 
     view = ut.matTranslate(0.0, 0.0, -5.0)
-    loc = gl.glGetUniformLocation(program, "view")
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, view.transpose())
+    camera["view"] = view
     
     projection = ut.matPerspective(np.radians(45.0), win_width/win_height, 0.1, 100.0)
-    loc = gl.glGetUniformLocation(program, "projection")
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, projection.transpose())
+    camera["projection"] = projection
 
     # Object color.
-    loc = gl.glGetUniformLocation(program, "objectColor")
-    gl.glUniform3f(loc, 0.5, 0.1, 0.1)
+    program.set("objectColor", (0.5, 0.1, 0.1))
     # Light color.
-    loc = gl.glGetUniformLocation(program, "lightColor")
-    gl.glUniform3f(loc, 1.0, 1.0, 1.0)
+    lights["lightColor"] = (1.0, 1.0, 1.0)
     # Light position.
-    loc = gl.glGetUniformLocation(program, "lightPosition")
-    gl.glUniform3f(loc, 1.0, 2.0, 2.0)
+    lights["lightPosition"] = (1.0, 2.0, 2.0)
     # Camera position.
-    loc = gl.glGetUniformLocation(program, "cameraPosition")
-    gl.glUniform3f(loc, 0.0, 0.0, 0.0)
+    camera["cameraPosition"] = (0.0, 0.0, 0.0)
+    # Blocos de câmera e luz (enviados só se mudaram)
+    camera.update()
+    lights.update()
 
 
     gl.glDrawElements(gl.GL_TRIANGLES, num_element_vertices, gl.GL_UNSIGNED_INT, None)
@@ -306,7 +322,6 @@ def rotate(axis, angle=10.0):
 
 def load_obj():
     obj_name = sys.argv[1]
-    obj_file = open(obj_name)
     print("Input argument:", obj_name)
 
     global vertices
@@ -322,64 +337,24 @@ def load_obj():
     global y_max
     global z_max
 
-    # Lista temporária para salvar as faces
-    faces_list = list()
-
-    # For que itera nas linha do arquivo
-    for line in obj_file:
-        # Caso a linha descreva um vértice
-        if line[:2] == "v ":
-            # Cada coordenada de vértice é separada e adicionada ao array de vértices
-            v_values = line[1:].split()
-            vertices = np.append(vertices, np.asarray(v_values, dtype='float32'))
-
-            # Validamos se algumas das coordenadas é um ponto mais extremo do objeto
-            if float(v_values[0]) > x_max:
-                x_max = float(v_values[0])
-            if float(v_values[0]) < x_min:
-                x_min = float(v_values[0])
-            if float(v_values[1]) > y_max:
-                y_max = float(v_values[1])
-            if float(v_values[1]) < y_min:
-                y_min = float(v_values[1])
-            if float(v_values[2]) > z_max:
-                z_max = float(v_values[2])
-            if float(v_values[2]) < z_min:
-                z_min = float(v_values[2])
-
-        # Caso a linha descreva uma face
-        elif line[:2] == 'f ':
-            # Cada valor de face é separado
-            f_values = line[1:].split()
-
-            for v in f_values:
-                if '/' in v: # Caso hajam mais valores do que apenas o índice da coordenada
-                    v_index  = v.split('/')[0] # Separamos o valor da coordenada
-                    # v_color  = v.split('/')[1]
-                    # v_normal = v.split('/')[2]
-            
-                    # Atribuimos o valor da coordenada da face à lista de faces
-                    if v_index:
-                        faces = faces_list.append(int(v_index)-1)
-                    # if vt:
-                    #     np.append(int(vt))
-                    # if v_normal:
-                    #     np.append(int(vn))
-                else: faces_list.append(int(v)-1)
-
-    # Atribuímos a lista de faces para o array no formato int
-    faces = np.asarray(faces_list, dtype='uint32')
+    # O arquivo é lido em blocos e convertido direto para arrays numpy
+    # (sem np.append por vértice, que copiava o array inteiro a cada linha)
+    mesh = ol.loadObj(obj_name)
+    faces = mesh.corners[:, 0].astype('uint32')
+
+    # Uma normal por posição, ponderada pela área das faces vizinhas
+    # (as faces indexam só as posições, então as vn do arquivo não servem)
+    normals, _ = nm.smoothNormals(mesh.positions, faces)
+    vertices = np.hstack([mesh.positions, normals]).astype('float32').ravel()
+
+    x_min, y_min, z_min = mesh.bounds_min.tolist()
+    x_max, y_max, z_max = mesh.bounds_max.tolist()
 
     # As coordenadas de centro recebem o ponto médio dos mínimos e máximos do objeto em cada eixo
-    obj_center = [(x_max+x_min)/2, (y_max+y_min)/2, (z_max+z_min)/2]
+    obj_center = mesh.center().tolist()
 
     num_element_vertices = len(faces)
 
-    # print("Vertices:\n", vertices)
-    # print("Faces:\n", faces)
-    # print("Número de vértices", num_element_vertices)
-    # print("Coordenadas do centro do objeto", obj_center)
-
 
 
 def initData():
@@ -416,9 +391,11 @@ def initData():
     gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, EBO)
     gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, faces.nbytes, faces, gl.GL_STATIC_DRAW)
     
-    # Set attributes.
-    gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
+    # Set attributes (posição e normal intercaladas)
+    gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 24, None)
     gl.glEnableVertexAttribArray(0)
+    gl.glVertexAttribPointer(1, 3, gl.GL_FLOAT, gl.GL_FALSE, 24, c_void_p(12))
+    gl.glEnableVertexAttribArray(1)
 
     gl.glEnable(gl.GL_DEPTH_TEST)
     gl.glDepthFunc(gl.GL_LESS)
@@ -429,8 +406,12 @@ def initData():
 
 
 def initShaders():
-    global program
-    program = ut.createShaderProgram(vertex_code, fragment_code)
+    global program, camera, lights
+    program = sh.ShaderProgram(vertex_code, fragment_code)
+    camera = ub.cameraBlock()
+    lights = ub.lightBlock()
+    camera.bind(program)
+    lights.bind(program)
 
 
 def main():
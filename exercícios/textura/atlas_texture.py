@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+## @file atlas_texture.py
+#  Draws a grid of textured rectangles from a texture atlas.
+#
+#  Every image (the ones given on the command line, or the images of
+#  exercícios/textura/images and trabalho2) is packed in an atlas, and each
+#  rectangle has its texture coordinates remapped to its image. The whole
+#  grid is drawn with one texture bind and one draw call per atlas page. The
+#  polygon mode can be changed using keys:
+#  1 wireframe;
+#  2 polygon.
+#
+# @author Mateus Raganhan Figênio
+
+
+import os
+import sys
+import glob
+import numpy as np
+import OpenGL.GL as gl
+import OpenGL.GLUT as glut
+sys.path.append('../lib/')
+import utils as ut
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../lib'))
+import atlas as at
+
+from ctypes import c_void_p
+
+
+## Window width.
+win_width  = 800
+## Window height.
+win_height = 600
+
+## Program variable.
+program = None
+## Vertex array object.
+VAO = None
+## Vertex buffer object.
+VBO = None
+## Texture of each atlas page.
+textures = list()
+## First vertex and vertex count of the rectangles of each page.
+page_ranges = list()
+
+## Vertex shader.
+vertex_code = """
+#version 330 core
+layout (location = 0) in vec3 aPos;
+layout (location = 2) in vec2 aTexCoord;
+
+out vec2 TexCoord;
+
+void main()
+{
+    gl_Position = vec4(aPos, 1.0);
+    TexCoord = aTexCoord;
+}
+"""
+
+## Fragment shader.
+fragment_code = """
+#version 330 core
+out vec4 FragColor;
+
+in vec2 TexCoord;
+
+uniform sampler2D ourTexture;
+
+void main()
+{
+    FragColor = texture(ourTexture, TexCoord);
+}
+"""
+
+## Drawing function.
+#
+# Draws primitive.
+def display():
+
+    gl.glClearColor(0.2, 0.3, 0.3, 1.0)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+
+    gl.glUseProgram(program)
+    gl.glBindVertexArray(VAO)
+    for texture, (first, count) in zip(textures, page_ranges):
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+        gl.glDrawArrays(gl.GL_TRIANGLES, first, count)
+
+    glut.glutSwapBuffers()
+
+
+## Reshape function.
+#
+# Called when window is resized.
+#
+# @param width New window width.
+# @param height New window height.
+def reshape(width,height):
+
+    win_width = width
+    win_height = height
+    gl.glViewport(0, 0, win_width, win_height)
+    glut.glutPostRedisplay()
+
+
+## Keyboard function.
+#
+# Called to treat pressed keys.
+#
+# @param key Pressed key.
+# @param x Mouse x coordinate when key pressed.
+# @param y Mouse y coordinate when key pressed.
+def keyboard(key, x, y):
+
+    if key == b'\x1b'or key == b'q':
+        sys.exit( )
+    if key == b'1':
+        gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_LINE)
+    if key == b'2':
+        gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_FILL)
+
+    glut.glutPostRedisplay()
+
+
+## Image names.
+#
+# @return The images given on the command line, or the images of this
+# folder and of trabalho2.
+def imageNames():
+    if len(sys.argv) > 1:
+        return sys.argv[1:]
+    here = os.path.dirname(os.path.abspath(__file__))
+    return sorted(glob.glob(os.path.join(here, 'images', '*.jpg'))) + \
+           sorted(glob.glob(os.path.join(here, '../../trabalho2', '*.jpg')))
+
+
+## Init vertex data.
+#
+# Packs the images in an atlas and builds one rectangle per image, grouped by
+# atlas page.
+def initData():
+
+    # Uses vertex arrays.
+    global VAO, VBO, textures, page_ranges
+
+    atlas = at.loadAtlas(imageNames())
+    print('Atlas: %d images in %d pages (%s)' % (atlas.size(), len(atlas.pages),
+                                                 ', '.join('%dx%d' % p.shape[1::-1] for p in atlas.pages)))
+
+    # Grid of rectangles in normalized device coordinates
+    n = atlas.size()
+    cols = int(np.ceil(np.sqrt(n)))
+    rows = int(np.ceil(n / cols))
+    cell = np.array([2.0 / cols, 2.0 / rows])
+    corners = np.array([[0, 0], [1, 0], [1, 1], [0, 0], [1, 1], [0, 1]], dtype='float64')
+
+    vertices = list()
+    for i in range(n):
+        origin = np.array([-1.0 + (i % cols) * cell[0], 1.0 - (i // cols + 1) * cell[1]])
+        positions = origin + (0.05 + 0.9 * corners) * cell
+        uv = atlas.remapUV(corners, i)
+        vertices.append(np.hstack([positions, np.zeros((6, 1)), uv]))
+
+    # Rectangles sorted by page, so each page is a single draw
+    order = np.argsort(atlas.page, kind='stable')
+    vertices = np.vstack([vertices[i] for i in order]).astype('float32')
+    counts = np.bincount(atlas.page, minlength=len(atlas.pages)) * 6
+    page_ranges = list(zip((np.cumsum(counts) - counts).tolist(), counts.tolist()))
+
+    # Vertex array.
+    VAO = gl.glGenVertexArrays(1)
+    gl.glBindVertexArray(VAO)
+
+    # Vertex buffer
+    VBO = gl.glGenBuffers(1)
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, VBO)
+    gl.glBufferData(gl.GL_ARRAY_BUFFER, vertices.nbytes, vertices, gl.GL_STATIC_DRAW)
+
+    # Uma textura por página do atlas
+    textures = atlas.createTextures()
+
+    # Set attributes.
+    # VERTEX
+    gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 5 * vertices.itemsize, None)
+    gl.glEnableVertexAttribArray(0)
+    # TEXTURE
+    gl.glVertexAttribPointer(2, 2, gl.GL_FLOAT, gl.GL_FALSE, 5 * vertices.itemsize, c_void_p(3*vertices.itemsize))
+    gl.glEnableVertexAttribArray(2)
+
+    # Unbind Vertex Array Object.
+    gl.glBindVertexArray(0)
+
+## Create program (shaders).
+#
+# Compile shaders and create programs.
+def initShaders():
+
+    global program
+
+    program = ut.createShaderProgram(vertex_code, fragment_code)
+
+
+## Main function.
+#
+# Init GLUT and the window settings. Also, defines the callback functions used in the program.
+def main():
+
+    glut.glutInit()
+    glut.glutInitContextVersion(3, 3)
+    glut.glutInitContextProfile(glut.GLUT_CORE_PROFILE)
+    glut.glutInitDisplayMode(glut.GLUT_DOUBLE | glut.GLUT_RGBA)
+    glut.glutInitWindowSize(win_width,win_height)
+    glut.glutCreateWindow('Atlas')
+
+    # Init vertex data for the rectangles.
+    initData()
+
+    # Create shaders.
+    initShaders()
+
+    glut.glutReshapeFunc(reshape)
+    glut.glutDisplayFunc(display)
+    glut.glutKeyboardFunc(keyboard)
+
+    glut.glutMainLoop()
+
+if __name__ == '__main__':
+    main()
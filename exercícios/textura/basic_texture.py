@@ -10,6 +10,7 @@
 # @author Mateus Raganhan Figênio
 
 
+import os
 import sys
 import ctypes
 import numpy as np
@@ -17,9 +18,12 @@ import OpenGL.GL as gl
 import OpenGL.GLUT as glut
 sys.path.append('../lib/')
 import utils as ut
+# A imagem é aberta a partir da raiz do repositório, então lib/ é achada
+# pelo caminho deste arquivo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../lib'))
+import texture as tx
 
 from ctypes import c_void_p
-from PIL import Image
 
 
 ## Window width.
@@ -128,9 +132,9 @@ def initData():
     global VAO
     global VBO
 
-    img = Image.open('exercícios/textura/images/wall.jpg')
-    print('opened file: size=', img.size, 'format=', img.format)
-    imageData = np.array(list(img.getdata()), np.uint8)
+    # Pixels com a linha de baixo primeiro, como o OpenGL espera
+    imageData = tx.loadImage('exercícios/textura/images/wall.jpg')
+    print('opened file: size=', imageData.shape[1::-1], 'channels=', imageData.shape[2])
 
     # Set vertices.
     vertices = np.array([
@@ -163,9 +167,8 @@ def initData():
     gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
     gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
 
-    gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGB, img.size[0], img.size[1], 0, gl.GL_RGB, gl.GL_UNSIGNED_BYTE, imageData) # Carrega a imagem na textura
+    tx.upload(imageData) # Carrega a imagem na textura
     gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
-    img.close() # Libera a imagem da memória
 
     # Set attributes.
     # VERTEX
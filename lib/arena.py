@@ -0,0 +1,217 @@
+## @file arena.py
+# Mesh arena.
+#
+# Suballocates many meshes from one vertex buffer and one index buffer with a
+# shared layout (float32 position and normal), behind a single vertex array
+# object. Each mesh keeps its indices relative to its first vertex and is
+# drawn with a base vertex, so a frame binds the arena once and draws any set
+# of its meshes with one glMultiDrawElementsBaseVertex call. Copies of a mesh
+# share its range and differ only by a model matrix, sent as a per-instance
+# attribute: all the copies of a mesh are one instanced draw.
+#
+# @author Mateus Raganhan Figênio
+
+import ctypes
+import numpy as np
+import OpenGL.GL as gl
+
+import objloader as ol
+import meshcache as mc
+import normals as nm
+import vertexcache as vc
+import vertexformat as vf
+import culling as cl
+
+## Floats per vertex: position and normal.
+VERTEX_SIZE = 6
+## Attribute location of the per-instance model matrix (a mat4 attribute
+## takes this location and the next three).
+MODEL_LOCATION = 3
+
+
+## Mesh arrays.
+#
+# Builds the arena layout of a mesh: indexed vertices with normals (generated
+# when the file has none), in vertex cache order.
+#
+# @param mesh objloader.Mesh.
+# @return Tuple (float32 vertices (n, 6), uint32 indices).
+def meshArrays(mesh):
+    if not mesh.hasNormals():
+        mesh = nm.generateNormals(mesh)
+    vertices, indices = ol.indexedArrays(mesh, normals=True)
+    vertices = vertices.reshape(-1, VERTEX_SIZE)
+    remap, indices, _, _ = vc.optimize(indices, len(vertices))
+    return vertices[remap], indices.astype('uint32')
+
+
+## Load OBJ.
+#
+# Reads an .obj file in the arena layout, through the mesh cache.
+#
+# @param obj_name Path of the .obj file.
+# @return Tuple (float32 vertices (n, 6), uint32 indices).
+def loadObj(obj_name):
+    def build(name):
+        vertices, indices = meshArrays(ol.loadObj(name))
+        return {'vertices': vertices, 'indices': indices}, {}
+    versions = {'normals': nm.NORMALS_VERSION, 'vertexcache': vc.VCACHE_VERSION}
+    arrays, _ = mc.loadCached(obj_name, 'arena', build, versions)
+    return arrays['vertices'], arrays['indices']
+
+
+## Mesh arena.
+#
+# Meshes are numbered in the order they are added. The vertex and index
+# buffers grow like GrowableArray: the GPU buffers are reallocated only when
+# the capacity of the CPU arrays grows, and otherwise only the meshes added
+# since the last upload are sent.
+class MeshArena:
+
+    ## Constructor.
+    #
+    # @param vertex_capacity Initial number of vertices.
+    # @param index_capacity Initial number of indices.
+    def __init__(self, vertex_capacity=1 << 16, index_capacity=1 << 18):
+        self.vertices = ol.GrowableArray(VERTEX_SIZE, 'float32', capacity=vertex_capacity)
+        self.indices  = ol.GrowableArray(1, 'uint32', capacity=index_capacity)
+        ## Base vertex, first index and index count of each mesh.
+        self.ranges   = ol.GrowableArray(3, 'int64', capacity=64)
+        ## AABB (lo, hi) and bounding sphere (center, radius) of each mesh.
+        self.volumes  = ol.GrowableArray(10, 'float64', capacity=64)
+        self.names    = list()
+
+        self.vao = None
+        self.vbo = None
+        self.ebo = None
+        ## Buffer of the model matrices of the instances drawn.
+        self.models = None
+        # Bytes allocated on the GPU and rows already uploaded, per buffer
+        self.allocated = [0, 0]
+        self.uploaded  = [0, 0]
+
+    ## Number of meshes.
+    def size(self):
+        return len(self.names)
+
+    ## Add.
+    #
+    # @param name Name of the mesh.
+    # @param vertices float array (n, 6) of positions and normals.
+    # @param indices Triangle index array, relative to the first vertex.
+    # @return Number of the mesh.
+    def add(self, name, vertices, indices):
+        vertices = np.asarray(vertices, dtype='float32').reshape(-1, VERTEX_SIZE)
+        lo, hi, center, radius = cl.bounds(vertices[:, :3])
+        self.ranges.extend([[self.vertices.size, self.indices.size, len(indices)]])
+        self.volumes.extend([np.concatenate([lo, hi, center, [radius]])])
+        self.vertices.extend(vertices)
+        self.indices.extend(np.asarray(indices, dtype='uint32').reshape(-1, 1))
+        self.names.append(name)
+        return len(self.names) - 1
+
+    ## Bounds.
+    #
+    # @return Tuple (lo, hi, center, radius) of arrays over the meshes, as
+    # taken by culling.visible.
+    def bounds(self):
+        v = self.volumes.data[:self.volumes.size]
+        return v[:, 0:3], v[:, 3:6], v[:, 6:9], v[:, 9]
+
+    def _sync(self, target, buf, array, k):
+        data = array.data
+        row = data.shape[1] * data.itemsize
+        gl.glBindBuffer(target, buf)
+        if self.allocated[k] < data.nbytes:
+            gl.glBufferData(target, data.nbytes, None, gl.GL_STATIC_DRAW)
+            self.allocated[k] = data.nbytes
+            self.uploaded[k] = 0
+        start, end = self.uploaded[k], array.size
+        if end > start:
+            gl.glBufferSubData(target, start*row, (end - start)*row, data[start:end])
+        self.uploaded[k] = end
+
+    ## Upload.
+    #
+    # Creates the vertex array object and buffers on the first call, and
+    # sends the meshes added since the previous call.
+    def upload(self):
+        if self.vao is None:
+            self.vao = gl.glGenVertexArrays(1)
+            self.vbo = gl.glGenBuffers(1)
+            self.ebo = gl.glGenBuffers(1)
+            self.models = gl.glGenBuffers(1)
+
+        gl.glBindVertexArray(self.vao)
+        self._sync(gl.GL_ARRAY_BUFFER, self.vbo, self.vertices, 0)
+        self._sync(gl.GL_ELEMENT_ARRAY_BUFFER, self.ebo, self.indices, 1)
+
+        stride, attribs = vf.attributes('float', True)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        for location, size, gl_type, normalized, offset in attribs:
+            gl.glEnableVertexAttribArray(location)
+            gl.glVertexAttribPointer(location, size, gl_type, normalized, stride, ctypes.c_void_p(offset))
+        gl.glBindVertexArray(0)
+
+    ## Bind the vertex array object of the arena.
+    def bind(self):
+        gl.glBindVertexArray(self.vao)
+
+    ## Draw.
+    #
+    # Draws one mesh. The arena must be bound.
+    #
+    # @param i Number of the mesh.
+    def draw(self, i):
+        base, first, count = self.ranges.data[i].tolist()
+        gl.glDrawElementsBaseVertex(gl.GL_TRIANGLES, count, gl.GL_UNSIGNED_INT, ctypes.c_void_p(4*first), base)
+
+    ## Draw many.
+    #
+    # Draws a set of meshes with a single call. The arena must be bound.
+    #
+    # @param ids Numbers of the meshes.
+    def drawMany(self, ids):
+        ids = np.asarray(ids, dtype='int64')
+        if len(ids) == 0:
+            return
+        r = self.ranges.data[ids]
+        counts = r[:, 2].astype('int32')
+        bases = r[:, 0].astype('int32')
+        offsets = (ctypes.c_void_p * len(ids))(*(4*r[:, 1]).tolist())
+        gl.glMultiDrawElementsBaseVertex(gl.GL_TRIANGLES, counts, gl.GL_UNSIGNED_INT, offsets, len(ids), bases)
+
+    ## Draw instances.
+    #
+    # Draws copies of meshes, each with its own model matrix, read by the
+    # vertex shader as a mat4 attribute at MODEL_LOCATION. The copies of each
+    # mesh are drawn with a single instanced call. The arena must be bound.
+    #
+    # @param ids Number of the mesh of each copy, int array (k,).
+    # @param models Model matrix of each copy, float array (k, 4, 4), as built
+    # by utils.
+    def drawInstances(self, ids, models):
+        ids = np.asarray(ids, dtype='int64')
+        if len(ids) == 0:
+            return
+        order = np.argsort(ids, kind='stable')
+        meshes, starts, counts = np.unique(ids[order], return_index=True, return_counts=True)
+
+        # The four vec4 of a mat4 attribute are its columns, so the row-major
+        # matrices of utils are stored transposed
+        data = np.ascontiguousarray(np.asarray(models, dtype='float32')[order].transpose(0, 2, 1))
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.models)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, data.nbytes, data, gl.GL_STREAM_DRAW)
+        for column in range(4):
+            gl.glEnableVertexAttribArray(MODEL_LOCATION + column)
+            gl.glVertexAttribDivisor(MODEL_LOCATION + column, 1)
+
+        # Without base instance (GL 4.2), each mesh points the attribute at
+        # its first copy
+        for i, start, n in zip(meshes.tolist(), starts.tolist(), counts.tolist()):
+            for column in range(4):
+                gl.glVertexAttribPointer(MODEL_LOCATION + column, 4, gl.GL_FLOAT, gl.GL_FALSE, 64,
+                                         ctypes.c_void_p(64*start + 16*column))
+            base, first, count = self.ranges.data[i].tolist()
+            gl.glDrawElementsInstancedBaseVertex(gl.GL_TRIANGLES, count, gl.GL_UNSIGNED_INT,
+                                                 ctypes.c_void_p(4*first), n, base)
@@ -0,0 +1,71 @@
+## @file asyncload.py
+# Background asset loading.
+#
+# Runs the CPU side of asset loading (file parsing, image decoding) on worker
+# threads, while the GL thread keeps handling window events. The GL thread
+# polls the loader and runs the upload callback of each asset once its data
+# is ready, since GL calls must stay on the thread that owns the context.
+#
+# @author Mateus Raganhan Figênio
+
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+## Asset loader.
+#
+# Thread pool of asset loads with callbacks run on the polling thread.
+class AssetLoader:
+
+    ## Constructor.
+    #
+    # @param workers Number of worker threads.
+    def __init__(self, workers=2):
+        self.workers  = workers
+        # Created on demand and shut down whenever nothing is pending
+        self.executor = None
+        self.pending  = list()
+        self.start    = time.perf_counter()
+        ## Seconds from the creation of the loader to each asset being ready.
+        self.times    = dict()
+
+    ## Submit.
+    #
+    # Starts loading an asset on a worker thread.
+    #
+    # @param name Name of the asset, used in reports.
+    # @param on_ready Function called by poll() with the result of load, on
+    # the polling thread.
+    # @param load Function run on the worker thread.
+    # @param args Arguments of load.
+    def submit(self, name, on_ready, load, *args):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.pending.append((name, on_ready, self.executor.submit(load, *args)))
+
+    ## Poll.
+    #
+    # Runs the callbacks of the assets that finished loading. Exceptions raised
+    # by a load are raised here.
+    #
+    # @return Number of callbacks run.
+    def poll(self):
+        done = [p for p in self.pending if p[2].done()]
+        for p in done:
+            self.pending.remove(p)
+            name, on_ready, future = p
+            on_ready(future.result())
+            self.times[name] = time.perf_counter() - self.start
+        if not self.pending and self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        return len(done)
+
+    ## Whether every submitted asset was loaded and its callback run.
+    def finished(self):
+        return not self.pending
+
+    ## Seconds since the loader was created.
+    def elapsed(self):
+        return time.perf_counter() - self.start
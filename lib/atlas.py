@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+## @file atlas.py
+# Texture atlases.
+#
+# Packs many images into a few large textures (pages), so that a scene that
+# uses all of them binds a single texture per page. Each image is surrounded
+# by a margin filled with copies of its edge texels, so bilinear filtering
+# and the first mipmap levels never mix in a neighbouring image, and the
+# texture coordinates of a mesh are remapped into the rectangle of its image.
+#
+# Atlases are built at load time with loadAtlas, or offline with
+#
+#   python3 atlas.py out_prefix image1 image2 ... [--size N] [--padding P]
+#
+# which writes the pages as <out_prefix><page>.png and the rectangles as
+# <out_prefix>.json, read back with readAtlas.
+#
+# @author Mateus Raganhan Figênio
+
+import os
+import sys
+import json
+import numpy as np
+import OpenGL.GL as gl
+
+from PIL import Image
+
+import texture as tx
+
+## Largest width and height of a page.
+MAX_ATLAS_SIZE = 4096
+## Margin, in texels, around each image.
+ATLAS_PADDING = 8
+
+
+## Alignment.
+#
+# Largest power of two not above the padding. Rectangles start and end at
+# multiples of it, so the margin survives log2(alignment) mipmap levels.
+#
+# @param padding Margin in texels.
+# @return The alignment.
+def alignment(padding):
+    return 1 << max(int(padding).bit_length() - 1, 0)
+
+
+def _shelves(boxes, width, max_size):
+    page = np.zeros(len(boxes), dtype='int64')
+    pos = np.zeros((len(boxes), 2), dtype='int64')
+    # Shelves of each page as [y, height, next free x]
+    pages = list()
+    for i in np.argsort(-boxes[:, 1], kind='stable'):
+        w, h = boxes[i]
+        placed = False
+        for p, shelves in enumerate(pages):
+            for shelf in shelves:
+                if h <= shelf[1] and shelf[2] + w <= width:
+                    page[i], pos[i] = p, (shelf[2], shelf[0])
+                    shelf[2] += w
+                    placed = True
+                    break
+            if not placed and shelves[-1][0] + shelves[-1][1] + h <= max_size:
+                y = shelves[-1][0] + shelves[-1][1]
+                shelves.append([y, h, w])
+                page[i], pos[i] = p, (0, y)
+                placed = True
+            if placed:
+                break
+        if not placed:
+            pages.append([[0, h, w]])
+            page[i], pos[i] = len(pages) - 1, (0, 0)
+
+    page_sizes = [(width, s[-1][0] + s[-1][1]) for s in pages]
+    return page, pos, page_sizes
+
+
+## Pack rectangles.
+#
+# Shelf packing: the rectangles are placed by decreasing height, left to
+# right on horizontal shelves, in the first page and shelf with room. Every
+# power of two page width is tried, and the packing with the least total page
+# area is kept. Pages are as tall as their shelves (heights are multiples of
+# the alignment, not powers of two).
+#
+# @param sizes int array (n, 2) of (width, height) of the images.
+# @param max_size Largest width and height of a page.
+# @param padding Margin around each image.
+# @return Tuple (int array (n,) of pages, int array (n, 2) of the (x, y)
+# position of each image, list of (width, height) of the pages).
+def packRects(sizes, max_size=MAX_ATLAS_SIZE, padding=ATLAS_PADDING):
+    sizes = np.asarray(sizes, dtype='int64').reshape(-1, 2)
+    if len(sizes) == 0:
+        return np.zeros(0, dtype='int64'), np.zeros((0, 2), dtype='int64'), []
+    align = alignment(padding)
+    boxes = -(-(sizes + 2*padding) // align) * align
+    if boxes.max() > max_size:
+        raise ValueError('Image larger than the %d texels of an atlas page' % max_size)
+
+    best = None
+    width = 1 << int(np.ceil(np.log2(boxes[:, 0].max())))
+    while width <= max_size:
+        packing = _shelves(boxes, width, max_size)
+        area = sum(w * h for w, h in packing[2])
+        if best is None or area < best[0]:
+            best = (area, packing)
+        width *= 2
+    page, pos, page_sizes = best[1]
+    return page, pos + padding, page_sizes
+
+
+def _channels(pixels, channels):
+    c = pixels.shape[2]
+    if c == channels:
+        return pixels
+    if c == 1:
+        pixels = np.repeat(pixels, 3, axis=2)
+    if channels == 4:
+        alpha = np.full(pixels.shape[:2] + (1,), 255, dtype=np.uint8)
+        return np.concatenate([pixels[:, :, :3], alpha], axis=2)
+    return pixels[:, :, :3]
+
+
+## Texture atlas.
+#
+# Pages of packed images and the rectangle of each image. Rows are bottom
+# first, as loaded by texture.loadImage, so y grows with the v coordinate.
+class Atlas:
+
+    ## Constructor.
+    #
+    # @param pages List of uint8 arrays (height, width, channels).
+    # @param page int array (n,) with the page of each image.
+    # @param rects int array (n, 4) of (x, y, width, height) of each image.
+    # @param names List of the image names.
+    # @param padding Margin around each image.
+    def __init__(self, pages, page, rects, names, padding=ATLAS_PADDING):
+        self.pages   = pages
+        self.page    = np.asarray(page, dtype='int64')
+        self.rects   = np.asarray(rects, dtype='int64').reshape(-1, 4)
+        self.names   = list(names)
+        self.padding = padding
+
+    ## Number of images.
+    def size(self):
+        return len(self.names)
+
+    ## Index of an image by name.
+    def index(self, name):
+        return self.names.index(name)
+
+    ## Largest mipmap level that keeps the images apart.
+    def maxLevel(self):
+        return alignment(self.padding).bit_length() - 1
+
+    ## UV rectangle.
+    #
+    # @param i Index of the image.
+    # @return float array (u0, v0, u1, v1) of the image in its page.
+    def uvRect(self, i):
+        x, y, w, h = self.rects[i]
+        height, width = self.pages[self.page[i]].shape[:2]
+        return np.array([x / width, y / height, (x + w) / width, (y + h) / height])
+
+    ## Remap UV.
+    #
+    # Maps texture coordinates of an image into its rectangle of the atlas.
+    # An atlas cannot repeat an image, so coordinates outside [0, 1] are
+    # clamped.
+    #
+    # @param uv float array (n, 2) of coordinates in the image.
+    # @param i Index (or name) of the image.
+    # @return float32 array (n, 2) of coordinates in the page of the image.
+    def remapUV(self, uv, i):
+        if not isinstance(i, (int, np.integer)):
+            i = self.index(i)
+        u0, v0, u1, v1 = self.uvRect(i)
+        uv = np.clip(np.asarray(uv, dtype='float64'), 0.0, 1.0)
+        return (uv * [u1 - u0, v1 - v0] + [u0, v0]).astype('float32')
+
+    ## Create textures.
+    #
+    # Uploads the pages with mipmaps limited to maxLevel().
+    #
+    # @return List of texture objects, one per page.
+    def createTextures(self):
+        textures = list()
+        for pixels in self.pages:
+            texture = tx.createTexture(pixels, wrap=gl.GL_CLAMP_TO_EDGE, mipmap=True)
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAX_LEVEL, self.maxLevel())
+            textures.append(texture)
+        return textures
+
+
+## Build atlas.
+#
+# @param images List of uint8 arrays (height, width, channels).
+# @param names List of the image names (default: their indices).
+# @param max_size Largest width and height of a page.
+# @param padding Margin around each image.
+# @return Atlas.
+def buildAtlas(images, names=None, max_size=MAX_ATLAS_SIZE, padding=ATLAS_PADDING):
+    if names is None:
+        names = [str(i) for i in range(len(images))]
+    sizes = np.array([[p.shape[1], p.shape[0]] for p in images], dtype='int64').reshape(-1, 2)
+    page, pos, page_sizes = packRects(sizes, max_size, padding)
+
+    channels = max([3] + [p.shape[2] for p in images])
+    pages = [np.zeros((h, w, channels), dtype=np.uint8) for w, h in page_sizes]
+    for i, pixels in enumerate(images):
+        # The image with its margin filled by its edge texels
+        padded = np.pad(_channels(pixels, channels), ((padding, padding), (padding, padding), (0, 0)), mode='edge')
+        x, y = pos[i] - padding
+        pages[page[i]][y:y + padded.shape[0], x:x + padded.shape[1]] = padded
+    return Atlas(pages, page, np.hstack([pos, sizes]), names, padding)
+
+
+## Load atlas.
+#
+# Decodes image files, on decode threads, and packs them.
+#
+# @param file_names Paths of the images, also used as their names.
+# @param max_size Largest width and height of a page.
+# @param padding Margin around each image.
+# @param workers Number of decode threads.
+# @return Atlas.
+def loadAtlas(file_names, max_size=MAX_ATLAS_SIZE, padding=ATLAS_PADDING, workers=tx.DECODE_WORKERS):
+    images = dict(tx.loadImages(file_names, workers))
+    return buildAtlas([images[f] for f in file_names], file_names, max_size, padding)
+
+
+## Save atlas.
+#
+# @param atlas Atlas.
+# @param prefix Prefix of the page images and of the JSON description.
+def saveAtlas(atlas, prefix):
+    files = list()
+    for p, pixels in enumerate(atlas.pages):
+        files.append('%s%d.png' % (prefix, p))
+        mode = {1: 'L', 3: 'RGB', 4: 'RGBA'}[pixels.shape[2]]
+        Image.fromarray(pixels[::-1].squeeze(), mode).save(files[-1])
+    with open(prefix + '.json', 'w') as f:
+        json.dump({'pages': [os.path.basename(n) for n in files], 'padding': atlas.padding,
+                   'names': atlas.names, 'page': atlas.page.tolist(), 'rects': atlas.rects.tolist()}, f, indent=1)
+
+
+## Read atlas.
+#
+# @param json_name Path of the JSON description written by saveAtlas.
+# @return Atlas.
+def readAtlas(json_name):
+    with open(json_name) as f:
+        desc = json.load(f)
+    folder = os.path.dirname(json_name)
+    pages = [tx.loadImage(os.path.join(folder, n)) for n in desc['pages']]
+    return Atlas(pages, desc['page'], desc['rects'], desc['names'], desc['padding'])
+
+
+def main():
+    args = sys.argv[1:]
+    options = {'--size': MAX_ATLAS_SIZE, '--padding': ATLAS_PADDING}
+    for name in options:
+        if name in args:
+            i = args.index(name)
+            options[name] = int(args[i + 1])
+            del args[i:i + 2]
+    if len(args) < 2:
+        print('Usage: python3 atlas.py out_prefix image1 image2 ... [--size N] [--padding P]')
+        sys.exit(1)
+
+    atlas = loadAtlas(args[1:], options['--size'], options['--padding'])
+    saveAtlas(atlas, args[0])
+    used = float(np.prod(atlas.rects[:, 2:], axis=1).sum())
+    total = float(sum(p.shape[0] * p.shape[1] for p in atlas.pages))
+    print('%d images in %d pages (%s), %.0f%% of the texels used' % (
+        atlas.size(), len(atlas.pages), ', '.join('%dx%d' % p.shape[1::-1] for p in atlas.pages), 100.0*used/total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+## @file bench_bvh.py
+# BVH benchmark.
+#
+# Builds the BVH of teapot.obj and cow.obj (trabalho2) and times a batch of
+# random rays aimed at each mesh, against the brute force test of every ray
+# with every triangle. Both must find the same hits.
+#
+# Usage: python3 bench_bvh.py [--rays N]
+#
+# @author Mateus Raganhan Figênio
+
+import os
+import sys
+import time
+import numpy as np
+import objloader as ol
+import bvh
+
+## Meshes timed, relative to the repository root.
+MESHES = ['trabalho2/teapot.obj', 'trabalho2/cow.obj']
+## Rays of the brute force test (it is much slower).
+BRUTE_RAYS = 200
+
+
+## Random rays.
+#
+# Rays from a sphere around the mesh towards points near its center.
+#
+# @param mesh Mesh.
+# @param n Number of rays.
+# @return Tuple (origins, directions).
+def randomRays(mesh, n):
+    rng = np.random.default_rng(0)
+    center = mesh.center()
+    size = np.linalg.norm(mesh.bounds_max - mesh.bounds_min)
+    origins = center + rng.normal(size=(n, 3)) * size
+    directions = center + rng.normal(size=(n, 3)) * size / 5.0 - origins
+    return origins, directions
+
+
+def bruteForce(mesh, origins, directions):
+    tris = mesh.corners[:, 0].reshape(-1, 3)
+    p = mesh.positions.astype('float64')
+    v0 = p[tris[:, 0]]
+    e1, e2 = p[tris[:, 1]] - v0, p[tris[:, 2]] - v0
+    return np.array([bvh.rayTriangle(np.broadcast_to(o, v0.shape), np.broadcast_to(d, v0.shape), v0, e1, e2).min()
+                     for o, d in zip(origins, directions)])
+
+
+def main():
+    rays = 10000
+    if '--rays' in sys.argv:
+        rays = int(sys.argv[sys.argv.index('--rays') + 1])
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    print('%-12s %10s %8s %10s %12s %12s' % ('mesh', 'triangles', 'nodes', 'build ms', 'bvh us/ray', 'brute us/ray'))
+    for name in MESHES:
+        mesh = ol.loadObj(os.path.join(root, name))
+
+        start = time.perf_counter()
+        tree = bvh.BVH(mesh.positions, mesh.corners[:, 0])
+        build = time.perf_counter() - start
+
+        origins, directions = randomRays(mesh, rays)
+        start = time.perf_counter()
+        t, _ = tree.intersect(origins, directions)
+        query = (time.perf_counter() - start) / rays
+
+        start = time.perf_counter()
+        brute = bruteForce(mesh, origins[:BRUTE_RAYS], directions[:BRUTE_RAYS])
+        brute_query = (time.perf_counter() - start) / BRUTE_RAYS
+        assert np.allclose(t[:BRUTE_RAYS], brute)
+
+        print('%-12s %10d %8d %10.2f %12.2f %12.2f' % (os.path.basename(name), len(mesh.corners) // 3, tree.size(),
+                                                      1e3*build, 1e6*query, 1e6*brute_query))
+
+
+if __name__ == '__main__':
+    main()
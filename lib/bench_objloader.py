@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+## @file bench_objloader.py
+# OBJ loader benchmark.
+#
+# Times objloader.loadObj on cube.obj and on synthetic grid meshes from a
+# thousand up to a million vertices. The time per vertex should stay about
+# the same across sizes (linear scaling). The smooth normals of each mesh are
+# also timed, with one normal per vertex and with a crease angle. With
+# --legacy, the old loader that grew the vertex array with np.append is also
+# timed on the smaller meshes.
+#
+# Usage: python3 bench_objloader.py [--legacy] [--processes N]
+#
+# @author Mateus Raganhan Figênio
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import objloader as ol
+import normals as nm
+
+## Vertex counts of the synthetic meshes.
+SIZES = [1000, 10000, 100000, 1000000]
+## Largest mesh timed with the legacy loader.
+LEGACY_MAX = 100000
+## Crease angle of the timed normals, in degrees.
+CREASE_ANGLE = 30
+
+
+## Grid OBJ.
+#
+# Writes a grid of n x n vertices, two triangles per cell.
+#
+# @param file_name Path of the file.
+# @param n Number of vertices per side.
+def writeGrid(file_name, n):
+    y, x = np.mgrid[0:n, 0:n].astype('float32') / max(n - 1, 1)
+    z = np.sin(4*x) * np.cos(4*y)
+    v = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+
+    i = np.arange(n*n).reshape(n, n)[:-1, :-1].ravel() + 1
+    f = np.concatenate([np.stack([i, i + 1, i + n], axis=1),
+                        np.stack([i + 1, i + n + 1, i + n], axis=1)])
+
+    with open(file_name, 'w') as out:
+        np.savetxt(out, v, fmt='v %.6f %.6f %.6f')
+        np.savetxt(out, f, fmt='f %d %d %d')
+
+
+## Legacy load.
+#
+# The loader formerly used by exercícios/lighting_mesh.py, which appended
+# each vertex with np.append (a copy of the whole array per line).
+def legacyLoad(file_name):
+    vertices = np.array([], dtype='float32')
+    faces = list()
+    with open(file_name) as f:
+        for line in f:
+            if line[:2] == 'v ':
+                vertices = np.append(vertices, np.asarray(line[1:].split(), dtype='float32'))
+            elif line[:2] == 'f ':
+                faces.extend(int(v.split('/')[0]) - 1 for v in line[1:].split())
+    return vertices, np.asarray(faces, dtype='uint32')
+
+
+def _time(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    legacy = '--legacy' in sys.argv
+    processes = 1
+    if '--processes' in sys.argv:
+        processes = int(sys.argv[sys.argv.index('--processes') + 1])
+
+    cube = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'exercícios', 'cube.obj')
+    files = [('cube.obj', cube, 8)]
+
+    tmp = tempfile.mkdtemp()
+    for size in SIZES:
+        n = int(round(np.sqrt(size)))
+        name = os.path.join(tmp, 'grid%d.obj' % (n*n))
+        writeGrid(name, n)
+        files.append(('grid %dx%d' % (n, n), name, n*n))
+
+    print('%-14s %10s %10s %12s %12s %12s %12s' % ('mesh', 'vertices', 'MB', 'loadObj ms', 'us/vertex',
+                                                   'normals ms', 'crease ms'))
+    for label, name, nv in files:
+        mesh, t = _timed(ol.loadObj, name, ol.BLOCK_SIZE, None, processes)
+        indices = mesh.corners[:, 0]
+        smooth = _time(nm.smoothNormals, mesh.positions, indices)
+        crease = _time(nm.smoothNormals, mesh.positions, indices, CREASE_ANGLE)
+        line = '%-14s %10d %10.2f %12.2f %12.3f %12.2f %12.2f' % (label, nv, os.path.getsize(name) / 2**20,
+                                                             1e3*t, 1e6*t/nv, 1e3*smooth, 1e3*crease)
+        if legacy and nv <= LEGACY_MAX:
+            line += '   legacy %.2f ms' % (1e3*_time(legacyLoad, name))
+        print(line)
+
+    for _, name, _ in files[1:]:
+        os.remove(name)
+    os.rmdir(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+## @file bench_texture.py
+# Texture decode benchmark.
+#
+# Decodes every jpg of trabalho2 with texture.loadImages on 1, 2, 4 and 8
+# threads, and reports the time to the first ready image, the total time and
+# the speedup over a single thread. The speedup is bounded by the number of
+# CPUs of the machine.
+#
+# Usage: python3 bench_texture.py [--repeat N]
+#
+# @author Mateus Raganhan Figênio
+
+import os
+import sys
+import glob
+import time
+import texture as tx
+
+from PIL import Image
+
+## Thread counts timed.
+WORKERS = [1, 2, 4, 8]
+
+
+def main():
+    repeat = 3
+    if '--repeat' in sys.argv:
+        repeat = int(sys.argv[sys.argv.index('--repeat') + 1])
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    names = sorted(glob.glob(os.path.join(root, 'trabalho2', '*.jpg')))
+    megapixels = sum(Image.open(n).size[0] * Image.open(n).size[1] for n in names) / 1e6
+    print('%d images, %.1f megapixels, %d CPUs' % (len(names), megapixels, os.cpu_count()))
+    print('%8s %12s %10s %10s' % ('threads', 'first ms', 'total ms', 'speedup'))
+
+    base = None
+    for workers in WORKERS:
+        first = total = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ready = None
+            for _name, _pixels in tx.loadImages(names, workers):
+                if ready is None:
+                    ready = time.perf_counter() - start
+            first = min(first, ready)
+            total = min(total, time.perf_counter() - start)
+        base = base or total
+        print('%8d %12.1f %10.1f %10.2f' % (workers, 1e3*first, 1e3*total, base / total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+## @file bvh.py
+# Bounding volume hierarchy.
+#
+# Builds a BVH of axis aligned boxes over the triangles of an indexed mesh,
+# with the binned surface area heuristic (SAH), and answers batches of ray
+# queries with the Möller–Trumbore ray-triangle test. The tree is kept in flat
+# arrays and both the build and the traversal go one tree level at a time,
+# processing every node (or every ray-node pair) of the level with NumPy
+# calls.
+#
+# @author Mateus Raganhan Figênio
+
+import numpy as np
+
+## Largest number of triangles in a leaf.
+LEAF_SIZE = 4
+## Number of bins of the SAH split search.
+BINS = 16
+## Smallest determinant of a ray-triangle test (ray parallel to the triangle).
+EPSILON = 1e-12
+
+
+## Ranges.
+#
+# @param starts int array of range starts.
+# @param counts int array of range lengths.
+# @return Tuple (concatenation of the ranges, number of the range of each
+# element).
+def _ranges(starts, counts):
+    total = int(counts.sum())
+    offsets = np.cumsum(counts) - counts
+    owner = np.repeat(np.arange(len(counts)), counts)
+    return np.arange(total) - offsets[owner] + starts[owner], owner
+
+
+def _area(lo, hi):
+    d = np.maximum(hi - lo, 0.0)
+    return d[..., 0]*d[..., 1] + d[..., 1]*d[..., 2] + d[..., 2]*d[..., 0]
+
+
+## Ray-triangle intersection.
+#
+# Möller–Trumbore test of each ray against the triangle on the same row. Both
+# faces of the triangles are hit.
+#
+# @param o Ray origins, float array (n, 3).
+# @param d Ray directions, float array (n, 3).
+# @param v0 First vertex of each triangle, float array (n, 3).
+# @param e1 Edge v1 - v0 of each triangle, float array (n, 3).
+# @param e2 Edge v2 - v0 of each triangle, float array (n, 3).
+# @return float64 array (n,) with the ray parameter of the hit, inf on a miss.
+def rayTriangle(o, d, v0, e1, e2):
+    p = np.cross(d, e2)
+    det = np.einsum('ij,ij->i', e1, p)
+    ok = np.abs(det) > EPSILON
+    inv = 1.0 / np.where(ok, det, 1.0)
+
+    s = o - v0
+    u = np.einsum('ij,ij->i', s, p) * inv
+    q = np.cross(s, e1)
+    v = np.einsum('ij,ij->i', d, q) * inv
+    t = np.einsum('ij,ij->i', e2, q) * inv
+
+    hit = ok & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t >= 0.0)
+    return np.where(hit, t, np.inf)
+
+
+## Bounding volume hierarchy.
+#
+# Node i has the box (lo[i], hi[i]). Internal nodes have their children at
+# child[i] and child[i] + 1; leaves have child[i] == -1 and own the triangles
+# start[i] to start[i] + count[i] - 1 of the BVH order (tri maps them back to
+# the triangles of the index array).
+class BVH:
+
+    ## Constructor.
+    #
+    # @param positions float array (n, 3).
+    # @param indices Triangle index array.
+    # @param leaf_size Largest number of triangles in a leaf.
+    # @param bins Number of bins of the SAH split search.
+    def __init__(self, positions, indices, leaf_size=LEAF_SIZE, bins=BINS):
+        tris = indices.reshape(-1, 3).astype('int64')
+        p = positions.astype('float32')
+        a, b, c = p[tris[:, 0]], p[tris[:, 1]], p[tris[:, 2]]
+        tri_lo = np.minimum(np.minimum(a, b), c)
+        tri_hi = np.maximum(np.maximum(a, b), c)
+
+        # Box and centroid of each triangle, gathered together in each level
+        boxes = np.hstack([tri_lo, tri_hi, (tri_lo + tri_hi) / 2.0])
+
+        m = len(tris)
+        order = np.arange(m)
+        nodes = list()
+        level_start = np.zeros(1 if m else 0, dtype='int64')
+        level_count = np.full(len(level_start), m, dtype='int64')
+        next_id = len(level_start)
+
+        while len(level_start):
+            k = len(level_start)
+            nbins = int(min(bins, max(2, level_count.max())))
+            sel, owner = _ranges(level_start, level_count)
+            offsets = np.cumsum(level_count) - level_count
+            prims = order[sel]
+
+            box = boxes[prims]
+            c_lo = np.minimum.reduceat(box[:, 6:], offsets)
+            c_hi = np.maximum.reduceat(box[:, 6:], offsets)
+
+            # Splits along the longest axis of the centroid box; nodes whose
+            # centroids all coincide are cut in half
+            axis = np.argmax(c_hi - c_lo, axis=1)
+            extent = (c_hi - c_lo)[np.arange(k), axis]
+            inner = level_count > leaf_size
+            binned = inner & (extent > 0.0)
+
+            # Bin of each triangle. Sorting the ranges by bin groups the bins
+            # for their boxes and also partitions the ranges for any split
+            scale = nbins / np.where(extent > 0.0, extent, 1.0)
+            x = box[np.arange(len(prims)), 6 + axis[owner]] - c_lo[owner, axis[owner]]
+            slot = np.minimum((x * scale[owner]).astype('int64'), nbins - 1)
+            key = owner*nbins + slot
+            perm = np.argsort(key, kind='stable')
+            key = key[perm]
+            order[sel] = prims[perm]
+
+            box = box[perm]
+            first = np.flatnonzero(np.concatenate([[True], key[1:] != key[:-1]]))
+            b_lo = np.full((k*nbins, 3), np.inf, dtype='float32')
+            b_hi = np.full((k*nbins, 3), -np.inf, dtype='float32')
+            b_lo[key[first]] = np.minimum.reduceat(box[:, :3], first)
+            b_hi[key[first]] = np.maximum.reduceat(box[:, 3:6], first)
+            b_lo = b_lo.reshape(k, nbins, 3)
+            b_hi = b_hi.reshape(k, nbins, 3)
+            lo = b_lo.min(axis=1)
+            hi = b_hi.max(axis=1)
+
+            # SAH cost of the split after each bin
+            n_left = np.cumsum(np.bincount(key, minlength=k*nbins).reshape(k, nbins), axis=1)[:, :-1]
+            a_left = _area(np.minimum.accumulate(b_lo, axis=1), np.maximum.accumulate(b_hi, axis=1))[:, :-1]
+            a_right = _area(np.minimum.accumulate(b_lo[:, ::-1], axis=1),
+                            np.maximum.accumulate(b_hi[:, ::-1], axis=1))[:, ::-1][:, 1:]
+            cost = a_left*n_left + a_right*(level_count[:, None] - n_left)
+            split = np.argmin(cost, axis=1)
+            left_count = np.where(binned, n_left[np.arange(k), split], level_count // 2)
+
+            child = np.full(k, -1, dtype='int64')
+            child[inner] = next_id + 2*np.arange(int(inner.sum()))
+            next_id += 2*int(inner.sum())
+            nodes.append((lo, hi, child, level_start, level_count))
+
+            s, n, l = level_start[inner], level_count[inner], left_count[inner]
+            level_start = np.stack([s, s + l], axis=1).ravel()
+            level_count = np.stack([l, n - l], axis=1).ravel()
+
+        if nodes:
+            self.lo, self.hi, self.child, self.start, self.count = [np.concatenate(x) for x in zip(*nodes)]
+        else:
+            self.lo = self.hi = np.zeros((0, 3))
+            self.child = self.start = self.count = np.zeros(0, dtype='int64')
+
+        ## Triangle of the index array at each position of the BVH order.
+        self.tri = order
+        p = positions.astype('float64')
+        a, b, c = p[tris[order, 0]], p[tris[order, 1]], p[tris[order, 2]]
+        self.v0, self.e1, self.e2 = a, b - a, c - a
+
+    ## Number of nodes.
+    def size(self):
+        return len(self.child)
+
+    ## Intersect.
+    #
+    # Finds the closest triangle hit by each ray. All the rays go down the
+    # tree together: each step tests every pending (ray, node) pair against
+    # its box, drops the pairs that miss or start beyond the closest hit so
+    # far, tests the triangles of the leaves and replaces the other nodes by
+    # their children.
+    #
+    # @param origins Ray origins, float array (n, 3) or (3,).
+    # @param directions Ray directions, float array (n, 3) or (3,).
+    # @param t_max Largest ray parameter of a hit.
+    # @return Tuple (t, triangle) of float64 and int64 arrays (n,): the ray
+    # parameter of the closest hit and its triangle, or (inf, -1) on a miss.
+    def intersect(self, origins, directions, t_max=np.inf):
+        o = np.atleast_2d(np.asarray(origins, dtype='float64'))
+        d = np.atleast_2d(np.asarray(directions, dtype='float64'))
+        n = len(o)
+        inv = 1.0 / np.where(np.abs(d) > 1e-30, d, 1e-30)
+
+        best_t = np.full(n, float(t_max))
+        best = np.full(n, -1, dtype='int64')
+        ray = np.arange(n) if self.size() else np.zeros(0, dtype='int64')
+        node = np.zeros(len(ray), dtype='int64')
+
+        while len(ray):
+            # Slab test of the boxes
+            t0 = (self.lo[node] - o[ray]) * inv[ray]
+            t1 = (self.hi[node] - o[ray]) * inv[ray]
+            near = np.minimum(t0, t1).max(axis=1)
+            far = np.maximum(t0, t1).min(axis=1)
+            keep = (near <= far) & (far >= 0.0) & (near <= best_t[ray])
+            ray, node = ray[keep], node[keep]
+
+            leaf = self.child[node] < 0
+            if leaf.any():
+                r, l = ray[leaf], node[leaf]
+                prims, owner = _ranges(self.start[l], self.count[l])
+                r = r[owner]
+                t = rayTriangle(o[r], d[r], self.v0[prims], self.e1[prims], self.e2[prims])
+                np.minimum.at(best_t, r, t)
+                closest = (t == best_t[r]) & np.isfinite(t)
+                best[r[closest]] = self.tri[prims[closest]]
+
+            ray, node = ray[~leaf], self.child[node[~leaf]]
+            ray = np.concatenate([ray, ray])
+            node = np.concatenate([node, node + 1])
+
+        best_t[best < 0] = np.inf
+        return best_t, best
+
+    ## Pick.
+    #
+    # @param origin Ray origin (3,).
+    # @param direction Ray direction (3,).
+    # @return Tuple (t, triangle) of the closest hit, (inf, -1) on a miss.
+    def pick(self, origin, direction):
+        t, tri = self.intersect(origin, direction)
+        return float(t[0]), int(tri[0])
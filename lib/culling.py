@@ -0,0 +1,104 @@
+## @file culling.py
+# View-frustum culling.
+#
+# Each object carries a bounding sphere and an axis aligned bounding box
+# (AABB) in object space. The six frustum planes are extracted from the
+# projection * view * model matrix of each object (Gribb and Hartmann, "Fast
+# Extraction of Viewing Frustum Planes from the World-View-Projection
+# Matrix", 2001), so they come out in object space and the bounds never need
+# to be transformed. All the objects of a frame are tested with a few NumPy
+# calls.
+#
+# @author Mateus Raganhan Figênio
+
+import numpy as np
+
+# Rows of the clip matrix combined into each plane: left, right, bottom, top,
+# near and far are row 3 plus or minus rows 0, 1 and 2
+_SIGN = np.array([1, -1, 1, -1, 1, -1], dtype='float64')
+_ROW = np.array([0, 0, 1, 1, 2, 2])
+
+
+## Bounds.
+#
+# @param positions float array (n, 3).
+# @return Tuple (lo, hi, center, radius): the AABB corners, and a bounding
+# sphere centered on the AABB.
+def bounds(positions):
+    p = np.asarray(positions, dtype='float64').reshape(-1, 3)
+    if len(p) == 0:
+        return np.zeros(3), np.zeros(3), np.zeros(3), 0.0
+    lo, hi = p.min(axis=0), p.max(axis=0)
+    center = (lo + hi) / 2.0
+    radius = float(np.sqrt(np.max(np.sum((p - center)**2, axis=1))))
+    return lo, hi, center, radius
+
+
+## Frustum planes.
+#
+# @param clip Projection * view * model matrices, float array (k, 4, 4) or
+# (4, 4), in the column vector convention of utils.py.
+# @return float64 array (k, 6, 4) of planes (a, b, c, d), normalized so that
+# a*x + b*y + c*z + d is the signed distance to the plane, positive inside.
+def frustumPlanes(clip):
+    m = np.asarray(clip, dtype='float64').reshape(-1, 4, 4)
+    planes = m[:, 3:4, :] + _SIGN[None, :, None] * m[:, _ROW, :]
+    length = np.linalg.norm(planes[:, :, :3], axis=2, keepdims=True)
+    return planes / np.where(length > 0.0, length, 1.0)
+
+
+## Visible.
+#
+# Tests the bounding sphere and then the AABB of each object against its
+# frustum. Objects that only partly intersect the frustum are visible.
+#
+# @param clip Projection * view * model matrices, float array (k, 4, 4).
+# @param lo AABB minimum corners, float array (k, 3).
+# @param hi AABB maximum corners, float array (k, 3).
+# @param center Sphere centers, float array (k, 3).
+# @param radius Sphere radii, float array (k,).
+# @return Boolean array (k,).
+def visible(clip, lo, hi, center, radius):
+    planes = frustumPlanes(clip)
+    n, d = planes[:, :, :3], planes[:, :, 3]
+    lo = np.asarray(lo, dtype='float64').reshape(-1, 1, 3)
+    hi = np.asarray(hi, dtype='float64').reshape(-1, 1, 3)
+    center = np.asarray(center, dtype='float64').reshape(-1, 1, 3)
+    radius = np.asarray(radius, dtype='float64').reshape(-1, 1)
+
+    sphere = np.all(np.sum(n * center, axis=2) + d >= -radius, axis=1)
+
+    # The box is outside a plane when its corner farthest along the plane
+    # normal is outside
+    corner = np.where(n > 0.0, hi, lo)
+    box = np.all(np.sum(n * corner, axis=2) + d >= 0.0, axis=1)
+    return sphere & box
+
+
+## Cull statistics.
+#
+# Counts the objects drawn and culled in the last frame and in total.
+class CullStats:
+
+    ## Constructor.
+    def __init__(self):
+        self.drawn  = 0
+        self.culled = 0
+        self.total_drawn  = 0
+        self.total_culled = 0
+
+    ## Update.
+    #
+    # @param mask Visibility of the objects of the frame, from visible().
+    # @return Whether the counts changed from the previous frame.
+    def update(self, mask):
+        drawn = int(np.count_nonzero(mask))
+        culled = len(mask) - drawn
+        changed = (drawn, culled) != (self.drawn, self.culled)
+        self.drawn, self.culled = drawn, culled
+        self.total_drawn  += drawn
+        self.total_culled += culled
+        return changed
+
+    def __str__(self):
+        return 'drawn %d, culled %d' % (self.drawn, self.culled)
@@ -0,0 +1,284 @@
+## @file hotreload.py
+# Hot reload of .obj files.
+#
+# Watches an .obj file for changes, reparses only the blocks of the file that
+# an edit touched, and keeps a CPU copy of GPU buffers so that a rebuilt
+# vertex or index array is sent as the byte ranges that differ from the
+# resident data. The buffer is reallocated only when the data outgrows it.
+#
+# @author Mateus Raganhan Figênio
+
+import io
+import os
+import numpy as np
+import OpenGL.GL as gl
+
+import objloader as ol
+
+## Size, in bytes, of the blocks reparsed independently.
+RELOAD_BLOCK_SIZE = 1 << 16
+## Changed byte ranges closer than this are uploaded as one range.
+MERGE_GAP = 4096
+
+
+## File watcher.
+#
+# Polls the modification time and size of a file. A change is reported once
+# the file stayed the same for two polls, so a file still being written is
+# not read.
+class FileWatcher:
+
+    ## Constructor.
+    #
+    # @param file_name Path of the file.
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.stamp = self._stamp()
+        self.seen  = self.stamp
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.file_name)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    ## Whether the file changed since the last reported change.
+    def changed(self):
+        stamp = self._stamp()
+        stable = stamp == self.seen
+        self.seen = stamp
+        if stamp is None or stamp == self.stamp or not stable:
+            return False
+        self.stamp = stamp
+        return True
+
+
+def _advance(offsets, arrays):
+    return tuple(o + len(a) for o, a in zip(offsets, arrays[:3]))
+
+
+## Incremental OBJ.
+#
+# Keeps the contents of an .obj file and the arrays parsed from each of its
+# blocks. On reload, the blocks inside the bytes shared with the previous
+# contents (common prefix and suffix) are reused, and only the bytes between
+# them are parsed again. A suffix block is reused only if the number of
+# elements defined before it did not change, since relative face indices
+# depend on it.
+class IncrementalObj:
+
+    ## Constructor.
+    #
+    # Parses the whole file.
+    #
+    # @param obj_name Path of the .obj file.
+    # @param block_size Size of the blocks reparsed independently.
+    def __init__(self, obj_name, block_size=RELOAD_BLOCK_SIZE):
+        self.obj_name   = obj_name
+        self.block_size = block_size
+        self.data       = b''
+        ## Blocks as (start, end, offsets, arrays).
+        self.blocks     = list()
+        ## Bytes parsed by the last load.
+        self.parsed     = 0
+        self.mesh       = self.load()
+
+    def _parse(self, data, start, end, offsets, out):
+        for block in ol.readBlocks(io.BytesIO(data[start:end]), self.block_size):
+            arrays = ol.parseBlock(block, offsets)
+            stop = min(start + len(block), end)
+            out.append((start, stop, offsets, arrays))
+            self.parsed += stop - start
+            offsets = _advance(offsets, arrays)
+            start = stop
+        return offsets
+
+    ## Load.
+    #
+    # Reads the file again and updates the parsed blocks.
+    #
+    # @return objloader.Mesh.
+    def load(self):
+        with open(self.obj_name, 'rb') as f:
+            new = f.read()
+        old = self.data
+        n = min(len(old), len(new))
+
+        # Common prefix and suffix of the old and new contents
+        a = np.frombuffer(old, dtype=np.uint8)
+        b = np.frombuffer(new, dtype=np.uint8)
+        diff = np.flatnonzero(a[:n] != b[:n])
+        prefix = int(diff[0]) if len(diff) else n
+        diff = np.flatnonzero(a[len(a) - n:] != b[len(b) - n:])
+        suffix = min(n - 1 - int(diff[-1]) if len(diff) else n, n - prefix)
+        delta = len(new) - len(old)
+
+        self.parsed = 0
+        blocks = list()
+        offsets = (0, 0, 0)
+        i = 0
+        while i < len(self.blocks) and self.blocks[i][1] <= prefix and old[self.blocks[i][1] - 1] == ord('\n'):
+            blocks.append(self.blocks[i])
+            offsets = _advance(offsets, self.blocks[i][3])
+            i += 1
+
+        # Suffix blocks must also keep the line break before them
+        j = i
+        while j < len(self.blocks) and self.blocks[j][0] <= len(old) - suffix:
+            j += 1
+        start = blocks[-1][1] if blocks else 0
+        end = self.blocks[j][0] + delta if j < len(self.blocks) else len(new)
+        offsets = self._parse(new, start, end, offsets, blocks)
+
+        for bs, be, bo, arrays in self.blocks[j:]:
+            if bo == offsets:
+                blocks.append((bs + delta, be + delta, bo, arrays))
+                offsets = _advance(offsets, arrays)
+            else:
+                offsets = self._parse(new, bs + delta, be + delta, offsets, blocks)
+
+        self.data = new
+        self.blocks = blocks
+        if not blocks:
+            return ol.Mesh(*ol._emptyArrays())
+        return ol.Mesh(*[np.concatenate(x) for x in zip(*[b[3] for b in blocks])])
+
+
+## Diff ranges.
+#
+# @param old Resident bytes, uint8 array.
+# @param new New bytes, uint8 array.
+# @param gap Ranges closer than this are merged.
+# @return List of (start, end) byte ranges of new that differ from old,
+# including any bytes past the end of old.
+def diffRanges(old, new, gap=MERGE_GAP):
+    n = min(len(old), len(new))
+    changed = np.flatnonzero(old[:n] != new[:n])
+    ranges = list()
+    if len(changed):
+        cut = np.flatnonzero(np.diff(changed) > gap)
+        starts = changed[np.concatenate([[0], cut + 1])]
+        ends = changed[np.concatenate([cut, [len(changed) - 1]])] + 1
+        ranges = list(zip(starts.tolist(), ends.tolist()))
+    if len(new) > n:
+        if ranges and n - ranges[-1][1] <= gap:
+            ranges[-1] = (ranges[-1][0], len(new))
+        else:
+            ranges.append((n, len(new)))
+    return ranges
+
+
+## Row hash.
+#
+# 64 bit hash of each row of an array, over its bytes.
+#
+# @param a Array (n, w).
+# @return uint64 array (n,).
+def rowHash(a):
+    words = np.ascontiguousarray(a).view(np.uint32).reshape(len(a), -1) if len(a) else np.zeros((0, 0), np.uint32)
+    h = np.zeros(len(a), dtype=np.uint64)
+    for w in words.T:
+        h = (h ^ w) * np.uint64(0x9E3779B97F4A7C15)
+        h ^= h >> np.uint64(32)
+    return h
+
+
+## Stable order.
+#
+# Orders rebuilt rows (vertices or triangles) so that the rows also present
+# in the resident array stay at the same positions, and the diff of the
+# buffer is only the rows that really changed. New rows take the positions
+# left free by removed ones; resident rows past the end of the new array move
+# into the remaining free positions. Rows are matched by a 64 bit hash: a
+# collision only costs an upload, any order is a valid one.
+#
+# @param old Resident rows, array (k, w).
+# @param new Rebuilt rows, array (n, w) of the same dtype.
+# @param old_alt Second key of the resident rows, (k, w2), tried for the rows
+#                the first key leaves unmatched (e.g. the indices of a
+#                triangle whose vertices changed).
+# @param new_alt Second key of the rebuilt rows, (n, w2).
+# @return int array (n,): row i of the ordered array is new[order[i]].
+def stableOrder(old, new, old_alt=None, new_alt=None):
+    n = len(new)
+    # Resident rows past the end of the new array cannot stay in place
+    slot = np.full(n, -1)
+    taken = np.zeros(n, dtype=bool)
+    _matchRows(rowHash(old[:n]), rowHash(new), slot, taken)
+    if old_alt is not None:
+        _matchRows(rowHash(old_alt[:n]), rowHash(new_alt), slot, taken)
+
+    slot[slot < 0] = np.flatnonzero(~taken)
+    order = np.empty(n, dtype=np.int64)
+    order[slot] = np.arange(n)
+    return order
+
+
+def _matchRows(old_h, new_h, slot, taken):
+    # Only the rebuilt rows still without a position and the resident
+    # positions still free take part
+    todo = np.flatnonzero(slot < 0)
+    free = np.flatnonzero(~taken[:len(old_h)])
+    if not len(todo) or not len(free):
+        return
+    old_h, new_h = old_h[free], new_h[todo]
+
+    # Searched in order of hash (much faster than in random order). The k-th
+    # copy of a repeated row takes the position of the k-th resident copy.
+    old_sort, new_sort = np.argsort(old_h), np.argsort(new_h)
+    sorted_h, wanted = old_h[old_sort], new_h[new_sort]
+    copy = np.arange(len(wanted)) - np.searchsorted(wanted, wanted)
+    found = np.searchsorted(sorted_h, wanted) + copy
+    match = found < len(sorted_h)
+    match[match] = sorted_h[found[match]] == wanted[match]
+    positions = free[old_sort[found[match]]]
+    slot[todo[new_sort[match]]] = positions
+    taken[positions] = True
+
+
+## Buffer mirror.
+#
+# CPU copy of the contents of a GL buffer. For element array buffers, the
+# vertex array object must be bound around update().
+class BufferMirror:
+
+    ## Growth factor of the allocation.
+    GROWTH = 1.5
+
+    ## Constructor.
+    #
+    # @param target Buffer target (GL_ARRAY_BUFFER, GL_ELEMENT_ARRAY_BUFFER).
+    # @param buf Buffer object, already holding data.
+    # @param data Array uploaded to the buffer.
+    # @param usage Usage hint of reallocations.
+    def __init__(self, target, buf, data, usage=gl.GL_STATIC_DRAW):
+        self.target    = target
+        self.buf       = buf
+        self.usage     = usage
+        self.data      = np.ascontiguousarray(data).view(np.uint8).ravel().copy()
+        self.allocated = self.data.nbytes
+
+    ## Update.
+    #
+    # Uploads the ranges of the array that differ from the resident data.
+    #
+    # @param data New contents of the buffer.
+    # @return Tuple (bytes uploaded, number of ranges, whether the buffer was
+    # reallocated).
+    def update(self, data):
+        new = np.ascontiguousarray(data).view(np.uint8).ravel()
+        gl.glBindBuffer(self.target, self.buf)
+
+        grown = new.nbytes > self.allocated
+        if grown:
+            self.allocated = max(new.nbytes, int(self.allocated * self.GROWTH))
+            gl.glBufferData(self.target, self.allocated, None, self.usage)
+            ranges = [(0, new.nbytes)]
+        else:
+            ranges = diffRanges(self.data, new)
+
+        for start, end in ranges:
+            gl.glBufferSubData(self.target, start, end - start, new[start:end])
+        self.data = new.copy()
+        return sum(e - s for s, e in ranges), len(ranges), grown
@@ -0,0 +1,153 @@
+## @file meshcache.py
+# Mesh cache functions.
+#
+# Keeps the arrays built from an .obj file in a binary sidecar file, so that
+# later runs map the arrays from disk instead of parsing the file again. The
+# cache entry is keyed by the hash of the .obj contents, the parser version,
+# the layout of the cached data and the versions of the modules that build
+# it, and is replaced whenever any of them changes.
+#
+# @author Mateus Raganhan Figênio
+
+import os
+import json
+import struct
+import hashlib
+import numpy as np
+import objloader as ol
+
+## Identifies mesh cache files.
+MAGIC = b'MESHCACHE\0'
+## Alignment, in bytes, of the arrays in the file.
+ALIGN = 64
+
+_HEADER_SIZE = struct.Struct('<I')
+
+
+## File hash.
+#
+# @param file_name Path of the file.
+# @return Hex digest of the contents of the file.
+def fileHash(file_name):
+    h = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(ol.BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+## Cache path.
+#
+# @param obj_name Path of the .obj file.
+# @param tag Name of the cached data layout.
+# @return Path of the sidecar cache file.
+def cachePath(obj_name, tag):
+    return '%s.%s.meshcache' % (obj_name, tag)
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+## Write cache.
+#
+# Writes the arrays and metadata to a cache file. The file is written to a
+# temporary name and then renamed, so a reader never sees a partial file.
+#
+# @param cache_name Path of the cache file.
+# @param key Dictionary identifying the cached data.
+# @param arrays Dictionary of NumPy arrays.
+# @param meta Dictionary of JSON serializable values.
+def writeCache(cache_name, key, arrays, meta):
+    layout = dict()
+    offset = 0
+    for name, a in arrays.items():
+        layout[name] = [a.dtype.str, list(a.shape), offset]
+        offset = _align(offset + a.nbytes)
+
+    header = json.dumps({'key': key, 'meta': meta, 'arrays': layout}).encode()
+    start = _align(len(MAGIC) + _HEADER_SIZE.size + len(header))
+
+    tmp_name = '%s.%d.tmp' % (cache_name, os.getpid())
+    with open(tmp_name, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_HEADER_SIZE.pack(len(header)))
+        f.write(header)
+        for name, a in arrays.items():
+            f.seek(start + layout[name][2])
+            f.write(np.ascontiguousarray(a).data)
+        f.truncate(start + offset)
+    os.replace(tmp_name, cache_name)
+
+
+## Read cache.
+#
+# Maps the arrays of a cache file. A file whose size does not match the
+# arrays of its header (truncated or corrupt) is treated as missing.
+#
+# @param cache_name Path of the cache file.
+# @param key Dictionary identifying the expected data.
+# @return Tuple (arrays, meta), or None if the file is missing, stale or
+# corrupt.
+def readCache(cache_name, key):
+    try:
+        with open(cache_name, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            size, = _HEADER_SIZE.unpack(f.read(_HEADER_SIZE.size))
+            header = json.loads(f.read(size).decode())
+            file_size = os.fstat(f.fileno()).st_size
+
+        if header.get('key') != key:
+            return None
+
+        # The writer aligns every array and truncates after the last one
+        start = _align(len(MAGIC) + _HEADER_SIZE.size + size)
+        layout = [(name, np.dtype(dtype), tuple(shape), offset)
+                  for name, (dtype, shape, offset) in header['arrays'].items()]
+        end = max([_align(offset + dtype.itemsize * int(np.prod(shape))) for _, dtype, shape, offset in layout],
+                  default=0)
+        if file_size != start + end:
+            return None
+
+        arrays = dict()
+        for name, dtype, shape, offset in layout:
+            if np.prod(shape) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(cache_name, dtype=dtype, mode='r', offset=start + offset, shape=shape)
+    except (OSError, ValueError, TypeError, KeyError, AttributeError, struct.error):
+        return None
+    return arrays, header['meta']
+
+
+## Cached load.
+#
+# Returns the data built from an .obj file, from its cache file when it is
+# up to date. Otherwise the stale entry is removed, the data is built and a
+# new entry is written.
+#
+# @param obj_name Path of the .obj file.
+# @param tag Name of the data layout, part of the cache key.
+# @param build Function of the .obj path that returns (arrays, meta).
+# @param versions Dictionary with the version of each module used by build
+# (normals.NORMALS_VERSION, vertexformat.FORMAT_VERSION...), part of the key.
+# @return Tuple (arrays, meta).
+def loadCached(obj_name, tag, build, versions=None):
+    cache_name = cachePath(obj_name, tag)
+    key = {'hash': fileHash(obj_name), 'version': ol.PARSER_VERSION, 'tag': tag, 'versions': versions or {}}
+
+    cached = readCache(cache_name, key)
+    if cached is not None:
+        print('Mesh cache hit:', cache_name)
+        return cached
+
+    arrays, meta = build(obj_name)
+    try:
+        if os.path.exists(cache_name):
+            print('Mesh cache stale, removing:', cache_name)
+            os.remove(cache_name)
+        writeCache(cache_name, key, arrays, meta)
+    except OSError as e:
+        print('Could not write mesh cache:', e)
+    return arrays, meta
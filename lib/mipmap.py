@@ -0,0 +1,128 @@
+## @file mipmap.py
+# Mipmap chains.
+#
+# Builds the full mip chain of an image on the CPU, each level resampled from
+# the previous one with a separable box or Lanczos filter, and keeps the
+# decoded levels in a sidecar cache file next to the image. Later runs map
+# the levels from the cache file and skip the image decode altogether.
+#
+# @author Mateus Raganhan Figênio
+
+import numpy as np
+
+import meshcache as mc
+import texture as tx
+
+## Version of the mip chain layout and filters, part of the cache key.
+MIP_VERSION = 1
+## Default filter.
+MIP_FILTER = 'lanczos'
+
+
+def _box(x):
+    return (np.abs(x) < 0.5).astype('float64') + 0.5 * (np.abs(x) == 0.5)
+
+
+def _lanczos3(x):
+    return np.where(np.abs(x) < 3.0, np.sinc(x) * np.sinc(x / 3.0), 0.0)
+
+
+## Filter kernel and radius of each filter name.
+FILTERS = {'box': (_box, 0.5), 'lanczos': (_lanczos3, 3.0)}
+
+
+## Weights.
+#
+# Taps of a resampling along one axis. The kernel is stretched by the
+# downsampling factor and the samples past the edges are clamped.
+#
+# @param n_in Number of input samples.
+# @param n_out Number of output samples.
+# @param name Filter name.
+# @return Tuple (int array (n_out, taps) of input indices, float32 array
+# (n_out, taps) of weights that add up to 1).
+def weights(n_in, n_out, name=MIP_FILTER):
+    kernel, radius = FILTERS[name]
+    scale = max(n_in / n_out, 1.0)
+    center = (np.arange(n_out) + 0.5) * (n_in / n_out) - 0.5
+    taps = int(np.ceil(2.0 * radius * scale)) + 1
+    idx = np.floor(center - radius * scale).astype('int64')[:, None] + np.arange(taps)
+    w = kernel((idx - center[:, None]) / scale)
+    w /= w.sum(axis=1, keepdims=True)
+    return np.clip(idx, 0, n_in - 1), w.astype('float32')
+
+
+def _resampleAxis(a, n_out, axis, name):
+    idx, w = weights(a.shape[axis], n_out, name)
+    shape = [1] * a.ndim
+    shape[axis] = n_out
+    out = np.zeros([n_out if i == axis else s for i, s in enumerate(a.shape)], dtype='float32')
+    for k in range(idx.shape[1]):
+        out += np.take(a, idx[:, k], axis=axis) * w[:, k].reshape(shape)
+    return out
+
+
+## Resample.
+#
+# @param pixels Array (height, width, channels).
+# @param height Output height.
+# @param width Output width.
+# @param name Filter name.
+# @return float32 array (height, width, channels).
+def resample(pixels, height, width, name=MIP_FILTER):
+    a = np.asarray(pixels, dtype='float32')
+    return _resampleAxis(_resampleAxis(a, height, 0, name), width, 1, name)
+
+
+## Mip chain.
+#
+# Halves each dimension (rounding down, at least 1) down to 1x1, as OpenGL
+# sizes the levels of a texture.
+#
+# @param pixels uint8 array (height, width, channels).
+# @param name Filter name.
+# @return List of uint8 arrays, level 0 first.
+def mipChain(pixels, name=MIP_FILTER):
+    levels = [np.ascontiguousarray(pixels)]
+    current = np.asarray(pixels, dtype='float32')
+    while current.shape[0] > 1 or current.shape[1] > 1:
+        height, width = max(current.shape[0] // 2, 1), max(current.shape[1] // 2, 1)
+        current = resample(current, height, width, name)
+        levels.append(np.clip(np.rint(current), 0, 255).astype('uint8'))
+    return levels
+
+
+## Cache path.
+#
+# @param image_name Path of the image.
+# @param name Filter name.
+# @return Path of the sidecar cache file.
+def cachePath(image_name, name=MIP_FILTER):
+    return '%s.%s.mipcache' % (image_name, name)
+
+
+## Load mipmaps.
+#
+# Returns the mip chain of an image (bottom row first, as loaded by
+# texture.loadImage), mapped from its cache file when it is up to date.
+# Otherwise the image is decoded, the chain is built and the cache file is
+# written.
+#
+# @param image_name Path of the image.
+# @param name Filter name.
+# @return List of uint8 arrays (height, width, channels), level 0 first.
+def loadMipmaps(image_name, name=MIP_FILTER):
+    cache_name = cachePath(image_name, name)
+    key = {'hash': mc.fileHash(image_name), 'version': MIP_VERSION, 'filter': name}
+
+    cached = mc.readCache(cache_name, key)
+    if cached is not None:
+        arrays, meta = cached
+        return [arrays['level%d' % i] for i in range(meta['levels'])]
+
+    levels = mipChain(tx.loadImage(image_name), name)
+    try:
+        mc.writeCache(cache_name, key, {'level%d' % i: a for i, a in enumerate(levels)}, {'levels': len(levels)})
+    except OSError as e:
+        print('Could not write mipmap cache:', e)
+    return levels
@@ -0,0 +1,185 @@
+## @file normals.py
+# Normal generation.
+#
+# Computes vertex normals for meshes whose OBJ file has no vn records. Each
+# vertex gets the sum of the normals of the faces around it, weighted by their
+# areas, gathered with np.bincount over the index array. With a crease angle,
+# the corners of a vertex are only averaged across edges where the faces meet
+# at less than that angle, so hard edges keep one normal per side.
+#
+# The crease angle costs a sort of the half edges by edge, on top of the plain
+# sum: measured with numpy on one core, 1M triangles take ~0.29 s without and
+# ~0.75 s with it, 2M triangles ~0.54 s and ~1.7 s (a grid folded every four
+# columns, so a quarter of the vertices are on hard edges). Only the corners
+# of vertices on hard or boundary edges go through the label propagation.
+#
+# @author Mateus Raganhan Figênio
+
+import numpy as np
+import objloader as ol
+
+## Version of the generated normals, part of the cache key of the meshes that
+## use them.
+NORMALS_VERSION = 2
+
+
+## Face normals.
+#
+# @param positions float array (n, 3).
+# @param tris int array (m, 3).
+# @return float64 array (m, 3) of face normals with length twice the area of
+# the face (area weighted).
+def faceNormals(positions, tris):
+    p = positions.astype('float64')
+    a, b, c = (np.take(p, tris[:, i], axis=0) for i in range(3))
+    return np.cross(b - a, c - a)
+
+
+def _normalize(v):
+    length = np.sqrt(np.einsum('ij,ij->i', v, v))[:, None]
+    return (v / np.where(length > 0.0, length, 1.0)).astype('float32')
+
+
+def _sum(label, face_n, n):
+    # One bincount per corner of the triangles and axis: no (3*m, 3) copy
+    # of the face normals
+    label = label.reshape(-1, 3)
+    corners = [np.ascontiguousarray(label[:, k]) for k in range(3)]
+    return np.stack([sum(np.bincount(c, axis, n) for c in corners) for axis in face_n.T.copy()], axis=1)
+
+
+def _sortedEdges(key):
+    # Sorting the key with the half edge packed in its low bits is faster
+    # than an argsort, when both fit in 63 bits. Either way, half edges of the
+    # same edge stay in order, so the faces paired across an edge of more
+    # than two faces do not depend on the sort.
+    bits = max(len(key) - 1, 1).bit_length()
+    if int(key.max(initial=0)) >= 1 << (63 - bits):
+        order = np.argsort(key, kind='stable')
+        return key[order], order.astype(np.int32)
+    key = (key << bits) | np.arange(len(key))
+    key.sort()
+    return key >> bits, (key & ((1 << bits) - 1)).astype(np.int32)
+
+
+## Smooth groups.
+#
+# Labels the triangle corners so that two corners of the same vertex share a
+# label when a chain of faces joined by smooth edges goes from one to the
+# other.
+#
+# @param tris int64 array (m, 3).
+# @param face_n Face normals, float array (m, 3).
+# @param crease_angle Angle, in degrees, from which an edge is hard.
+# @return int32 array (3*m,) with the group of each corner, one of the
+# corners of the group.
+def _groups(tris, face_n, crease_angle):
+    m = len(tris)
+
+    # Half edge e goes from corner e (at vertex a) to the next corner of the
+    # face (at b)
+    a = tris.ravel()
+    b = np.empty_like(tris)
+    b[:, :2] = tris[:, 1:]
+    b[:, 2] = tris[:, 0]
+    b = b.ravel()
+
+    # Faces across the same edge are next to each other once sorted by edge
+    n = int(tris.max()) + 1 if m else 0
+    key, order = _sortedEdges(np.minimum(a, b)*n + np.maximum(a, b))
+    pair = np.flatnonzero(key[1:] == key[:-1])
+    e1, e2 = order[pair], order[pair + 1]
+
+    # Smooth edges: the unit face normals differ by less than the crease angle
+    # (np.take gathers rows much faster than fancy indexing)
+    unit = _normalize(face_n)
+    cos = np.einsum('ij,ij->i', np.take(unit, e1 // 3, axis=0), np.take(unit, e2 // 3, axis=0))
+    smooth = cos >= np.cos(np.radians(crease_angle))
+
+    # A vertex whose edges all join two faces smoothly has one group: its
+    # corners take any one of them. Vertices on hard or boundary edges (where
+    # the fan can come apart) go through the propagation below.
+    lone = np.ones(len(order), dtype=bool)
+    lone[pair] = False
+    lone[pair + 1] = False
+    crease = np.concatenate([e1[~smooth], order[lone]])
+    hard = np.zeros(n, dtype=bool)
+    hard[a[crease]] = True
+    hard[b[crease]] = True
+    first = np.empty(n, dtype=np.int32)
+    first[a] = np.arange(3*m, dtype=np.int32)
+    label = first[a]
+    corners = np.flatnonzero(hard[a]).astype(np.int32)
+    if not len(corners):
+        return label
+
+    # Corners of both faces at each end of a smooth edge are joined (the half
+    # edges run in opposite directions on consistently oriented faces), only
+    # at vertices with hard edges
+    e1, e2 = e1[smooth], e2[smooth]
+    at_a, at_b = hard[a[e1]], hard[b[e1]]
+    near = at_a | at_b
+    e1, e2, at_a, at_b = e1[near], e2[near], at_a[near], at_b[near]
+    n1, n2 = e1 + 1 - 3*(e1 % 3 == 2), e2 + 1 - 3*(e2 % 3 == 2)
+    same = a[e1] == a[e2]
+    keep = np.concatenate([at_a, at_b])
+    j1 = np.concatenate([e1, n1])[keep]
+    j2 = np.concatenate([np.where(same, e2, n2), np.where(same, n2, e2)])[keep]
+
+    # Connected components over the corner pairs, numbered among the corners
+    # of those vertices: both corners of each pair take the lower label, then
+    # every label jumps to the label of its label, until the corners of every
+    # pair agree. The groups are arcs of the fan of a vertex, so a few passes
+    # settle each on its lowest corner.
+    local = np.empty(3*m, dtype=np.int32)
+    local[corners] = np.arange(len(corners), dtype=np.int32)
+    j1, j2 = local[j1], local[j2]
+    sub = np.arange(len(corners), dtype=np.int32)
+    while True:
+        l1, l2 = sub[j1], sub[j2]
+        if np.array_equal(l1, l2):
+            break
+        low = np.minimum(l1, l2)
+        np.minimum.at(sub, j1, low)
+        np.minimum.at(sub, j2, low)
+        sub = sub[sub]
+    label[corners] = corners[sub]
+    return label
+
+
+## Smooth normals.
+#
+# @param positions float array (n, 3).
+# @param indices Triangle index array into positions.
+# @param crease_angle Angle, in degrees, from which an edge is hard, or None
+# for one normal per position.
+# @return Tuple (float32 normals (k, 3), int array (len(indices),) with the
+# normal of each corner). Without crease angle, k == n and the normal of
+# each corner is the one of its position.
+def smoothNormals(positions, indices, crease_angle=None):
+    tris = indices.reshape(-1, 3).astype('int64')
+    face_n = faceNormals(positions, tris)
+
+    if crease_angle is None:
+        normals = _normalize(_sum(tris, face_n, len(positions)))
+        return normals, indices.copy()
+
+    # Each group is labeled by one of its corners, numbered in order
+    label = _groups(tris, face_n, crease_angle)
+    root = label == np.arange(len(label))
+    group = (np.cumsum(root) - 1)[label]
+    normals = _normalize(_sum(group, face_n, int(root.sum())))
+    return normals, group.astype('int32')
+
+
+## Generate normals.
+#
+# @param mesh objloader.Mesh.
+# @param crease_angle See smoothNormals.
+# @return Mesh with generated normals for every corner, the normals of the
+# file discarded.
+def generateNormals(mesh, crease_angle=None):
+    normals, corner_n = smoothNormals(mesh.positions, mesh.corners[:, 0], crease_angle)
+    corners = mesh.corners.copy()
+    corners[:, 2] = corner_n
+    return ol.Mesh(mesh.positions, mesh.texcoords, normals, corners)
@@ -0,0 +1,577 @@
+## @file objloader.py
+# OBJ loading functions.
+#
+# Parses Wavefront .obj files into NumPy arrays. The file is read in large
+# blocks and each record type (v, vt, vn and f) of a block is converted with
+# a handful of NumPy calls, without a Python loop over the lines.
+#
+# @author Mateus Raganhan Figênio
+
+import os
+import re
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+## Version of the parser, changed whenever its output changes.
+PARSER_VERSION = 1
+## Size, in bytes, of the blocks read from the file.
+BLOCK_SIZE = 1 << 24
+## Approximate temporary memory used to parse a block, per byte of the block.
+BLOCK_OVERHEAD = 16
+## Minimum size, in bytes, of the byte range parsed by each process.
+MIN_RANGE_SIZE = 1 << 22
+
+_NEWLINE = ord('\n')
+_BLANK = ord(' ')
+_TAB = ord('\t')
+
+_SLASH = ord('/')
+_ZERO = ord('0')
+
+_COMMENT = re.compile(rb'#[^\n]*')
+
+
+## Mesh data.
+#
+# Arrays read from an .obj file. Faces are triangulated and every corner of
+# a triangle keeps its (v, vt, vn) indices, with -1 where the index is missing.
+class Mesh:
+
+    ## Constructor.
+    #
+    # @param positions Vertex positions, float32 array (n, 3).
+    # @param texcoords Texture coordinates, float32 array (n, 2).
+    # @param normals Vertex normals, float32 array (n, 3).
+    # @param corners Triangle corners, int32 array (3*triangles, 3).
+    def __init__(self, positions, texcoords, normals, corners):
+        self.positions = positions
+        self.texcoords = texcoords
+        self.normals   = normals
+        self.corners   = corners
+
+        if len(positions):
+            self.bounds_min = positions.min(axis=0)
+            self.bounds_max = positions.max(axis=0)
+        else:
+            self.bounds_min = np.zeros(3, dtype='float32')
+            self.bounds_max = np.zeros(3, dtype='float32')
+
+    ## Center of the bounding box.
+    def center(self):
+        return (self.bounds_min + self.bounds_max) / 2.0
+
+    ## Whether every corner has a normal.
+    def hasNormals(self):
+        return len(self.normals) > 0 and bool(np.all(self.corners[:, 2] >= 0))
+
+    ## Whether every corner has a texture coordinate.
+    def hasTexcoords(self):
+        return len(self.texcoords) > 0 and bool(np.all(self.corners[:, 1] >= 0))
+
+
+## Token starts.
+#
+# @param buf uint8 array.
+# @return Boolean array, True at the first char of each token.
+def _tokenStarts(buf):
+    blank = buf <= _BLANK
+    start = ~blank
+    start[1:] &= blank[:-1]
+    return start
+
+
+## Token count.
+#
+# Counts the whitespace separated tokens of each line of a buffer.
+#
+# @param buf uint8 array with lines ending in '\n'.
+# @param nlines Number of lines in the buffer.
+# @return int array with the number of tokens of each line.
+def _tokenCounts(buf, nlines):
+    line = np.searchsorted(np.flatnonzero(buf == _NEWLINE), np.flatnonzero(_tokenStarts(buf)))
+    return np.bincount(line, minlength=nlines)[:nlines]
+
+
+## Record values.
+#
+# Converts the selected lines to a (n, k) float32 array, ignoring any value
+# after the k-th of each line (e.g. the w of a vertex).
+#
+# @param buf uint8 array with the selected lines.
+# @param nlines Number of selected lines.
+# @param k Number of values kept per line.
+# @return The array.
+def _recordValues(buf, nlines, k):
+    values = np.fromstring(buf.tobytes(), dtype='float32', sep=' ')
+    if values.size == nlines*k:
+        return values.reshape(nlines, k)
+
+    counts = _tokenCounts(buf, nlines)
+    if np.any(counts < k):
+        raise ValueError('OBJ record with less than %d values' % k)
+    first = np.cumsum(counts) - counts
+    return values[first[:, None] + np.arange(k)]
+
+
+## Index resolution.
+#
+# Converts OBJ indices (1-based or negative, relative to the elements defined
+# so far) to 0-based indices, with -1 for missing indices.
+#
+# @param idx Indices read from the file.
+# @param before Number of elements defined before each index.
+# @return int32 array.
+def _resolve(idx, before):
+    out = np.where(idx > 0, idx - 1, before + idx)
+    out[idx == 0] = -1
+    return out.astype('int32')
+
+
+## Parse block.
+#
+# Parses a block of complete lines of an .obj file.
+#
+# @param data bytes with the lines, ending in '\n'.
+# @param offsets Number of (v, vt, vn) records before the block, used to
+# resolve negative indices.
+# @return Tuple (positions, texcoords, normals, corners).
+def parseBlock(data, offsets=(0, 0, 0)):
+    # Comments at the end of records would be read as values
+    if b'#' in data:
+        data = _COMMENT.sub(b'', data)
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return _emptyArrays()
+
+    ends = np.flatnonzero(buf == _NEWLINE)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    last = buf.size - 1
+    c0 = buf[starts]
+    c1 = buf[np.minimum(starts + 1, last)]
+    c2 = buf[np.minimum(starts + 2, last)]
+    blank1 = (c1 == _BLANK) | (c1 == _TAB)
+    blank2 = (c2 == _BLANK) | (c2 == _TAB)
+
+    is_v  = (c0 == ord('v')) & blank1
+    is_vt = (c0 == ord('v')) & (c1 == ord('t')) & blank2
+    is_vn = (c0 == ord('v')) & (c1 == ord('n')) & blank2
+    is_f  = (c0 == ord('f')) & blank1
+
+    # Blanks the record keywords, leaving only the values on each line
+    text = buf.copy()
+    text[starts[is_v | is_f]] = _BLANK
+    text[starts[is_vt | is_vn]] = _BLANK
+    text[starts[is_vt | is_vn] + 1] = _BLANK
+
+    positions = _recordValues(_selectLines(text, starts, ends, is_v),  int(is_v.sum()),  3)
+    texcoords = _recordValues(_selectLines(text, starts, ends, is_vt), int(is_vt.sum()), 2)
+    normals   = _recordValues(_selectLines(text, starts, ends, is_vn), int(is_vn.sum()), 3)
+
+    # Number of elements defined before each face line
+    before = [np.cumsum(m)[is_f] + o for m, o in zip((is_v, is_vt, is_vn), offsets)]
+    corners = _parseFaces(_selectLines(text, starts, ends, is_f), before)
+
+    return positions, texcoords, normals, corners
+
+
+## Select lines.
+#
+# @param text uint8 array of the block.
+# @param starts Index of the first char of each line.
+# @param ends Index of the '\n' of each line.
+# @param mask Boolean array of the lines to keep.
+# @return uint8 array with the selected lines.
+def _selectLines(text, starts, ends, mask):
+    lengths = ends[mask] - starts[mask] + 1
+    shift = np.repeat(starts[mask] - (np.cumsum(lengths) - lengths), lengths)
+    return text[shift + np.arange(lengths.sum())]
+
+
+## Parse faces.
+#
+# Converts face lines to triangle corners, triangulating polygons as fans.
+#
+# @param buf uint8 array with the face lines (keyword already removed).
+# @param before List with the number of v, vt and vn defined before each face.
+# @return int32 array (3*triangles, 3) of (v, vt, vn) indices.
+def _parseFaces(buf, before):
+    nfaces = before[0].size
+    if nfaces == 0:
+        return np.zeros((0, 3), dtype='int32')
+
+    # Missing indices (as in 1//2 or 1//) are filled with 0, never a valid
+    # OBJ index
+    slash = buf == _SLASH
+    empty = np.flatnonzero(slash[:-1] & ((buf[1:] <= _BLANK) | slash[1:])) + 1
+    buf = np.insert(buf, empty, _ZERO)
+    slash = buf == _SLASH
+
+    counts = _tokenCounts(buf, nfaces)
+    token = np.searchsorted(np.flatnonzero(_tokenStarts(buf)), np.flatnonzero(slash), side='right') - 1
+    nvalues = np.bincount(token, minlength=int(counts.sum())) + 1
+    if np.any(nvalues > 3):
+        raise ValueError('Malformed OBJ face record')
+
+    buf[slash] = _BLANK
+    values = np.fromstring(buf.tobytes(), dtype='int64', sep=' ')
+    if values.size != nvalues.sum():
+        raise ValueError('Malformed OBJ face record')
+
+    # Tokens v, v/vt and v/vt/vn to (v, vt, vn) rows, with 0 where missing
+    first = np.cumsum(nvalues) - nvalues
+    idx = np.zeros((nvalues.size, 3), dtype='int64')
+    for i in range(3):
+        has = nvalues > i
+        idx[has, i] = values[first[has] + i]
+
+    corners = np.empty(idx.shape, dtype='int32')
+    for i in range(3):
+        corners[:, i] = _resolve(idx[:, i], np.repeat(before[i], counts))
+
+    # Fan triangulation: (0, j+1, j+2) for each polygon
+    ntri = np.maximum(counts - 2, 0)
+    first = np.repeat(np.cumsum(counts) - counts, ntri)
+    j = np.arange(ntri.sum()) - np.repeat(np.cumsum(ntri) - ntri, ntri)
+    tri = np.stack([first, first + j + 1, first + j + 2], axis=1)
+
+    return corners[tri.ravel()]
+
+
+def _emptyArrays():
+    return (np.zeros((0, 3), dtype='float32'), np.zeros((0, 2), dtype='float32'),
+            np.zeros((0, 3), dtype='float32'), np.zeros((0, 3), dtype='int32'))
+
+
+## Read blocks.
+#
+# Reads a binary file in blocks that end at a line break.
+#
+# @param f File opened in binary mode.
+# @param size Approximate size of the blocks.
+# @param limit Maximum number of bytes read (None to read up to the end).
+# @return Generator of bytes blocks.
+def readBlocks(f, size=BLOCK_SIZE, limit=None):
+    rest = b''
+    while True:
+        if limit is not None:
+            size = min(size, limit)
+        chunk = f.read(size) if size > 0 else b''
+        if not chunk:
+            break
+        if limit is not None:
+            limit -= len(chunk)
+        chunk = rest + chunk
+        cut = chunk.rfind(b'\n') + 1
+        rest = chunk[cut:]
+        if cut:
+            yield chunk[:cut]
+    if rest:
+        yield rest + b'\n'
+
+
+## Memory pool.
+#
+# Accounts the memory of the arrays of a load against an optional ceiling.
+class MemoryPool:
+
+    ## Constructor.
+    #
+    # @param limit Maximum number of bytes, or None for no limit.
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used  = 0
+
+    ## Free bytes (None if there is no limit).
+    def available(self):
+        if self.limit is None:
+            return None
+        return self.limit - self.used
+
+    ## Reserves bytes, raising MemoryError if the ceiling would be crossed.
+    def reserve(self, nbytes):
+        if self.limit is not None and self.used + nbytes > self.limit:
+            raise MemoryError('OBJ load needs more than the %d bytes allowed' % self.limit)
+        self.used += nbytes
+
+    ## Returns reserved bytes to the pool.
+    def release(self, nbytes):
+        self.used -= nbytes
+
+
+## Growable array.
+#
+# Preallocated (n, cols) array that grows geometrically as rows are appended,
+# so appends cost amortized O(1) per row.
+class GrowableArray:
+
+    ## Growth factor of the capacity.
+    GROWTH = 2.0
+
+    ## Constructor.
+    #
+    # @param cols Number of columns.
+    # @param dtype Type of the elements.
+    # @param pool MemoryPool where the capacity is accounted.
+    # @param capacity Initial number of rows.
+    def __init__(self, cols, dtype, pool=None, capacity=1024):
+        self.pool = pool if pool is not None else MemoryPool()
+        self.size = 0
+        self.data = np.empty((0, cols), dtype=dtype)
+        self.reserve(capacity)
+
+    def _rowBytes(self):
+        return self.data.shape[1] * self.data.itemsize
+
+    ## Reserve.
+    #
+    # Makes room for at least the given number of rows.
+    #
+    # @param capacity Number of rows.
+    def reserve(self, capacity):
+        if capacity <= len(self.data):
+            return
+        extra = (capacity - len(self.data)) * self._rowBytes()
+        self.pool.reserve(extra)
+        data = np.empty((capacity, self.data.shape[1]), dtype=self.data.dtype)
+        data[:self.size] = self.data[:self.size]
+        self.data = data
+
+    ## Extend.
+    #
+    # Appends rows, growing the capacity by GROWTH when it runs out. Near the
+    # memory ceiling the capacity grows only to what is needed.
+    #
+    # @param rows (n, cols) array.
+    def extend(self, rows):
+        needed = self.size + len(rows)
+        if needed > len(self.data):
+            capacity = max(needed, int(len(self.data) * self.GROWTH))
+            free = self.pool.available()
+            if free is not None:
+                capacity = min(capacity, len(self.data) + max(free, 0) // self._rowBytes())
+            self.reserve(max(capacity, needed))
+        self.data[self.size:needed] = rows
+        self.size = needed
+
+    ## Array.
+    #
+    # Shrinks the capacity to the size and returns the data.
+    #
+    # @return (size, cols) array.
+    def array(self):
+        self.pool.release((len(self.data) - self.size) * self._rowBytes())
+        self.data.resize((self.size, self.data.shape[1]), refcheck=False)
+        return self.data
+
+
+## Stream OBJ.
+#
+# Reads an .obj file in fixed size blocks, yielding the arrays parsed from
+# each one. Only one block of the file is in memory at a time.
+#
+# @param obj_name Path of the file.
+# @param block_size Size of the blocks read from the file.
+# @param byte_range (start, end) of the part of the file read, aligned to
+# line starts (None for the whole file).
+# @param offsets Number of (v, vt, vn) records before the range.
+# @return Generator of (positions, texcoords, normals, corners) tuples, with
+# indices relative to the whole file.
+def streamObj(obj_name, block_size=BLOCK_SIZE, byte_range=None, offsets=(0, 0, 0)):
+    start, end = byte_range if byte_range is not None else (0, None)
+    with open(obj_name, 'rb') as f:
+        f.seek(start)
+        limit = end - start if end is not None else None
+        for block in readBlocks(f, block_size, limit):
+            arrays = parseBlock(block, offsets)
+            offsets = tuple(o + len(a) for o, a in zip(offsets, arrays[:3]))
+            yield arrays
+
+
+## Split ranges.
+#
+# Splits a file in byte ranges that start at line starts.
+#
+# @param file_name Path of the file.
+# @param n Number of ranges.
+# @return List of (start, end) tuples covering the file.
+def splitRanges(file_name, n):
+    size = os.path.getsize(file_name)
+    bounds = [0]
+    with open(file_name, 'rb') as f:
+        for i in range(1, n):
+            f.seek(max(size*i // n - 1, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+## Count records of a byte range (run in the process pool).
+def _countRange(args):
+    obj_name, byte_range = args
+    counts = [0, 0, 0]
+    with open(obj_name, 'rb') as f:
+        f.seek(byte_range[0])
+        for block in readBlocks(f, BLOCK_SIZE, byte_range[1] - byte_range[0]):
+            block = b'\n' + block
+            for i, key in enumerate((b'\nv', b'\nvt', b'\nvn')):
+                counts[i] += block.count(key + b' ') + block.count(key + b'\t')
+    return counts
+
+
+## Parse a byte range (run in the process pool).
+def _parseRange(args):
+    obj_name, block_size, byte_range, offsets = args
+    parts = list(streamObj(obj_name, block_size, byte_range, offsets))
+    if not parts:
+        return _emptyArrays()
+    return tuple(np.concatenate(a) for a in zip(*parts))
+
+
+## Load OBJ in parallel.
+#
+# Parses newline aligned byte ranges of the file in a process pool. A first
+# pass counts the v, vt and vn records of each range, so that every range
+# resolves negative indices against the records of the ranges before it. The
+# partial arrays are then merged in file order.
+def _loadParallel(obj_name, block_size, pool, processes, nranges):
+    ranges = splitRanges(obj_name, nranges)
+    with ProcessPoolExecutor(processes) as executor:
+        counts = list(executor.map(_countRange, [(obj_name, r) for r in ranges]))
+        offsets = np.cumsum([[0, 0, 0]] + counts, axis=0)[:-1].tolist()
+        args = [(obj_name, block_size, r, tuple(o)) for r, o in zip(ranges, offsets)]
+        parts = list(executor.map(_parseRange, args))
+
+    out = [GrowableArray(3, 'float32', pool, 0), GrowableArray(2, 'float32', pool, 0),
+           GrowableArray(3, 'float32', pool, 0), GrowableArray(3, 'int32', pool, 0)]
+    for o, a in zip(out, zip(*parts)):
+        o.reserve(sum(len(x) for x in a))
+        for x in a:
+            o.extend(x)
+    return Mesh(*[o.array() for o in out])
+
+
+## Load OBJ.
+#
+# Reads an .obj file. The blocks of the file are streamed into growable
+# arrays, preallocated from the record counts of the first block. With more
+# than one process, byte ranges of the file are parsed in parallel.
+#
+# @param obj_name Path of the file.
+# @param block_size Size of the blocks read from the file.
+# @param max_memory Ceiling, in bytes, for the mesh arrays and the block
+# being parsed (None for no ceiling). MemoryError is raised when the mesh
+# does not fit. In parallel loads only the merged arrays are accounted.
+# @param processes Number of worker processes (None for one per CPU). Files
+# smaller than MIN_RANGE_SIZE per process use fewer processes.
+# @return Mesh with the data of the file.
+def loadObj(obj_name, block_size=BLOCK_SIZE, max_memory=None, processes=1):
+    pool = MemoryPool(max_memory)
+    if max_memory is not None:
+        # Keeps the parse of a block within a quarter of the ceiling
+        block_size = max(1 << 16, min(block_size, max_memory // (4*BLOCK_OVERHEAD)))
+        pool.reserve(block_size * BLOCK_OVERHEAD)
+
+    file_size = os.path.getsize(obj_name)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    nranges = min(processes, max(1, file_size // MIN_RANGE_SIZE))
+    if nranges > 1:
+        return _loadParallel(obj_name, block_size, pool, processes, nranges)
+
+    out = [GrowableArray(3, 'float32', pool), GrowableArray(2, 'float32', pool),
+           GrowableArray(3, 'float32', pool), GrowableArray(3, 'int32', pool)]
+
+    read = 0
+    for i, arrays in enumerate(streamObj(obj_name, block_size)):
+        read += block_size
+        if i == 0 and read < file_size:
+            # Estimates the final sizes from the first block
+            scale = 1.05 * file_size / block_size
+            for o, a in zip(out, arrays):
+                want = int(len(a) * scale)
+                free = pool.available()
+                if free is None or (want - len(o.data)) * o._rowBytes() < free / 2:
+                    o.reserve(want)
+        for o, a in zip(out, arrays):
+            o.extend(a)
+
+    return Mesh(*[o.array() for o in out])
+
+
+## Interleave.
+#
+# Builds an interleaved float32 vertex array from triangle corners.
+#
+# @param mesh Mesh.
+# @param corners (n, 3) array of (v, vt, vn) indices.
+# @param normals Whether normals follow the positions.
+# @param texcoords Whether texture coordinates follow the normals.
+# @return float32 array.
+def _interleave(mesh, corners, normals, texcoords):
+    data = [mesh.positions[corners[:, 0]]]
+    if normals:
+        data.append(mesh.normals[corners[:, 2]])
+    if texcoords:
+        data.append(mesh.texcoords[corners[:, 1]])
+    return np.hstack(data).astype('float32').ravel()
+
+
+## Vertex array.
+#
+# Builds the interleaved vertex array (position followed by normal, when the
+# mesh has normals, and by the texture coordinate, if asked) of the triangle
+# corners.
+#
+# @param mesh Mesh.
+# @param texcoords Whether to include texture coordinates.
+# @return float32 array.
+def vertexArray(mesh, texcoords=False):
+    return _interleave(mesh, mesh.corners, mesh.hasNormals(), texcoords)
+
+
+## Indexed arrays.
+#
+# Builds an indexed version of the mesh. Each distinct (v, vt, vn) tuple used
+# by the triangles becomes a single vertex, in order of first use, and the
+# triangles refer to it through the index array. Indices are uint16 when the
+# vertex count allows it, uint32 otherwise.
+#
+# @param mesh Mesh.
+# @param normals Whether to include normals (default: if the mesh has them).
+# @param texcoords Whether to include texture coordinates.
+# @return Tuple (vertex_array, indices).
+def indexedArrays(mesh, normals=None, texcoords=False):
+    if normals is None:
+        normals = mesh.hasNormals()
+    corners = mesh.corners
+
+    # Only the attributes that go to the vertex array tell vertices apart
+    cols = [(0, len(mesh.positions))]
+    if texcoords:
+        cols.append((1, len(mesh.texcoords)))
+    if normals:
+        cols.append((2, len(mesh.normals)))
+
+    if np.prod([float(n + 1) for _, n in cols]) < 2.0**62:
+        key = np.zeros(len(corners), dtype='int64')
+        for c, n in cols:
+            key = key*(n + 1) + (corners[:, c] + 1)
+    else:
+        key = corners[:, [c for c, _ in cols]]
+    _, first, inverse = np.unique(key, axis=0, return_index=True, return_inverse=True)
+
+    # Renumbers the unique vertices by first use
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+
+    index_type = 'uint16' if order.size <= 1 << 16 else 'uint32'
+    indices = rank[inverse.ravel()].astype(index_type)
+    vertex_array = _interleave(mesh, corners[first[order]], normals, texcoords)
+    return vertex_array, indices
@@ -0,0 +1,149 @@
+## @file pbo.py
+# Streaming texture uploads.
+#
+# Uploads textures through a ring of pixel buffer objects
+# (GL_PIXEL_UNPACK_BUFFER). Each step of the frame copies a chunk of rows into
+# a mapped buffer and issues glTexSubImage2D from it, so the driver copies
+# the pixels to the texture asynchronously instead of stalling the call. A
+# fence after each chunk tells when its buffer can be refilled, and a
+# texture is handed to its callback once the fence of its last chunk
+# signals. Buffers still in use are skipped, never waited on.
+#
+# @author Mateus Raganhan Figênio
+
+import ctypes
+import numpy as np
+import OpenGL.GL as gl
+
+import texture as tx
+
+## Number of pixel buffer objects in the ring.
+PBO_RING = 3
+## Bytes of each pixel buffer object, the largest chunk of one upload.
+CHUNK_BYTES = 1 << 20
+
+
+def _signaled(fence):
+    status = gl.glClientWaitSync(fence, 0, 0)
+    return status in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED)
+
+
+## Texture streamer.
+#
+# Queue of textures uploaded a few chunks per frame. The GL calls must be made
+# on the thread that owns the context.
+class TextureStreamer:
+
+    ## Constructor.
+    #
+    # @param ring Number of pixel buffer objects.
+    # @param chunk_bytes Bytes of each pixel buffer object.
+    def __init__(self, ring=PBO_RING, chunk_bytes=CHUNK_BYTES):
+        self.chunk_bytes = chunk_bytes
+        self.buffers = [int(b) for b in np.atleast_1d(gl.glGenBuffers(ring))]
+        for buf in self.buffers:
+            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, buf)
+            gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER, chunk_bytes, None, gl.GL_STREAM_DRAW)
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+        ## Fence of the last upload from each buffer (None when free).
+        self.fences = [None] * ring
+        self.next   = 0
+        ## Chunks to upload as (texture, level, pixels, first row, rows).
+        self.chunks = list()
+        ## Textures whose chunks were all issued, as (texture, fence, on_ready).
+        self.issued = list()
+        ## Callbacks of the textures with chunks left.
+        self.jobs   = dict()
+        ## Bytes uploaded since the creation of the streamer.
+        self.uploaded = 0
+
+    ## Submit.
+    #
+    # Creates a texture with storage for every level and queues its pixels.
+    #
+    # @param pixels uint8 array (height, width, channels), or a list of
+    # mipmap levels.
+    # @param on_ready Function called by step() with the texture object once
+    # it is complete.
+    # @param wrap Wrap mode of the texture.
+    # @return Texture object (incomplete until on_ready is called).
+    def submit(self, pixels, on_ready, wrap=gl.GL_REPEAT):
+        levels = list(pixels) if isinstance(pixels, (list, tuple)) else [pixels]
+        texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+        for level, p in enumerate(levels):
+            tx.allocate(p.shape, level=level)
+        tx.setParameters(levels[0].shape[2], wrap, len(levels))
+
+        for level, p in enumerate(levels):
+            p = np.ascontiguousarray(p)
+            if p.shape[1] * p.shape[2] > self.chunk_bytes:
+                raise ValueError('Texture row longer than the %d bytes of a pixel buffer' % self.chunk_bytes)
+            rows = self.chunk_bytes // (p.shape[1] * p.shape[2])
+            for first in range(0, p.shape[0], rows):
+                self.chunks.append((texture, level, p, first, min(rows, p.shape[0] - first)))
+        self.jobs[texture] = on_ready
+        return texture
+
+    ## Whether textures are still being uploaded.
+    def pending(self):
+        return bool(self.chunks or self.issued)
+
+    def _upload(self, i, chunk):
+        texture, level, p, first, rows = chunk
+        data = p[first:first + rows]
+        buf = self.buffers[i]
+
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, buf)
+        ptr = gl.glMapBufferRange(gl.GL_PIXEL_UNPACK_BUFFER, 0, data.nbytes,
+                                  gl.GL_MAP_WRITE_BIT | gl.GL_MAP_INVALIDATE_BUFFER_BIT)
+        ctypes.memmove(ptr, data.ctypes.data, data.nbytes)
+        gl.glUnmapBuffer(gl.GL_PIXEL_UNPACK_BUFFER)
+
+        _, fmt = tx.GL_FORMATS[p.shape[2]]
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        gl.glTexSubImage2D(gl.GL_TEXTURE_2D, level, 0, first, p.shape[1], rows, fmt, gl.GL_UNSIGNED_BYTE,
+                           ctypes.c_void_p(0))
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 4)
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+
+        self.fences[i] = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.uploaded += data.nbytes
+        return self.fences[i]
+
+    ## Step.
+    #
+    # Issues chunks into the free buffers of the ring (at most one pass over
+    # the ring), then runs the callbacks of the textures whose uploads
+    # completed. Meant to be called once per frame.
+    #
+    # @return Number of textures completed.
+    def step(self):
+        for _ in range(len(self.buffers)):
+            if not self.chunks:
+                break
+            i = self.next
+            if self.fences[i] is not None:
+                if not _signaled(self.fences[i]):
+                    break
+                # The fence may still be the last one of an issued texture
+                if not any(f is self.fences[i] for _, f, _ in self.issued):
+                    gl.glDeleteSync(self.fences[i])
+                self.fences[i] = None
+
+            chunk = self.chunks.pop(0)
+            fence = self._upload(i, chunk)
+            self.next = (i + 1) % len(self.buffers)
+            texture = chunk[0]
+            if not any(c[0] == texture for c in self.chunks):
+                self.issued.append((texture, fence, self.jobs.pop(texture)))
+
+        done = [job for job in self.issued if _signaled(job[1])]
+        for job in done:
+            self.issued.remove(job)
+            texture, fence, on_ready = job
+            if not any(f is fence for f in self.fences):
+                gl.glDeleteSync(fence)
+            on_ready(texture)
+        return len(done)
@@ -0,0 +1,88 @@
+## @file scheduler.py
+# Render on demand.
+#
+# A viewer that installs an idle function that always posts a redisplay draws
+# the same frame over and over and keeps a core busy. FrameScheduler only
+# asks GLUT for a frame when something marks the scene dirty (input, an
+# animation step or an asset reload), and runs animations on a GLUT timer at
+# a target rate. With no animation running and nothing dirty there is no idle
+# function and no timer, so glutMainLoop sleeps waiting for events.
+#
+# All the calls must be made on the GLUT thread.
+#
+# @author Mateus Raganhan Figênio
+
+import time
+import OpenGL.GLUT as glut
+
+## Default target rate of animations, in frames per second.
+FRAME_RATE = 60
+
+
+## Frame scheduler.
+class FrameScheduler:
+
+    ## Constructor.
+    #
+    # @param rate Target rate of animations, in frames per second.
+    def __init__(self, rate=FRAME_RATE):
+        self.rate      = rate
+        ## Whether a redisplay was posted and not drawn yet.
+        self.dirty     = False
+        ## Animation step, called as step(dt) at the target rate.
+        self.animation = None
+        ## Frames drawn and animation steps run.
+        self.frames    = 0
+        self.ticks     = 0
+        # Timers cannot be removed from GLUT, so stale ones check this
+        self._timer    = 0
+        self._last     = 0.0
+        self._deadline = 0.0
+
+    ## Mark dirty.
+    #
+    # Asks for a frame, once until it is drawn.
+    def markDirty(self):
+        if not self.dirty:
+            self.dirty = True
+            glut.glutPostRedisplay()
+
+    ## Begin frame.
+    #
+    # Called by the display function.
+    def beginFrame(self):
+        self.dirty = False
+        self.frames += 1
+
+    ## Animate.
+    #
+    # Runs an animation step at the target rate. The step gets the seconds
+    # since the previous one, so the motion does not depend on the rate, and
+    # returns whether the scene changed.
+    #
+    # @param step Function step(dt) -> bool, or None to stop animating.
+    def animate(self, step):
+        if step is self.animation:
+            return
+        self.animation = step
+        self._timer += 1
+        if step is not None:
+            self._last = self._deadline = time.perf_counter()
+            glut.glutTimerFunc(0, self._tick, self._timer)
+
+    def _tick(self, timer):
+        if timer != self._timer or self.animation is None:
+            return
+        now = time.perf_counter()
+        self.ticks += 1
+        if self.animation(now - self._last):
+            self.markDirty()
+        self._last = now
+
+        # Next step one period after the previous deadline, without bursts
+        # to catch up when late
+        self._deadline = max(self._deadline + 1.0/self.rate, now)
+        glut.glutTimerFunc(int(round(1000*(self._deadline - now))), self._tick, timer)
+
+    def __str__(self):
+        return '%d frames, %d animation steps' % (self.frames, self.ticks)
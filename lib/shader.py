@@ -0,0 +1,124 @@
+## @file shader.py
+# Shader programs.
+#
+# Wraps a program created by utils.createShaderProgram. The locations and
+# types of all its active uniforms are queried once after link, and the last
+# value sent to each uniform is kept, so setting a uniform to the value it
+# already holds skips the GL call. The uniforms sent and skipped in each frame
+# are counted.
+#
+# @author Mateus Raganhan Figênio
+
+import numpy as np
+import OpenGL.GL as gl
+
+import utils as ut
+
+# Upload function, data type, components and whether it is a matrix, by
+# uniform type
+_SETTERS = {
+    gl.GL_FLOAT:        (gl.glUniform1fv, 'float32', 1, False),
+    gl.GL_FLOAT_VEC2:   (gl.glUniform2fv, 'float32', 2, False),
+    gl.GL_FLOAT_VEC3:   (gl.glUniform3fv, 'float32', 3, False),
+    gl.GL_FLOAT_VEC4:   (gl.glUniform4fv, 'float32', 4, False),
+    gl.GL_INT:          (gl.glUniform1iv, 'int32', 1, False),
+    gl.GL_INT_VEC2:     (gl.glUniform2iv, 'int32', 2, False),
+    gl.GL_INT_VEC3:     (gl.glUniform3iv, 'int32', 3, False),
+    gl.GL_INT_VEC4:     (gl.glUniform4iv, 'int32', 4, False),
+    gl.GL_BOOL:         (gl.glUniform1iv, 'int32', 1, False),
+    gl.GL_SAMPLER_2D:   (gl.glUniform1iv, 'int32', 1, False),
+    gl.GL_SAMPLER_3D:   (gl.glUniform1iv, 'int32', 1, False),
+    gl.GL_SAMPLER_CUBE: (gl.glUniform1iv, 'int32', 1, False),
+    gl.GL_FLOAT_MAT3:   (gl.glUniformMatrix3fv, 'float32', 9, True),
+    gl.GL_FLOAT_MAT4:   (gl.glUniformMatrix4fv, 'float32', 16, True),
+}
+
+
+## Shader program.
+#
+# Program with cached uniform locations and values.
+class ShaderProgram:
+
+    ## Constructor.
+    #
+    # @param vertex_code String with code for vertex shader.
+    # @param fragment_code String with code for fragment shader.
+    def __init__(self, vertex_code, fragment_code):
+        self.program = ut.createShaderProgram(vertex_code, fragment_code)
+        ## (location, type, array size) of each active uniform, by name.
+        self.uniforms = dict()
+        for i in range(gl.glGetProgramiv(self.program, gl.GL_ACTIVE_UNIFORMS)):
+            name, size, kind = gl.glGetActiveUniform(self.program, i)
+            if isinstance(name, bytes):
+                name = name.decode()
+            # Arrays are reported as name[0]
+            name = name.split('[')[0]
+            self.uniforms[name] = (gl.glGetUniformLocation(self.program, name), int(kind), int(size))
+        ## Last value sent to each uniform.
+        self.values  = dict()
+        ## Uniforms sent and skipped in the current frame.
+        self.uploads = 0
+        self.skips   = 0
+        ## Uniforms sent and skipped in the last finished frame.
+        self.frame_uploads = 0
+        self.frame_skips   = 0
+
+    ## Use the program.
+    def use(self):
+        gl.glUseProgram(self.program)
+
+    ## Whether the program has an active uniform of that name.
+    def __contains__(self, name):
+        return name in self.uniforms
+
+    ## Set a uniform.
+    #
+    # The program must be in use. Uniforms that are not active (unused in the
+    # shaders) are ignored, as OpenGL ignores location -1.
+    #
+    # @param name Uniform name.
+    # @param value Number, vector, or matrix (row-major, as built by utils),
+    # or a sequence of them for array uniforms.
+    # @return Whether the value was sent.
+    def set(self, name, value):
+        if name not in self.uniforms:
+            return False
+        location, kind, size = self.uniforms[name]
+        if kind not in _SETTERS:
+            raise ValueError('Unsupported type %#x of uniform %s' % (kind, name))
+        setter, dtype, components, matrix = _SETTERS[kind]
+
+        value = np.asarray(value, dtype=dtype)
+        old = self.values.get(name)
+        if old is not None and old.shape == value.shape and np.array_equal(old, value):
+            self.skips += 1
+            return False
+        self.values[name] = value.copy()
+        self.uploads += 1
+
+        count = min(max(value.size // components, 1), size)
+        if matrix:
+            setter(location, count, gl.GL_TRUE, value)
+        else:
+            setter(location, count, value)
+        return True
+
+    ## Forget the cached values, so every uniform is sent again (e.g. after
+    # something other than set() changed them).
+    def invalidate(self):
+        self.values.clear()
+
+    ## End frame.
+    #
+    # Keeps the counts of the frame in frame_uploads and frame_skips and
+    # restarts them.
+    #
+    # @return Whether the counts changed from the previous frame.
+    def endFrame(self):
+        changed = (self.uploads, self.skips) != (self.frame_uploads, self.frame_skips)
+        self.frame_uploads, self.frame_skips = self.uploads, self.skips
+        self.uploads = self.skips = 0
+        return changed
+
+    def __str__(self):
+        return 'uniforms sent %d, skipped %d' % (self.frame_uploads, self.frame_skips)
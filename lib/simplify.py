@@ -0,0 +1,217 @@
+## @file simplify.py
+# Mesh simplification.
+#
+# Simplifies indexed triangle meshes with quadric error metrics, using the
+# vertex clustering formulation of Lindstrom ("Out-of-Core Simplification of
+# Large Polygonal Models", 2000): the vertices are grouped in the cells of a
+# uniform grid and each cell is replaced by the point that minimizes the sum
+# of the quadrics (Garland and Heckbert, 1997) of the faces around it. Every
+# step is an array operation, so a chain of levels of detail (LODs) is built
+# at load time even for large meshes.
+#
+# @author Mateus Raganhan Figênio
+
+import numpy as np
+
+## Version of the generated LODs, part of the cache key of the meshes that
+## use them.
+SIMPLIFY_VERSION = 1
+## Fraction of the triangles kept from one LOD to the next.
+LOD_RATIO = 0.25
+## Maximum number of LODs, including the full mesh.
+LOD_LEVELS = 5
+## LODs with fewer triangles are not generated.
+MIN_TRIANGLES = 32
+## Triangles drawn per pixel of the projected bounding sphere.
+TRIANGLES_PER_PIXEL = 0.5
+
+# Upper triangle of the symmetric 4x4 quadric
+_ROWS, _COLS = np.triu_indices(4)
+
+
+## Face quadrics.
+#
+# @param positions float array (n, 3).
+# @param tris int array (m, 3).
+# @return float64 array (m, 10) with the upper triangle of the area weighted
+# quadric of the plane of each face.
+def _faceQuadrics(positions, tris):
+    p = positions.astype('float64')
+    a, b, c = p[tris[:, 0]], p[tris[:, 1]], p[tris[:, 2]]
+    n = np.cross(b - a, c - a)
+    length = np.linalg.norm(n, axis=1)
+    unit = n / np.where(length > 0.0, length, 1.0)[:, None]
+    plane = np.hstack([unit, -np.sum(unit * a, axis=1, keepdims=True)])
+    area = length / 2.0
+    return area[:, None] * plane[:, _ROWS] * plane[:, _COLS]
+
+
+## Grid cells.
+#
+# @param unit Positions scaled to [0, 1] along the longest axis, (n, 3).
+# @param resolution Number of cells along the longest axis.
+# @return int64 array (n,) with the cell of each position.
+def _cells(unit, resolution):
+    ijk = np.minimum((unit * resolution).astype('int64'), resolution - 1)
+    return (ijk[:, 0] * resolution + ijk[:, 1]) * resolution + ijk[:, 2]
+
+
+## Unit positions.
+#
+# @param positions float array (n, 3).
+# @return Positions scaled to [0, 1] along the longest axis of the box.
+def _unit(positions):
+    lo = positions.min(axis=0)
+    extent = (positions.max(axis=0) - lo).max()
+    return (positions - lo) / (extent if extent > 0.0 else 1.0)
+
+
+## Labels.
+#
+# Numbers the distinct values of an array, by sorting (faster than
+# np.unique with return_inverse for large arrays).
+#
+# @param keys int64 array.
+# @return Tuple (int64 labels of each key, number of distinct keys).
+def _labels(keys):
+    if len(keys) == 0:
+        return np.zeros(0, dtype='int64'), 0
+    order = np.argsort(keys, kind='stable')
+    new = np.empty(len(keys), dtype=bool)
+    new[0] = True
+    new[1:] = keys[order[1:]] != keys[order[:-1]]
+    label = np.empty(len(keys), dtype='int64')
+    label[order] = np.cumsum(new) - 1
+    return label, int(new.sum())
+
+
+def _countDistinct(keys):
+    s = np.sort(keys)
+    return int(len(s) > 0) + int(np.count_nonzero(s[1:] != s[:-1]))
+
+
+## Simplify.
+#
+# Clusters the vertices in a grid and places each cluster at the minimizer of
+# its quadric, clamped to the bounding box of the cluster. Triangles that
+# collapse are removed.
+#
+# @param positions float array (n, 3).
+# @param normals float array (n, 3), or None.
+# @param indices Triangle index array.
+# @param resolution Number of cells along the longest axis of the mesh.
+# @return Tuple (positions, normals, indices) of the simplified mesh.
+def simplify(positions, normals, indices, resolution):
+    tris = indices.reshape(-1, 3).astype('int64')
+    label, nclusters = _labels(_cells(_unit(positions), resolution))
+
+    # Quadric of each cluster: the sum of the quadrics of its faces corners
+    face_q = _faceQuadrics(positions, tris)
+    corner_label = label[tris].ravel()
+    q = np.zeros((nclusters, 4, 4))
+    for i, (r, c) in enumerate(zip(_ROWS, _COLS)):
+        q[:, r, c] = np.bincount(corner_label, np.repeat(face_q[:, i], 3), nclusters)
+        q[:, c, r] = q[:, r, c]
+
+    count = np.bincount(label, minlength=nclusters)[:, None]
+    mean = np.stack([np.bincount(label, positions[:, i], nclusters) for i in range(3)], axis=1) / count
+
+    # Minimizer of x^T A x + 2 b^T x + c, regularized towards the cluster mean
+    # so flat or degenerate clusters stay well defined
+    A = q[:, :3, :3]
+    b = -q[:, :3, 3]
+    reg = 1e-3 * np.trace(A, axis1=1, axis2=2)[:, None] / 3.0 + 1e-12
+    A = A + reg[:, :, None] * np.identity(3)
+    x = np.linalg.solve(A, (b + reg * mean)[:, :, None])[:, :, 0]
+
+    lo = np.full((nclusters, 3), np.inf)
+    hi = np.full((nclusters, 3), -np.inf)
+    np.minimum.at(lo, label, positions)
+    np.maximum.at(hi, label, positions)
+    new_positions = np.clip(x, lo, hi).astype('float32')
+
+    new_normals = None
+    if normals is not None:
+        new_normals = np.stack([np.bincount(label, normals[:, i], nclusters) for i in range(3)], axis=1)
+        length = np.linalg.norm(new_normals, axis=1, keepdims=True)
+        new_normals = (new_normals / np.where(length > 0.0, length, 1.0)).astype('float32')
+
+    # Drops collapsed triangles and repeated ones (same cyclic order)
+    t = label[tris]
+    t = t[(t[:, 0] != t[:, 1]) & (t[:, 1] != t[:, 2]) & (t[:, 2] != t[:, 0])]
+    shift = np.argmin(t, axis=1)
+    t = t[np.arange(len(t))[:, None], (shift[:, None] + np.arange(3)) % 3]
+    if float(nclusters)**3 < 2.0**62:
+        key = (t[:, 0] * nclusters + t[:, 1]) * nclusters + t[:, 2]
+        _, keep = np.unique(key, return_index=True)
+    else:
+        _, keep = np.unique(t, axis=0, return_index=True)
+    t = t[np.sort(keep)]
+
+    return new_positions, new_normals, t.ravel().astype(indices.dtype)
+
+
+## Resolution for a target.
+#
+# Searches the grid resolution whose clustering keeps at most the target
+# number of vertices.
+#
+# @param positions float array (n, 3).
+# @param target Number of vertices.
+# @return The resolution.
+def resolutionFor(positions, target):
+    unit = _unit(positions)
+    lo, hi = 1, 1 << 20
+    while hi - lo > max(1, lo // 16):
+        mid = max(lo + 1, int(np.sqrt(lo * hi)))
+        if _countDistinct(_cells(unit, mid)) <= target:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+## LOD chain.
+#
+# Builds levels of detail with about LOD_RATIO of the triangles of the
+# previous level each.
+#
+# @param positions float array (n, 3).
+# @param normals float array (n, 3), or None.
+# @param indices Triangle index array.
+# @param levels Maximum number of levels, including the full mesh.
+# @return List of (positions, normals, indices), the full mesh first.
+def lodChain(positions, normals, indices, levels=LOD_LEVELS):
+    chain = [(positions, normals, indices)]
+    while len(chain) < levels:
+        prev_positions, _, prev_indices = chain[-1]
+        target = int(len(prev_positions) * LOD_RATIO)
+        if len(prev_indices) // 3 * LOD_RATIO < MIN_TRIANGLES or target < 4:
+            break
+        lod = simplify(positions, normals, indices, resolutionFor(positions, target))
+        if len(lod[2]) // 3 < MIN_TRIANGLES or len(lod[2]) > 0.9 * len(prev_indices):
+            break
+        chain.append(lod)
+    return chain
+
+
+## Select LOD.
+#
+# Picks the finest level with at most TRIANGLES_PER_PIXEL triangles per pixel
+# of the projected bounding sphere.
+#
+# @param triangles Number of triangles of each level, finest first.
+# @param radius Bounding sphere radius, in world units.
+# @param distance Distance from the camera to the sphere center.
+# @param fovy Vertical field of view, in radians.
+# @param height Viewport height, in pixels.
+# @return Index of the level.
+def selectLod(triangles, radius, distance, fovy, height):
+    if distance <= radius:
+        return 0
+    pixels = radius / (distance * np.tan(fovy / 2.0)) * (height / 2.0)
+    budget = TRIANGLES_PER_PIXEL * np.pi * pixels * pixels
+    for level, n in enumerate(triangles):
+        if n <= budget:
+            return level
+    return len(triangles) - 1
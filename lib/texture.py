@@ -0,0 +1,318 @@
+## @file texture.py
+# Texture loading.
+#
+# Decodes images straight into contiguous uint8 arrays, in one of the modes
+# L, RGB or RGBA and with the bottom row first (texture coordinate t = 0 at
+# the bottom of the image, as OpenGL and the vt records of .obj files
+# expect). The pixels come from a single copy of the decoded image buffer,
+# which is flipped by the PIL raw encoder while it is copied, and the array is
+# handed to glTexImage2D as is.
+#
+# @author Mateus Raganhan Figênio
+
+import numpy as np
+import OpenGL.GL as gl
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from PIL import Image
+
+## Mode each PIL mode is converted to.
+_MODES = {'1': 'L', 'L': 'L', 'I': 'L', 'I;16': 'L', 'F': 'L', 'LA': 'RGBA', 'RGBA': 'RGBA', 'RGBa': 'RGBA',
+          'PA': 'RGBA'}
+## Channels of each mode.
+CHANNELS = {'L': 1, 'RGB': 3, 'RGBA': 4}
+## Internal format and pixel format of each number of channels.
+GL_FORMATS = {1: (gl.GL_R8, gl.GL_RED), 3: (gl.GL_RGB8, gl.GL_RGB), 4: (gl.GL_RGBA8, gl.GL_RGBA)}
+## Default GPU memory budget, in bytes, of a TextureCache.
+TEXTURE_BUDGET = 256 << 20
+## Default number of decode threads of loadImages.
+DECODE_WORKERS = 4
+
+
+## Normalize mode.
+#
+# @param img PIL image.
+# @return The image in mode L, RGB or RGBA (the same image when it already
+# is).
+def normalizeMode(img):
+    if img.mode == 'P':
+        mode = 'RGBA' if 'transparency' in img.info else 'RGB'
+    else:
+        mode = _MODES.get(img.mode, 'RGB')
+    if img.mode == mode:
+        return img
+    if img.mode in ('I', 'I;16', 'F'):
+        # 16 bit and float images are scaled to 8 bits by their range
+        a = np.asarray(img, dtype='float64')
+        lo, hi = a.min(), a.max()
+        a = (a - lo) * (255.0 / (hi - lo)) if hi > lo else np.zeros_like(a)
+        return Image.fromarray(np.rint(a).astype('uint8'), 'L')
+    return img.convert(mode)
+
+
+## Image pixels.
+#
+# @param img PIL image.
+# @param flip Whether the bottom row comes first.
+# @return uint8 array (height, width, channels), read only.
+def imagePixels(img, flip=True):
+    img = normalizeMode(img)
+    width, height = img.size
+    data = img.tobytes('raw', img.mode, 0, -1 if flip else 1)
+    return np.frombuffer(data, dtype=np.uint8).reshape(height, width, CHANNELS[img.mode])
+
+
+## Load image.
+#
+# @param file_name Path of the image.
+# @param flip Whether the bottom row comes first.
+# @return uint8 array (height, width, channels), read only.
+def loadImage(file_name, flip=True):
+    with Image.open(file_name) as img:
+        return imagePixels(img, flip)
+
+
+## Load images.
+#
+# Decodes a batch of images on a pool of threads (PIL releases the GIL while
+# decoding) and yields each one as soon as it is ready, so the caller can
+# upload it while the others decode. At most twice as many images as
+# threads are decoded ahead of the caller, which bounds the memory held by
+# images not consumed yet.
+#
+# @param file_names Paths of the images.
+# @param workers Number of threads.
+# @param load Function of a path run on the threads (default: loadImage).
+# @return Generator of (file name, pixels), in completion order.
+def loadImages(file_names, workers=DECODE_WORKERS, load=loadImage):
+    names = iter(file_names)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = dict()
+        for name in names:
+            pending[executor.submit(load, name)] = name
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                for next_name in names:
+                    pending[executor.submit(load, next_name)] = next_name
+                    break
+                yield name, future.result()
+
+
+## Upload.
+#
+# Sends pixels to a level of the texture bound to target. The unpack
+# alignment is lowered for rows that are not a multiple of 4 bytes long.
+#
+# @param pixels uint8 array (height, width, channels), from loadImage.
+# @param target Texture target.
+# @param level Mipmap level.
+def upload(pixels, target=gl.GL_TEXTURE_2D, level=0):
+    height, width, channels = pixels.shape
+    internal, fmt = GL_FORMATS[channels]
+    aligned = (width * channels) % 4 == 0
+    if not aligned:
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+    gl.glTexImage2D(target, level, internal, width, height, 0, fmt, gl.GL_UNSIGNED_BYTE, pixels)
+    if not aligned:
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 4)
+
+
+## Allocate.
+#
+# Reserves a level of the texture bound to target, without data.
+#
+# @param shape Tuple (height, width, channels).
+# @param target Texture target.
+# @param level Mipmap level.
+def allocate(shape, target=gl.GL_TEXTURE_2D, level=0):
+    height, width, channels = shape
+    internal, fmt = GL_FORMATS[channels]
+    gl.glTexImage2D(target, level, internal, width, height, 0, fmt, gl.GL_UNSIGNED_BYTE, None)
+
+
+## Set parameters.
+#
+# Sets the filters and wrap mode of the texture bound to GL_TEXTURE_2D.
+#
+# @param channels Number of channels of the texture.
+# @param wrap Wrap mode of s and t.
+# @param levels Number of mipmap levels (more than 1 for trilinear
+# filtering).
+def setParameters(channels, wrap=gl.GL_REPEAT, levels=1):
+    min_filter = gl.GL_LINEAR_MIPMAP_LINEAR if levels > 1 else gl.GL_LINEAR
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAX_LEVEL, levels - 1)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, min_filter)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, wrap)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, wrap)
+    if channels == 1:
+        # Grayscale images are sampled as (l, l, l, 1)
+        gl.glTexParameteriv(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_SWIZZLE_RGBA, [gl.GL_RED, gl.GL_RED, gl.GL_RED, gl.GL_ONE])
+
+
+## Create texture.
+#
+# @param pixels uint8 array (height, width, channels), from loadImage, or a
+# list of such arrays with every mipmap level (from mipmap.loadMipmaps).
+# @param wrap Wrap mode of s and t.
+# @param mipmap Whether mipmaps are generated (and used for minification).
+# Given levels are always used.
+# @return Texture object, left bound to GL_TEXTURE_2D.
+def createTexture(pixels, wrap=gl.GL_REPEAT, mipmap=False):
+    texture = gl.glGenTextures(1)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+    if isinstance(pixels, (list, tuple)):
+        for level, p in enumerate(pixels):
+            upload(p, level=level)
+        setParameters(pixels[0].shape[2], wrap, len(pixels))
+    else:
+        upload(pixels)
+        levels = 1
+        if mipmap:
+            gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
+            levels = max(pixels.shape[:2]).bit_length()
+        setParameters(pixels.shape[2], wrap, levels)
+    return texture
+
+
+## Texture bytes.
+#
+# Estimates the GPU memory of a texture. RGB texels are counted as 4 bytes,
+# since drivers usually pad them, and a generated mipmap chain adds a third.
+#
+# @param pixels uint8 array (height, width, channels), or a list of levels.
+# @param mipmap Whether the texture has generated mipmaps.
+# @return Number of bytes.
+def textureBytes(pixels, mipmap=False):
+    if isinstance(pixels, (list, tuple)):
+        return sum(textureBytes(p) for p in pixels)
+    height, width, channels = pixels.shape
+    nbytes = width * height * (4 if channels == 3 else channels)
+    return nbytes * 4 // 3 if mipmap else nbytes
+
+
+## Texture cache.
+#
+# Textures resident on the GPU, keyed by file name, under a memory budget.
+# When a new texture does not fit, the least recently used ones are deleted,
+# except the pinned ones (for instance the texture on screen). A texture
+# larger than the whole budget is still kept, alone.
+class TextureCache:
+
+    ## Constructor.
+    #
+    # @param budget GPU memory budget, in bytes.
+    # @param wrap Wrap mode of the textures.
+    # @param mipmap Whether mipmaps are generated for single level textures.
+    # @param load Function of a file name that returns its pixels (or list
+    # of mipmap levels), used on misses.
+    def __init__(self, budget=TEXTURE_BUDGET, wrap=gl.GL_REPEAT, mipmap=False, load=loadImage):
+        self.budget    = budget
+        self.wrap      = wrap
+        self.mipmap    = mipmap
+        self.load      = load
+        ## Texture object and size of each name, least recently used first.
+        self.resident  = OrderedDict()
+        ## Names never evicted to make room.
+        self.pinned    = set()
+        self.used      = 0
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def __contains__(self, name):
+        return name in self.resident
+
+    def _evict(self, nbytes):
+        for name in [n for n in self.resident if n not in self.pinned]:
+            if self.used + nbytes <= self.budget:
+                break
+            texture, size = self.resident.pop(name)
+            gl.glDeleteTextures([texture])
+            self.used -= size
+            self.evictions += 1
+
+    ## Put.
+    #
+    # Makes decoded pixels resident, unless the name already is.
+    #
+    # @param name Name of the texture.
+    # @param pixels uint8 array (height, width, channels), or a list of
+    # mipmap levels.
+    # @return Texture object.
+    def put(self, name, pixels):
+        if name in self.resident:
+            return self.get(name)
+        nbytes = textureBytes(pixels, self.mipmap)
+        self._evict(nbytes)
+        return self.adopt(name, createTexture(pixels, self.wrap, self.mipmap), nbytes)
+
+    ## Adopt.
+    #
+    # Makes a texture created elsewhere (for instance streamed by
+    # pbo.TextureStreamer) resident, owned by the cache from then on.
+    #
+    # @param name Name of the texture.
+    # @param texture Texture object.
+    # @param nbytes GPU memory of the texture (see textureBytes).
+    # @return The texture object.
+    def adopt(self, name, texture, nbytes):
+        if name in self.resident:
+            old, size = self.resident.pop(name)
+            gl.glDeleteTextures([old])
+            self.used -= size
+        self._evict(nbytes)
+        self.resident[name] = (texture, nbytes)
+        self.used += nbytes
+        return texture
+
+    ## Get.
+    #
+    # Returns a resident texture, loading the file on a miss.
+    #
+    # @param name Path of the image.
+    # @return Texture object.
+    def get(self, name):
+        if name in self.resident:
+            self.hits += 1
+            self.resident.move_to_end(name)
+            return self.resident[name][0]
+        self.misses += 1
+        return self.put(name, self.load(name))
+
+    ## Get many.
+    #
+    # Loads the missing textures of a batch on decode threads, uploading
+    # each one as soon as it is decoded. Each name of the batch that is
+    # resident before loading counts as a hit, each texture loaded as a miss.
+    #
+    # @param names Paths of the images.
+    # @param workers Number of decode threads.
+    # @return List of texture objects, in the order of names (None for the
+    # ones evicted by the batch itself, when it does not fit the budget).
+    def getMany(self, names, workers=DECODE_WORKERS):
+        unique = list(dict.fromkeys(names))
+        found = [n for n in unique if n in self.resident]
+        self.hits += sum(1 for n in names if n in self.resident)
+        for name in found:
+            self.resident.move_to_end(name)
+
+        missing = [n for n in unique if n not in self.resident]
+        for name, pixels in loadImages(missing, workers, self.load):
+            self.misses += 1
+            self.put(name, pixels)
+        return [self.resident[n][0] if n in self.resident else None for n in names]
+
+    ## Delete every texture, pinned or not.
+    def clear(self):
+        self.pinned.clear()
+        self._evict(self.budget + 1)
+
+    def __str__(self):
+        return '%d textures, %.1f of %.1f MB, %d hits, %d misses, %d evictions' % (
+            len(self.resident), self.used / 2.0**20, self.budget / 2.0**20, self.hits, self.misses, self.evictions)
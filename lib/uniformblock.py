@@ -0,0 +1,165 @@
+## @file uniformblock.py
+# Uniform buffer objects.
+#
+# Keeps uniform blocks (std140 layout) in NumPy structured arrays that mirror
+# the bytes of their uniform buffers. Changing a field only writes the mirror;
+# update() sends the whole block with one glBufferSubData, and only if some
+# field changed. Each block is bound to a fixed binding point, so every
+# program that declares it reads the same buffer and a scene with many
+# programs pays a single upload per frame.
+#
+# The blocks are declared row_major in the shaders, so matrices are stored as
+# built by utils, without transposing. Camera and light blocks:
+#
+#   layout (std140, row_major) uniform Camera
+#   {
+#       mat4 view;
+#       mat4 projection;
+#       vec3 cameraPosition;
+#   };
+#
+#   layout (std140) uniform Lights
+#   {
+#       vec3 lightPosition;
+#       vec3 lightColor;
+#   };
+#
+# @author Mateus Raganhan Figênio
+
+import numpy as np
+import OpenGL.GL as gl
+
+## Size and alignment, in bytes, and NumPy shape of each std140 type.
+STD140 = {
+    'float': (4, 4, ()),
+    'int':   (4, 4, ()),
+    'vec2':  (8, 8, (2,)),
+    'vec3':  (12, 16, (3,)),
+    'vec4':  (16, 16, (4,)),
+    'mat4':  (64, 16, (4, 4)),
+}
+
+## Fields of the camera block.
+CAMERA_FIELDS = [('view', 'mat4'), ('projection', 'mat4'), ('cameraPosition', 'vec3')]
+## Fields of the light block.
+LIGHT_FIELDS = [('lightPosition', 'vec3'), ('lightColor', 'vec3')]
+## Binding point of the camera block.
+CAMERA_BINDING = 0
+## Binding point of the light block.
+LIGHT_BINDING = 1
+
+
+## std140 dtype.
+#
+# Structured dtype with the offsets of the std140 layout: each field is
+# aligned to its base alignment and the block is padded to a multiple of 16
+# bytes.
+#
+# @param fields List of (name, GLSL type).
+# @return The dtype.
+def std140(fields):
+    names, formats, offsets = list(), list(), list()
+    offset = 0
+    for name, kind in fields:
+        if kind not in STD140:
+            raise ValueError('Unsupported type %s of block field %s' % (kind, name))
+        size, align, shape = STD140[kind]
+        offset = -(-offset // align) * align
+        dtype = 'int32' if kind == 'int' else 'float32'
+        names.append(name)
+        formats.append((dtype, shape) if shape else dtype)
+        offsets.append(offset)
+        offset += size
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets,
+                     'itemsize': -(-offset // 16) * 16})
+
+
+## Uniform block.
+#
+# A uniform buffer and its mirror. The GL calls must be made with a current
+# context.
+class UniformBlock:
+
+    ## Constructor.
+    #
+    # @param name Name of the block in the shaders.
+    # @param fields List of (name, GLSL type), in the order of the block.
+    # @param binding Binding point.
+    def __init__(self, name, fields, binding):
+        self.name    = name
+        self.binding = binding
+        self.dtype   = std140(fields)
+        ## Bytes of the block.
+        self.raw     = np.zeros(self.dtype.itemsize, dtype=np.uint8)
+        ## Mirror of the block, a view of raw.
+        self.data    = self.raw.view(self.dtype).reshape(())
+        self.dirty   = True
+        ## Number of uploads since creation.
+        self.uploads = 0
+
+        self.buffer = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, self.buffer)
+        gl.glBufferData(gl.GL_UNIFORM_BUFFER, self.raw.nbytes, None, gl.GL_DYNAMIC_DRAW)
+        gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, 0)
+        gl.glBindBufferBase(gl.GL_UNIFORM_BUFFER, binding, self.buffer)
+
+    ## Bind.
+    #
+    # Points the block of a program to the binding point. Programs that do
+    # not use the block are left alone; a block whose size differs from the
+    # mirror (declared with other fields) raises ValueError.
+    #
+    # @param program Program (or shader.ShaderProgram).
+    def bind(self, program):
+        program = getattr(program, 'program', program)
+        index = gl.glGetUniformBlockIndex(program, self.name)
+        if index == gl.GL_INVALID_INDEX:
+            return
+        size = np.zeros(1, dtype=np.int32)
+        gl.glGetActiveUniformBlockiv(program, index, gl.GL_UNIFORM_BLOCK_DATA_SIZE, size)
+        # Drivers differ on whether the padding after the last field counts
+        if -(-int(size[0]) // 16) * 16 != self.raw.nbytes:
+            raise ValueError('Block %s of the program does not match its %d byte mirror' % (self.name, self.raw.nbytes))
+        gl.glUniformBlockBinding(program, index, self.binding)
+
+    ## Set a field.
+    #
+    # @param name Field name.
+    # @param value Number, vector or matrix (row-major).
+    def __setitem__(self, name, value):
+        value = np.asarray(value, dtype=self.dtype[name].base)
+        if not np.array_equal(self.data[name], value):
+            self.data[name] = value
+            self.dirty = True
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    ## Update.
+    #
+    # Sends the mirror to the buffer if a field changed.
+    #
+    # @return Whether the block was sent.
+    def update(self):
+        if not self.dirty:
+            return False
+        gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, self.buffer)
+        gl.glBufferSubData(gl.GL_UNIFORM_BUFFER, 0, self.raw.nbytes, self.raw)
+        gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, 0)
+        self.dirty = False
+        self.uploads += 1
+        return True
+
+
+## Camera block.
+#
+# @return UniformBlock for the Camera block, at CAMERA_BINDING.
+def cameraBlock():
+    return UniformBlock('Camera', CAMERA_FIELDS, CAMERA_BINDING)
+
+
+## Light block.
+#
+# @return UniformBlock for the Lights block, at LIGHT_BINDING.
+def lightBlock():
+    return UniformBlock('Lights', LIGHT_FIELDS, LIGHT_BINDING)
@@ -0,0 +1,155 @@
+## @file vertexcache.py
+# Vertex cache optimization.
+#
+# Reorders the triangles of an index buffer for the post-transform vertex
+# cache with the Tipsify algorithm (Sander, Nehab and Barczak, "Fast
+# Triangle Reordering for Vertex Locality and Reduced Overdraw", 2007), and
+# then renumbers the vertices in order of first use, so vertex fetches walk
+# the vertex buffer forward.
+#
+# @author Mateus Raganhan Figênio
+
+import numpy as np
+
+## Version of the triangle and vertex order, part of the cache key of the
+## meshes that use it.
+VCACHE_VERSION = 1
+## Size of the simulated FIFO vertex cache.
+CACHE_SIZE = 16
+
+
+## Average cache miss ratio.
+#
+# Simulates a FIFO post-transform cache over an index buffer.
+#
+# @param indices Triangle index array.
+# @param cache_size Number of entries of the cache.
+# @return Misses per triangle (between 0.5 and 3 for typical meshes).
+def acmr(indices, cache_size=CACHE_SIZE):
+    if len(indices) == 0:
+        return 0.0
+
+    # A vertex is in the FIFO while fewer than cache_size misses happened
+    # after the miss that brought it in
+    entered = dict()
+    misses = 0
+    for v in indices.tolist():
+        t = entered.get(v)
+        if t is None or misses - t >= cache_size:
+            entered[v] = misses
+            misses += 1
+    return misses / (len(indices) / 3.0)
+
+
+## Tipsify.
+#
+# Reorders the triangles of an index buffer for a vertex cache of the given
+# size. Runs in time linear in the number of triangles.
+#
+# @param indices Triangle index array.
+# @param nverts Number of vertices.
+# @param cache_size Number of entries of the cache.
+# @return Index array with the triangles reordered (same type).
+def tipsify(indices, nverts, cache_size=CACHE_SIZE):
+    tris = indices.reshape(-1, 3)
+    ntris = len(tris)
+    if ntris == 0:
+        return indices.copy()
+
+    # Triangles of each vertex, in compressed rows
+    corner_tri = np.repeat(np.arange(ntris), 3)
+    order = np.argsort(tris.ravel(), kind='stable')
+    adj_tri = corner_tri[order].tolist()
+    adj_start = np.concatenate([[0], np.cumsum(np.bincount(tris.ravel(), minlength=nverts))]).tolist()
+
+    tri_list = tris.tolist()
+    live = np.bincount(tris.ravel(), minlength=nverts).tolist()
+    stamp = [0] * nverts
+    emitted = [False] * ntris
+    dead_end = list()
+    out = list()
+
+    k = cache_size
+    time = k + 1
+    cursor = 0
+    fan = int(tris[0, 0])
+
+    while fan >= 0:
+        candidates = list()
+        for t in adj_tri[adj_start[fan]:adj_start[fan + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            out.append(t)
+            for v in tri_list[t]:
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time - stamp[v] > k:
+                    stamp[v] = time
+                    time += 1
+
+        # Next fanning vertex: the candidate that will still be in the cache
+        # after its remaining triangles are emitted, the oldest one first
+        fan = -1
+        best = -1
+        for v in candidates:
+            if live[v] > 0:
+                p = 0
+                if time - stamp[v] + 2*live[v] <= k:
+                    p = time - stamp[v]
+                if p > best:
+                    best = p
+                    fan = v
+
+        if fan == -1:
+            while dead_end:
+                v = dead_end.pop()
+                if live[v] > 0:
+                    fan = v
+                    break
+        if fan == -1:
+            while cursor < nverts:
+                if live[cursor] > 0:
+                    fan = cursor
+                    break
+                cursor += 1
+
+    return tris[np.asarray(out)].ravel().astype(indices.dtype)
+
+
+## Reorder vertices.
+#
+# Renumbers the vertices in order of first use by the index buffer. Unused
+# vertices go to the end.
+#
+# @param indices Triangle index array.
+# @param nverts Number of vertices.
+# @return Tuple (remap, indices), where remap[i] is the old number of the new
+# vertex i, so the vertex array is reordered with vertices[remap].
+def reorderVertices(indices, nverts):
+    first = np.full(nverts, len(indices), dtype='int64')
+    np.minimum.at(first, indices, np.arange(len(indices)))
+    remap = np.argsort(first, kind='stable')
+    rank = np.empty(nverts, dtype='int64')
+    rank[remap] = np.arange(nverts)
+    return remap, rank[indices].astype(indices.dtype)
+
+
+## Optimize.
+#
+# Reorders triangles with tipsify (kept only if it lowers the ACMR) and then
+# the vertices by first use.
+#
+# @param indices Triangle index array.
+# @param nverts Number of vertices.
+# @param cache_size Number of entries of the cache.
+# @return Tuple (remap, indices, acmr before, acmr after); see reorderVertices.
+def optimize(indices, nverts, cache_size=CACHE_SIZE):
+    before = acmr(indices, cache_size)
+    reordered = tipsify(indices, nverts, cache_size)
+    after = acmr(reordered, cache_size)
+    if after >= before:
+        reordered, after = indices, before
+    remap, reordered = reorderVertices(reordered, nverts)
+    return remap, reordered, before, after
@@ -0,0 +1,180 @@
+## @file vertexformat.py
+# Vertex formats.
+#
+# Builds vertex buffers in one of two formats:
+#   'float':  position and normal as float32 (12 + 12 bytes);
+#   'packed': position as normalized int16 relative to the bounding box, plus
+#             one int16 of padding, and normal as GL_INT_2_10_10_10_REV
+#             (8 + 4 bytes).
+# Texture coordinates, when present, follow as two float32 in both formats
+# (8 bytes), since they may repeat the texture outside [0, 1].
+# The packed positions are mapped back to object space by a dequantization
+# matrix, meant to be multiplied into the model matrix.
+#
+# @author Mateus Raganhan Figênio
+
+import numpy as np
+import OpenGL.GL as gl
+
+## Version of the built vertices and of the format choice, part of the cache
+## key of the meshes that use them.
+FORMAT_VERSION = 2
+## Largest value of a normalized int16.
+INT16_MAX = 32767
+## Largest value of a normalized signed 10 bit integer.
+INT10_MAX = 511
+## Smallest vertex count for which the packed format is chosen.
+MIN_PACKED_VERTICES = 1024
+## Largest quantization error, relative to the shortest edge of the mesh.
+TOLERANCE = 1e-2
+
+
+## Quantize positions.
+#
+# Maps positions to normalized int16 relative to their bounding box, or to
+# the box of a previous quantization when they fit in it (up to half a step),
+# so that unchanged positions keep their quantized values.
+#
+# @param positions float array (n, 3).
+# @param D Dequantization matrix of the box to keep, or None.
+# @return Tuple (int16 array (n, 3), 4x4 float32 dequantization matrix).
+def quantizePositions(positions, D=None):
+    lo = positions.min(axis=0).astype('float64')
+    hi = positions.max(axis=0).astype('float64')
+    if D is not None:
+        center = D[:3, 3].astype('float64')
+        half = np.diag(D)[:3].astype('float64')
+        step = half / (2.0 * INT16_MAX)
+        if np.all(lo >= center - half - step) and np.all(hi <= center + half + step):
+            return _quantize(positions, center, half)
+    center = (lo + hi) / 2.0
+    half = (hi - lo) / 2.0
+    half[half == 0.0] = 1.0
+    return _quantize(positions, center, half)
+
+
+def _quantize(positions, center, half):
+    q = np.rint((positions - center) / half * INT16_MAX)
+    q = np.clip(q, -INT16_MAX, INT16_MAX).astype('int16')
+
+    D = np.identity(4, dtype='float32')
+    D[0,0], D[1,1], D[2,2] = half
+    D[:3,3] = center
+    return q, D
+
+
+## Pack normals.
+#
+# Packs unit normals in the GL_INT_2_10_10_10_REV format: x, y and z in the
+# bits 0-9, 10-19 and 20-29 as signed normalized integers.
+#
+# @param normals float array (n, 3).
+# @return uint32 array (n,).
+def packNormals(normals):
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    unit = normals / np.where(length > 0.0, length, 1.0)
+    q = np.rint(np.clip(unit, -1.0, 1.0) * INT10_MAX).astype('int32') & 0x3FF
+    return (q[:, 0] | (q[:, 1] << 10) | (q[:, 2] << 20)).astype('uint32')
+
+
+## Choose format.
+#
+# Chooses the packed format for meshes big enough to profit from it, when the
+# largest quantization error (half a step of the int16 grid over the bounding
+# box) is within TOLERANCE of the shortest edge, so that no triangle is
+# visibly distorted. Degenerate (zero length) edges are ignored.
+#
+# @param positions float array (n, 3).
+# @param indices int array with three indices per triangle, or None when the
+# positions are a triangle soup (three consecutive vertices per triangle).
+# @return 'packed' or 'float'.
+def chooseFormat(positions, indices=None):
+    if len(positions) < MIN_PACKED_VERTICES:
+        return 'float'
+    extent = positions.max(axis=0).astype('float64') - positions.min(axis=0)
+    error = np.linalg.norm(extent / (2.0 * INT16_MAX)) / 2.0
+
+    corners = positions[indices] if indices is not None else positions[:len(positions) - len(positions) % 3]
+    triangles = np.asarray(corners, dtype='float64').reshape(-1, 3, 3)
+    edges = np.linalg.norm(triangles - np.roll(triangles, 1, axis=1), axis=2)
+    edges = edges[edges > 0.0]
+    return 'packed' if len(edges) and error <= TOLERANCE * edges.min() else 'float'
+
+
+## Build vertices.
+#
+# Builds a vertex buffer in the given format.
+#
+# @param positions float array (n, 3).
+# @param normals float array (n, 3), or None.
+# @param fmt 'float' or 'packed'.
+# @param texcoords float array (n, 2), or None.
+# @param D Dequantization matrix of a previous build, whose box is kept
+# when the positions fit in it (see quantizePositions).
+# @return Tuple (uint8 array (n, stride), 4x4 dequantization matrix).
+def buildVertices(positions, normals, fmt, texcoords=None, D=None):
+    n = len(positions)
+    if fmt == 'float':
+        data = [positions.astype('float32')]
+        if normals is not None:
+            data.append(normals.astype('float32'))
+        if texcoords is not None:
+            data.append(texcoords.astype('float32'))
+        vertices = np.ascontiguousarray(np.hstack(data))
+        return vertices.view('uint8').reshape(n, -1), np.identity(4, dtype='float32')
+
+    q, D = quantizePositions(positions, D)
+    fields = [('position', 'int16', 3), ('pad', 'int16')]
+    if normals is not None:
+        fields.append(('normal', 'uint32'))
+    if texcoords is not None:
+        fields.append(('texcoord', 'float32', 2))
+    vertices = np.zeros(n, dtype=fields)
+    vertices['position'] = q
+    if normals is not None:
+        vertices['normal'] = packNormals(normals)
+    if texcoords is not None:
+        vertices['texcoord'] = texcoords
+    return vertices.view('uint8').reshape(n, -1), D
+
+
+## Decode positions.
+#
+# Recovers the positions of a vertex buffer built by buildVertices.
+#
+# @param vertices uint8 array (n, stride).
+# @param fmt 'float' or 'packed'.
+# @param D Dequantization matrix returned by buildVertices.
+# @return float32 array (n, 3), in object space.
+def decodePositions(vertices, fmt, D):
+    n = len(vertices)
+    if fmt == 'float':
+        return vertices.view('float32').reshape(n, -1)[:, :3].copy()
+    q = vertices.view('int16').reshape(n, -1)[:, :3].astype('float32') / INT16_MAX
+    return q * np.diag(D)[:3] + D[:3, 3]
+
+
+## Attributes.
+#
+# Describes the attributes of a vertex buffer built by buildVertices.
+#
+# @param fmt 'float' or 'packed'.
+# @param normals Whether the buffer has normals.
+# @param texcoords Whether the buffer has texture coordinates (location 2).
+# @return Tuple (stride, list of (location, size, type, normalized, offset)).
+def attributes(fmt, normals, texcoords=False):
+    if fmt == 'float':
+        attribs = [(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 0)]
+        if normals:
+            attribs.append((1, 3, gl.GL_FLOAT, gl.GL_FALSE, 12))
+        stride = 12 + 12*normals
+    else:
+        attribs = [(0, 3, gl.GL_SHORT, gl.GL_TRUE, 0)]
+        if normals:
+            attribs.append((1, 4, gl.GL_INT_2_10_10_10_REV, gl.GL_TRUE, 8))
+        stride = 8 + 4*normals
+
+    if texcoords:
+        attribs.append((2, 2, gl.GL_FLOAT, gl.GL_FALSE, stride))
+        stride += 8
+    return stride, attribs
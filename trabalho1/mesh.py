@@ -8,6 +8,8 @@ import OpenGL.GLUT as glut
 import utils as ut
 
 sys.path.append('../lib/')
+import objloader as ol
+import meshcache as mc
 
 from ctypes import c_void_p
 
@@ -249,9 +251,26 @@ def rotate(axis, angle=10.0):
     translate(x, y, z)
 
 
+# Método que lê o arquivo obj e monta os arrays de vértices e de faces
+# (o resultado é guardado no cache de malhas, em arquivo ao lado do obj)
+def parse_obj(obj_name):
+    mesh = ol.loadObj(obj_name)
+
+    arrays = {
+        'vertices': mesh.positions.ravel(),
+        'faces': mesh.corners[:, 0].astype('uint32'),
+    }
+    meta = {
+        'bounds_min': mesh.bounds_min.tolist(),
+        'bounds_max': mesh.bounds_max.tolist(),
+        'obj_center': mesh.center().tolist(),
+        'normal': mesh.hasNormals(),
+    }
+    return arrays, meta
+
+
 def load_obj():
     obj_name = sys.argv[1]
-    obj_file = open(obj_name)
     print("Input argument:", obj_name)
 
     global vertices
@@ -267,64 +286,19 @@ def load_obj():
     global y_max
     global z_max
 
-    # Lista temporária para salvar as faces
-    faces_list = list()
-
-    # For que itera nas linha do arquivo
-    for line in obj_file:
-        # Caso a linha descreva um vértice
-        if line[:2] == "v ":
-            # Cada coordenada de vértice é separada e adicionada ao array de vértices
-            v_values = line[1:].split()
-            vertices = np.append(vertices, np.asarray(v_values, dtype='float32'))
-
-            # Validamos se algumas das coordenadas é um ponto mais extremo do objeto
-            if float(v_values[0]) > x_max:
-                x_max = float(v_values[0])
-            if float(v_values[0]) < x_min:
-                x_min = float(v_values[0])
-            if float(v_values[1]) > y_max:
-                y_max = float(v_values[1])
-            if float(v_values[1]) < y_min:
-                y_min = float(v_values[1])
-            if float(v_values[2]) > z_max:
-                z_max = float(v_values[2])
-            if float(v_values[2]) < z_min:
-                z_min = float(v_values[2])
-
-        # Caso a linha descreva uma face
-        elif line[:2] == 'f ':
-            # Cada valor de face é separado
-            f_values = line[1:].split()
-
-            for v in f_values:
-                if '/' in v: # Caso hajam mais valores do que apenas o índice da coordenada
-                    v_index  = v.split('/')[0] # Separamos o valor da coordenada
-                    # v_color  = v.split('/')[1]
-                    # v_normal = v.split('/')[2]
-            
-                    # Atribuimos o valor da coordenada da face à lista de faces
-                    if v_index:
-                        faces = faces_list.append(int(v_index)-1)
-                    # if vt:
-                    #     np.append(int(vt))
-                    # if v_normal:
-                    #     np.append(int(vn))
-                else: faces_list.append(int(v)-1)
-
-    # Atribuímos a lista de faces para o array no formato int
-    faces = np.asarray(faces_list, dtype='uint32')
+    # Leitura do arquivo (ou do cache, se o obj não mudou)
+    arrays, meta = mc.loadCached(obj_name, 'trabalho1', parse_obj)
+    vertices = arrays['vertices']
+    faces = arrays['faces']
+
+    x_min, y_min, z_min = meta['bounds_min']
+    x_max, y_max, z_max = meta['bounds_max']
 
     # As coordenadas de centro recebem o ponto médio dos mínimos e máximos do objeto em cada eixo
-    obj_center = [(x_max+x_min)/2, (y_max+y_min)/2, (z_max+z_min)/2]
+    obj_center = list(meta['obj_center'])
 
     num_element_vertices = len(faces)
 
-    # print("Vertices:\n", vertices)
-    # print("Faces:\n", faces)
-    # print("Número de vértices", num_element_vertices)
-    # print("Coordenadas do centro do objeto", obj_center)
-
 
 
 def initData():
@@ -7,17 +7,32 @@
 # @author Mateus Raganhan Figênio
 
 
+import os
 import sys
+import time
 import ctypes
 import numpy as np
 import OpenGL.GL as gl
 import OpenGL.GLUT as glut
 import utils as ut
 
-from PIL import Image
 from ctypes import c_void_p
 
 sys.path.append('../lib/')
+import objloader as ol
+import meshcache as mc
+import asyncload as al
+import vertexformat as vf
+import vertexcache as vc
+import simplify as sp
+import normals as nm
+import bvh
+import culling as cl
+import texture as tx
+import mipmap as mm
+import pbo
+import hotreload as hr
+import shader as sh
 
 
 ### --- VARIÁVEIS GLOBAIS --- ###
@@ -34,10 +49,62 @@ operation = ''
 vertex_array = np.array([], dtype='float32')
 ## Número de vértices
 vertex_number = None
+## Numpy Index Array (geometria indexada)
+index_array = np.array([], dtype='uint32')
+## Se a malha é desenhada indexada (glDrawElements) ou expandida (glDrawArrays)
+indexado = True
+## Se a ordem dos triângulos é otimizada para o cache de vértices (geometria indexada)
+otimizar_cache = True
+## Se são gerados níveis de detalhe simplificados da malha (geometria indexada)
+gerar_lods = True
+## Níveis de detalhe: [início, número de índices] de cada nível no index array
+lods = list()
+## Nível de detalhe desenhado no último quadro
+nivel_atual = 0
+## Raio da esfera envolvente do objeto
+raio_malha = 0.0
+## Caixa e esfera envolventes do objeto (lo, hi, centro, raio), para o descarte por frustum
+limites_malha = None
+## Contadores de objetos desenhados e descartados
+descarte = cl.CullStats()
+## Se são calculadas normais suaves para objs sem registros vn
+gerar_normais = True
+## Ângulo, em graus, a partir do qual uma aresta divide as normais calculadas (None para suavizar tudo)
+angulo_vinco = None
+## Teto de memória, em bytes, para a leitura do obj (None para sem limite)
+memoria_maxima = None
+## Número de processos na leitura do obj (None para um por CPU)
+processos = None
+## Formato dos vértices: 'float', 'packed' (int16 + 2_10_10_10) ou None para escolher por malha
+formato = None
+## Formato escolhido para a malha carregada
+formato_malha = 'float'
+## Matriz que leva as posições quantizadas de volta para o espaço do objeto
+dequantizacao = np.identity(4, dtype='float32')
 ## Se o obj carregado tem ou não normal
 normal = False
+## Se as coordenadas de textura (vt) do obj são usadas, quando todos os cantos têm uma
+usar_uv = True
+## Se a malha carregada tem coordenadas de textura (sem elas a textura é
+## projetada como um cubemap, a partir da posição)
+uv_malha = False
 ## Flag de se o programa vai aplicar ou não a textura
 uso_textura = False
+## Imagens da pasta da textura inicial, percorridas com 'n' e 'p'
+imagens = list()
+## Posição da textura atual em imagens
+imagem_atual = 0
+## Memória de GPU, em bytes, das texturas mantidas carregadas
+memoria_texturas = 8 << 20
+## Texturas carregadas na GPU (as menos usadas recentemente saem quando passam da memória,
+## menos a da tela, fixada), com todos os níveis de mipmap calculados na CPU e guardados em cache
+texturas = tx.TextureCache(memoria_texturas, load=mm.loadMipmaps)
+## Envio das texturas novas em partes, por pixel buffer objects (criado na primeira troca)
+envio = None
+## Início do envio de cada textura ainda não completa
+enviando = dict()
+## Intervalo, em ms, entre as partes enviadas
+INTERVALO_ENVIO = 16
 
 ## Matriz de transformações iniciada como matriz identidade
 M = np.identity(4, dtype='float32')
@@ -54,20 +121,43 @@ y_max = sys.float_info.min
 z_max = sys.float_info.min
 
 
-## Variável do programa
+## Variável do programa (sh.ShaderProgram)
 program = None
 ## Vertex Array Object
 VAO = None
 ## Vertex Buffer Object
 VBO = None
+## Element Buffer Object
+EBO = None
 ## Vertex Texture Object
 VTO = None
+## BVH dos triângulos do nível de detalhe 0 (construída no primeiro clique)
+bvh_malha = None
+## Se o obj é recarregado quando o arquivo muda
+recarregar = True
+## Intervalo, em ms, entre as verificações do arquivo
+INTERVALO_RECARGA = 250
+## Blocos já lidos do obj, reaproveitados na recarga (lidos só na primeira
+## mudança do arquivo)
+malha_incremental = None
+## Se a primeira leitura em blocos do obj está numa thread
+lendo_recarga = False
+## Observador do arquivo obj
+observador = None
+## Cópias na CPU do VBO e do EBO, para enviar só os trechos alterados
+espelho_vbo = None
+espelho_ebo = None
+## Carregador que lê o obj e a textura em threads separadas
+loader = None
+## Se o tempo até o primeiro quadro já foi informado
+primeiro_quadro = False
 
 ## Vertex shader.
 vertex_code = """
 #version 330 core
 layout (location = 0) in vec3 position;
 layout (location = 1) in vec3 normal;
+layout (location = 2) in vec2 texcoord;
 
 uniform mat4 inverse;
 uniform mat4 model;
@@ -79,6 +169,7 @@ out vec3 vNormal;
 out vec3 fragPosition;
 out vec3 LightPos;
 out vec3 TexCoords;
+out vec2 UV;
 
 void main()
 {
@@ -87,6 +178,7 @@ void main()
     vNormal = mat3(inverse) * normal;
     LightPos = vec3(view * vec4(lightPosition, 1.0));
     TexCoords = position;
+    UV = texcoord;
 }
 """
 
@@ -97,14 +189,41 @@ in vec3 vNormal;
 in vec3 fragPosition;
 in vec3 LightPos;
 in vec3 TexCoords;
+in vec2 UV;
 
 out vec4 fragColor;
 
 uniform vec3 objectColor;
 uniform vec3 lightColor;
 uniform vec3 cameraPosition;
-uniform samplerCube cubemap;
+uniform sampler2D textura;
 uniform bool texture_flag;
+uniform bool uv_flag;
+
+// Amostra de um cubemap com a mesma imagem nas seis faces: a face é o eixo
+// dominante de r e (s, t) seguem a tabela de faces do OpenGL, com t
+// invertido porque a primeira linha da textura é a de baixo da imagem. As
+// derivadas são as de r levadas para a face, para que o nível de mipmap não
+// salte nas arestas entre faces
+vec4 cubeTexture(vec3 r, vec3 drdx, vec3 drdy)
+{
+    vec3 a = abs(r);
+    vec3 s, t;
+    float m;
+    if (a.x >= a.y && a.x >= a.z) {
+        s = vec3(0.0, 0.0, -sign(r.x)); t = vec3(0.0, 1.0, 0.0); m = a.x;
+    } else if (a.y >= a.z) {
+        s = vec3(1.0, 0.0, 0.0); t = vec3(0.0, 0.0, -sign(r.y)); m = a.y;
+    } else {
+        s = vec3(sign(r.z), 0.0, 0.0); t = vec3(0.0, 1.0, 0.0); m = a.z;
+    }
+    vec2 st = 0.5 * vec2(dot(s, r), dot(t, r)) / m + 0.5;
+    vec2 dx = 0.5 * vec2(dot(s, drdx), dot(t, drdx)) / m;
+    vec2 dy = 0.5 * vec2(dot(s, drdy), dot(t, drdy)) / m;
+    // Sem repetição nas bordas das faces (como GL_CLAMP_TO_EDGE)
+    vec2 half_texel = 0.5 / vec2(textureSize(textura, 0));
+    return textureGrad(textura, clamp(st, half_texel, 1.0 - half_texel), dx, dy);
+}
 
 void main()
 {
@@ -127,71 +246,144 @@ void main()
 
     vec3 light = (ambient + diffuse + specular) * objectColor;  
     fragColor = vec4(light, 1.0);
+    vec3 drdx = dFdx(TexCoords);
+    vec3 drdy = dFdy(TexCoords);
     if (texture_flag) {
-        fragColor = texture(cubemap, TexCoords) * fragColor;
+        vec4 texel = uv_flag ? texture(textura, UV) : cubeTexture(TexCoords, drdx, drdy);
+        fragColor = texel * fragColor;
     }
 }
 """
 
+## Camera.
+#
+# @return Tuple (distância da câmera, view, projection).
+def camera():
+    # Um cálculo para variar o z de translação da view e da distância de fundo
+    # da caixa de projeção, para o tamanho de cada objeto
+    z_dist = (y_max-y_min)*4.0/np.tan(fovy)
+    view = ut.matTranslate(0.0, 0.0, -z_dist)
+    projection = ut.matPerspective(fovy, win_width/win_height, 0.1, int(z_dist*3))
+    return z_dist, view, projection
+
 ## Drawing function.
 #
 # Draws primitive.
 def display():
+    global primeiro_quadro, nivel_atual
 
     gl.glClearColor(0.2, 0.3, 0.3, 1.0)
     gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
 
-    gl.glUseProgram(program)
+    # Enquanto a malha não foi enviada para a GPU a janela fica só com o fundo
+    if VAO is None:
+        glut.glutSwapBuffers()
+        return
+
+    program.use()
     gl.glBindVertexArray(VAO)
 
+    # Os uniforms só são enviados quando mudam de valor (as matrizes são
+    # passadas como o utils as monta, sem transpor)
     # Aplicação da matriz de transformações no modelo e passando ele para o Vertex Shader
-    loc = gl.glGetUniformLocation(program, "model")
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, M.transpose())
-
-    # Um cálculo para variar o z de translação da view e da distância de fundo
-    # da caixa de projeção, para o tamanho de cada objeto
-    z_dist = (y_max-y_min)*4.0/np.tan(fovy)
+    # (com a dequantização das posições, caso o formato seja 'packed')
+    program.set("model", np.matmul(M, dequantizacao))
 
-    # Definição da visão
-    view = ut.matTranslate(0.0, 0.0, -z_dist)
-    loc = gl.glGetUniformLocation(program, "view")
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, view.transpose())
-
-    # Aplicação da projeção
-    projection = ut.matPerspective(fovy, win_width/win_height, 0.1, int(z_dist*3))
-    loc = gl.glGetUniformLocation(program, "projection")
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, projection.transpose())
+    # Definição da visão e aplicação da projeção
+    z_dist, view, projection = camera()
+    program.set("view", view)
+    program.set("projection", projection)
 
     # Adjust Normals
-    loc = gl.glGetUniformLocation(program, "inverse")
-    gl.glUniformMatrix4fv(loc, 1, gl.GL_FALSE, M.transpose())
+    program.set("inverse", M)
 
     # Object color. (com cor diferente caso não seja ativada a textura)
-    loc = gl.glGetUniformLocation(program, "objectColor")
-    if uso_textura: gl.glUniform3f(loc, 1.0, 1.0, 1.0)
-    else: gl.glUniform3f(loc, 0.8, 0.0, 0.0)
+    if uso_textura: program.set("objectColor", (1.0, 1.0, 1.0))
+    else: program.set("objectColor", (0.8, 0.0, 0.0))
     # Light color.
-    loc = gl.glGetUniformLocation(program, "lightColor")
-    gl.glUniform3f(loc, 1.0, 1.0, 1.0)
+    program.set("lightColor", (1.0, 1.0, 1.0))
     # Light position.
-    loc = gl.glGetUniformLocation(program, "lightPosition")
-    gl.glUniform3f(loc, 2*float(x_max), float(y_max), float(z_dist)) # gl.glUniform3f(loc, 1.0, 0.0, 2.0)
+    program.set("lightPosition", (2*float(x_max), float(y_max), float(z_dist)))
     # Camera position.
-    loc = gl.glGetUniformLocation(program, "cameraPosition")
-    gl.glUniform3f(loc, 0.0, 0.0, 0.0)
+    program.set("cameraPosition", (0.0, 0.0, 0.0))
 
-    # Binds Texture 
-    gl.glBindTexture(gl.GL_TEXTURE_CUBE_MAP, VTO)
+    # Binds Texture (0 enquanto a imagem ainda está sendo decodificada)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, VTO if VTO is not None else 0)
 
     # Set texture use
-    loc = gl.glGetUniformLocation(program, "texture_flag")
-    gl.glUniform1f(loc, uso_textura)
-
-    gl.glDrawArrays(gl.GL_TRIANGLES, 0, vertex_number)
+    program.set("texture_flag", uso_textura)
+    # Coordenadas de textura do obj ou projeção de cubemap
+    program.set("uv_flag", uv_malha)
+    if program.endFrame():
+        print('Uniforms enviados: %d, repetidos: %d' % (program.frame_uploads, program.frame_skips))
+
+    # Descarte por frustum: planos tirados de projection * view * M (os
+    # limites estão no espaço do objeto, antes da dequantização)
+    visivel = cl.visible(np.matmul(np.matmul(projection, view), M), *limites_malha)
+    if descarte.update(visivel):
+        print('Objetos desenhados: %d, descartados: %d' % (descarte.drawn, descarte.culled))
+
+    if visivel[0] and indexado:
+        # Tipo dos índices escolhido pelo número de vértices da malha
+        if index_array.dtype == np.uint16: index_type = gl.GL_UNSIGNED_SHORT
+        else: index_type = gl.GL_UNSIGNED_INT
+
+        # Nível de detalhe escolhido pelo tamanho projetado da esfera envolvente
+        raio = raio_malha * np.linalg.norm(M[:3, :3], axis=0).max()
+        distancia = np.linalg.norm([obj_center[0], obj_center[1], obj_center[2] - z_dist])
+        nivel = sp.selectLod([n // 3 for _, n in lods], raio, distancia, fovy, win_height)
+        if nivel != nivel_atual:
+            nivel_atual = nivel
+            print('Nível de detalhe %d (%d triângulos)' % (nivel, lods[nivel][1] // 3))
+
+        inicio, n = lods[nivel]
+        gl.glDrawElements(gl.GL_TRIANGLES, n, index_type, c_void_p(inicio*index_array.itemsize))
+    elif visivel[0]:
+        gl.glDrawArrays(gl.GL_TRIANGLES, 0, vertex_number)
     gl.glBindVertexArray(0)
 
     glut.glutSwapBuffers()
 
+    if not primeiro_quadro:
+        primeiro_quadro = True
+        print('Tempo até o primeiro quadro: %.1f ms' % (1000*loader.elapsed()))
+
+
+## Idle function.
+#
+# Envia para a GPU os dados que as threads de leitura terminaram.
+def idle():
+    if loader.poll():
+        glut.glutPostRedisplay()
+    if loader.finished():
+        for name, t in loader.times.items():
+            print('%s pronto em %.1f ms' % (name, 1000*t))
+        glut.glutIdleFunc(None)
+    else:
+        time.sleep(0.001)
+
+## Submit asset.
+#
+# Lê um asset numa thread do loader depois da carga inicial. Se o loader
+# estava parado, um timer volta a consultá-lo até a leitura terminar.
+#
+# @param nome Nome do asset.
+# @param on_ready Chamada com o resultado, nesta thread.
+# @param load Função rodada na thread.
+def submitAsset(nome, on_ready, load, *args):
+    parado = loader.finished()
+    loader.submit(nome, on_ready, load, *args)
+    if parado:
+        glut.glutTimerFunc(INTERVALO_ENVIO, pollAssets, 0)
+
+## Poll assets.
+#
+# Timer que roda os callbacks das leituras terminadas.
+def pollAssets(value):
+    loader.poll()
+    if not loader.finished():
+        glut.glutTimerFunc(INTERVALO_ENVIO, pollAssets, 0)
+
 
 ## Reshape function.
 # 
@@ -229,6 +421,14 @@ def keyboard(key, x, y):
         uso_textura = True
         print('Textura habilitada')
         glut.glutPostRedisplay()
+    # Troca de textura (a próxima ou a anterior da pasta)
+    elif key == b'n':
+        switch_texture(1)
+    elif key == b'p':
+        switch_texture(-1)
+    # Carrega no cache as imagens vizinhas, para as próximas trocas serem só um bind
+    elif key == b'c':
+        prefetch_textures()
     # Seleção de operação
     elif key == b't':
         operation = 'translate'
@@ -250,6 +450,151 @@ def keyboard(key, x, y):
         handle_operation(key)
 
 
+## Switch texture.
+#
+# Passa para outra imagem da pasta da textura. Enquanto estiver no cache, a
+# troca é só um bind. Na primeira vez a imagem é decodificada numa thread do
+# loader e enviada em partes, alguns quadros seguidos, e a textura anterior
+# continua na tela até o envio acabar.
+#
+# @param passo Quantas imagens avançar na lista.
+def switch_texture(passo):
+    global imagem_atual
+    if VTO is None or not imagens:
+        return
+    imagem_atual = (imagem_atual + passo) % len(imagens)
+    nome = imagens[imagem_atual]
+    if nome in texturas:
+        show_texture(nome)
+        print('Textura %s (bind): %s' % (os.path.basename(nome), texturas))
+    elif nome not in enviando:
+        request_texture(nome)
+
+## Show texture.
+#
+# Passa para a tela uma textura do cache, fixada nele enquanto estiver na
+# tela (a anterior pode voltar a sair para dar lugar a outras).
+#
+# @param nome Arquivo da imagem.
+def show_texture(nome):
+    global VTO
+    VTO = texturas.get(nome)
+    texturas.pinned = {nome}
+    glut.glutPostRedisplay()
+
+## Request texture.
+#
+# Decodifica uma imagem que não está no cache numa thread do loader; ao fim
+# ela é enviada em partes por stream_texture.
+#
+# @param nome Arquivo da imagem.
+def request_texture(nome):
+    texturas.misses += 1
+    enviando[nome] = time.perf_counter()
+    submitAsset('textura ' + nome, lambda niveis: stream_texture(nome, niveis), texturas.load, nome)
+
+## Stream texture.
+#
+# Chamada quando a imagem foi decodificada: começa o envio em partes.
+#
+# @param nome Arquivo da imagem.
+# @param niveis Níveis de mipmap da imagem.
+def stream_texture(nome, niveis):
+    global envio
+    if envio is None:
+        envio = pbo.TextureStreamer()
+    if not envio.pending():
+        glut.glutTimerFunc(INTERVALO_ENVIO, upload_step, 0)
+    envio.submit(niveis, lambda textura: texture_ready(nome, textura, niveis))
+    print('Textura %s lida em %.1f ms, enviando' % (os.path.basename(nome), 1000*(time.perf_counter() - enviando[nome])))
+
+## Prefetch textures.
+#
+# Pede a imagem anterior e a próxima da pasta que ainda não estão no cache,
+# decodificadas nas threads do loader e enviadas em partes como na troca, sem
+# parar a thread do GLUT.
+def prefetch_textures():
+    if VTO is None or len(imagens) < 2:
+        return
+    vizinhas = [imagens[(imagem_atual + passo) % len(imagens)] for passo in (1, -1)]
+    vizinhas = [nome for nome in dict.fromkeys(vizinhas) if nome not in texturas and nome not in enviando]
+    for nome in vizinhas:
+        request_texture(nome)
+    if vizinhas:
+        print('Pré-carregando %s' % ', '.join(os.path.basename(n) for n in vizinhas))
+
+## Upload step.
+#
+# Timer que envia a próxima parte das texturas em envio.
+def upload_step(value):
+    envio.step()
+    if envio.pending():
+        glut.glutTimerFunc(INTERVALO_ENVIO, upload_step, 0)
+
+## Texture ready.
+#
+# Chamada quando todas as partes de uma textura chegaram à GPU: ela passa para
+# o cache e, se ainda é a imagem escolhida (e não uma vizinha pré-carregada),
+# para a tela. A textura da tela está fixada no cache, então a nova nunca a
+# tira de lá.
+#
+# @param nome Arquivo da imagem.
+# @param textura Texture object.
+# @param niveis Níveis de mipmap da imagem.
+def texture_ready(nome, textura, niveis):
+    texturas.adopt(nome, textura, tx.textureBytes(niveis))
+    print('Textura %s enviada em %.1f ms: %s' % (os.path.basename(nome),
+                                                 1000*(time.perf_counter() - enviando.pop(nome)), texturas))
+    if nome == imagens[imagem_atual]:
+        show_texture(nome)
+
+## Mouse function.
+#
+# Seleciona com o botão esquerdo o triângulo sob o cursor, lançando um raio
+# da câmera na BVH da malha.
+#
+# @param button Mouse button.
+# @param state Button state.
+# @param x Mouse x coordinate.
+# @param y Mouse y coordinate.
+def mouse(button, state, x, y):
+    global bvh_malha
+
+    if button != glut.GLUT_LEFT_BUTTON or state != glut.GLUT_DOWN or VAO is None:
+        return
+
+    # BVH sobre as posições do nível 0, no espaço do modelo (já dequantizadas)
+    if bvh_malha is None:
+        inicio = time.perf_counter()
+        positions = vf.decodePositions(vertex_array, formato_malha, dequantizacao)
+        if indexado:
+            indices = index_array[lods[0][0]:lods[0][0] + lods[0][1]]
+        else:
+            indices = np.arange(vertex_number)
+        bvh_malha = bvh.BVH(positions, indices)
+        print('BVH: %d nós em %.1f ms' % (bvh_malha.size(), 1000*(time.perf_counter() - inicio)))
+
+    # Raio do plano near ao plano far passando pelo pixel, levado para o
+    # espaço do modelo pela inversa de projection * view * M
+    w = glut.glutGet(glut.GLUT_WINDOW_WIDTH)
+    h = glut.glutGet(glut.GLUT_WINDOW_HEIGHT)
+    ndc_x, ndc_y = 2.0*x/w - 1.0, 1.0 - 2.0*y/h
+    _, view, projection = camera()
+    inv = np.linalg.inv(projection @ view @ M)
+    near = inv @ [ndc_x, ndc_y, -1.0, 1.0]
+    far = inv @ [ndc_x, ndc_y, 1.0, 1.0]
+    origin, target = near[:3]/near[3], far[:3]/far[3]
+
+    inicio = time.perf_counter()
+    t, triangulo = bvh_malha.pick(origin, target - origin)
+    duracao = 1e6*(time.perf_counter() - inicio)
+    if triangulo < 0:
+        print('Nenhum triângulo (%.0f us)' % duracao)
+    else:
+        ponto = origin + t*(target - origin)
+        print('Triângulo %d em (%.3f, %.3f, %.3f) (%.0f us)' % (triangulo, ponto[0], ponto[1], ponto[2], duracao))
+
+
 def handle_operation(key):
     global operation
     unit = 0.01*max(x_max, y_max, z_max)
@@ -339,99 +684,222 @@ def rotate(axis, angle=10.0):
 
     translate(x, y, z)
 
+# Método que lê o arquivo obj e monta os arrays usados pelo programa
+# (o resultado é guardado no cache de malhas, em arquivo ao lado do obj)
+def parse_obj(obj_name):
+    # O arquivo é lido em blocos e convertido direto para arrays numpy
+    # (arquivos grandes são divididos entre vários processos)
+    mesh = ol.loadObj(obj_name, max_memory=memoria_maxima, processes=processos)
+    return build_arrays(mesh, gerar_lods)
+
+# Método que monta os arrays usados pelo programa a partir da malha lida
+# (com_lods diz se são gerados os níveis de detalhe simplificados; na
+# recarga a ordem para o cache não é refeita e o formato, a caixa de
+# quantização e a ordem dos vértices e triângulos carregados são mantidos,
+# para só os trechos alterados irem para a GPU)
+def build_arrays(mesh, com_lods, recarga=False):
+    # Normais ponderadas pela área das faces quando o arquivo não traz vn
+    # (sem elas o atributo 1 do shader ficaria desabilitado)
+    if gerar_normais and not mesh.hasNormals():
+        mesh = nm.generateNormals(mesh, angulo_vinco)
+
+    # Colunas do vertex array: posição, normal e coordenada de textura
+    uv = usar_uv and mesh.hasTexcoords()
+    colunas = 3 + 3*mesh.hasNormals() + 2*uv
+
+    acmr = None
+    niveis_lod = None
+    if indexado:
+        # Vértices únicos por (v, vt, vn) e índices dos triângulos
+        vertices, indices = ol.indexedArrays(mesh, texcoords=uv)
+        vertices = vertices.reshape(-1, colunas)
+        niveis = [(vertices, indices)]
+
+        # Níveis de detalhe simplificados por métricas de erro quádrico
+        # (o agrupamento de vértices mistura as coordenadas de textura dos
+        # dois lados das costuras, então malhas com vt ficam só no nível 0)
+        if com_lods and not uv:
+            normals = vertices[:, 3:] if mesh.hasNormals() else None
+            chain = sp.lodChain(vertices[:, :3], normals, indices)
+            niveis += [(p if n is None else np.hstack([p, n]), i) for p, n, i in chain[1:]]
+
+        # Todos os níveis ficam no mesmo vertex array e no mesmo index array
+        partes_v, partes_i, niveis_lod = [], [], []
+        base = inicio = 0
+        for nivel, (v, i) in enumerate(niveis):
+            if otimizar_cache and not recarga:
+                # Triângulos reordenados para o cache pós-transformação e
+                # vértices reordenados pelo primeiro uso
+                remap, i, antes, depois = vc.optimize(i, len(v))
+                v = v[remap]
+                if nivel == 0:
+                    acmr = [antes, depois]
+            partes_v.append(v)
+            partes_i.append(i.astype('int64') + base)
+            niveis_lod.append([inicio, len(i)])
+            base += len(v)
+            inicio += len(i)
+
+        vertices = np.vstack(partes_v)
+        indices = np.concatenate(partes_i).astype('uint16' if base <= 1 << 16 else 'uint32')
+        arrays = {'index_array': indices}
+    else:
+        vertices = ol.vertexArray(mesh, texcoords=uv).reshape(-1, colunas)
+        arrays = {}
+
+    # Conversão para o formato de vértices escolhido
+    positions = vertices[:, :3]
+    normals = vertices[:, 3:6] if mesh.hasNormals() else None
+    texcoords = vertices[:, colunas - 2:] if uv else None
+    fmt = formato or vf.chooseFormat(positions, arrays.get('index_array'))
+    if recarga and not formato and formato_malha == 'float':
+        # Na recarga o formato só muda quando 'packed' deixa de servir
+        fmt = 'float'
+    D = dequantizacao if recarga else None
+    arrays['vertex_array'], D = vf.buildVertices(positions, normals, fmt, texcoords, D)
+    if recarga and indexado:
+        arrays['vertex_array'], arrays['index_array'] = keep_order(arrays['vertex_array'], arrays['index_array'])
+
+    meta = {
+        'bounds_min': mesh.bounds_min.tolist(),
+        'bounds_max': mesh.bounds_max.tolist(),
+        'obj_center': mesh.center().tolist(),
+        'normal': mesh.hasNormals(),
+        'uv': uv,
+        'vertex_number': len(mesh.corners),
+        'formato': fmt,
+        'dequantizacao': D.tolist(),
+        'bytes_float': 4*vertices.size,
+        'acmr': acmr,
+        'lods': niveis_lod,
+    }
+    return arrays, meta
+
+# Método que, na recarga, deixa os vértices e os triângulos que não mudaram
+# nas mesmas posições em que estão no VBO e no EBO
+def keep_order(vertices, indices):
+    tipo = indices.dtype
+    if vertices.shape[1] == vertex_array.shape[1]:
+        ordem = hr.stableOrder(vertex_array, vertices)
+        vertices = vertices[ordem]
+        posicao = np.empty_like(ordem)
+        posicao[ordem] = np.arange(len(ordem))
+        indices = posicao[indices]
+
+    inicio, n = lods[0]
+    antigos = index_array[inicio:inicio + n].astype('uint32').reshape(-1, 3)
+    triangulos = indices.astype('uint32').reshape(-1, 3)
+    if vertices.shape[1] != vertex_array.shape[1]:
+        return vertices, triangulos[hr.stableOrder(antigos, triangulos)].ravel().astype(tipo)
+
+    # Vértices iguais após a quantização são intercambiáveis: os triângulos
+    # são comparados pelo conteúdo dos vértices, e os que não mudaram
+    # mantêm os índices antigos (se ainda apontam para o mesmo conteúdo);
+    # os que mudaram voltam à posição dos mesmos índices, se houver
+    chaves = hr.rowHash(vertices)[triangulos]
+    triangulos = triangulos[hr.stableOrder(hr.rowHash(vertex_array)[antigos], chaves, antigos, triangulos)]
+    k = min(len(antigos), len(triangulos))
+    antigos = antigos[:k]
+    validos = (antigos < len(vertices)).all(1)
+    mantidos = np.zeros(k, dtype=bool)
+    mantidos[validos] = (vertices[antigos[validos]] == vertex_array[antigos[validos]]).all(axis=(1, 2)) & \
+                        (vertices[antigos[validos]] == vertices[triangulos[:k][validos]]).all(axis=(1, 2))
+    triangulos[:k][mantidos] = antigos[mantidos]
+    return vertices, triangulos.ravel().astype(tipo)
+
 # Método que carrega o objeto definido no arquivo obj para o vertex array
 def load_obj():
     obj_name = sys.argv[1]
-    obj_file = open(obj_name)
     print("Input argument:", obj_name)
     
-    # Chamada dos arrays e valores a serem setados pelo objeto
-    global vertex_array, vertex_number, normal, M, obj_center
+    # Centro do objeto (os demais valores são setados por apply_mesh)
+    global obj_center
+
+    # LEITURA DO ARQUIVO (ou do cache, se o obj não mudou)
+    tag = 'trabalho2-%s-%s' % ('indexed' if indexado else 'soup', formato or 'auto')
+    if indexado and otimizar_cache:
+        tag += '-vcache'
+    if indexado and gerar_lods:
+        tag += '-lod'
+    if gerar_normais:
+        tag += '-vn' if angulo_vinco is None else '-vn%g' % angulo_vinco
+    if usar_uv:
+        tag += '-uv'
+    # Versões dos módulos que montam os arrays (uma mudança na saída de
+    # qualquer um deles invalida o cache)
+    versoes = {'normals': nm.NORMALS_VERSION, 'vertexformat': vf.FORMAT_VERSION,
+               'vertexcache': vc.VCACHE_VERSION, 'simplify': sp.SIMPLIFY_VERSION}
+    arrays, meta = mc.loadCached(obj_name, tag, parse_obj, versoes)
+    apply_mesh(arrays, meta)
+
+    # As coordenadas de centro recebem o ponto médio dos mínimos e máximos do objeto em cada eixo
+    obj_center = list(meta['obj_center'])
+    if indexado:
+        print('Níveis de detalhe:', ', '.join('%d' % (n // 3) for _, n in lods), 'triângulos')
+
+    print('Formato de vértices: %s, %d bytes (%.0f%% de %d bytes em float32)' % (
+        formato_malha, vertex_array.nbytes, 100.0*vertex_array.nbytes/meta['bytes_float'], meta['bytes_float']))
+    if meta['acmr'] is not None:
+        print('ACMR (cache de %d vértices): %.3f -> %.3f' % (vc.CACHE_SIZE, meta['acmr'][0], meta['acmr'][1]))
+
+# Método que passa para as variáveis globais os arrays e valores montados
+# por build_arrays (na carga e a cada recarga do obj)
+def apply_mesh(arrays, meta):
+    global vertex_array, index_array, vertex_number, normal, uv_malha
+    global formato_malha, dequantizacao, lods, raio_malha, limites_malha
     # Coordenadas limite do objeto
     global x_min, y_min, z_min, x_max, y_max, z_max
 
-    vertices = list()
-    normais = list()
-    faces = {'v':[], 'n':[]}
-    output_vertices = list()
-
-    # LEITURA DO ARQUIVO
-    # For que itera nas linha do arquivo
-    for line in obj_file:
-        # Caso a linha descreva um vértice
-        if line[:2] == "v ":
-            # Cada coordenada de vértice é separada e adicionada ao array de vértices
-            v_values = line[1:].split()
-            vertices.append(v_values)
-
-            # Validamos se algumas das coordenadas é um ponto mais extremo do objeto
-            if float(v_values[0]) > x_max:
-                x_max = float(v_values[0])
-            if float(v_values[0]) < x_min:
-                x_min = float(v_values[0])
-            if float(v_values[1]) > y_max:
-                y_max = float(v_values[1])
-            if float(v_values[1]) < y_min:
-                y_min = float(v_values[1])
-            if float(v_values[2]) > z_max:
-                z_max = float(v_values[2])
-            if float(v_values[2]) < z_min:
-                z_min = float(v_values[2])
-
-        # Caso a linha descreva a normal de um vértice
-        elif line[:2] == "vn":
-            n_values = line[2:].split()
-            normais.append(n_values)
-
-        # Caso a linha descreva uma face
-        elif line[:2] == 'f ':
-            # Cada valor de face é separado
-            f_values = line[1:].split()
-
-            for v in f_values:
-                if '/' in v: # Caso hajam mais valores do que apenas o índice da coordenada
-                    normal = True
-                    v_index  = v.split('/')[0] # Separamos o valor da coordenada
-                    # v_color  = v.split('/')[1]
-                    v_normal = v.split('/')[2]
-            
-                    # Atribuimos o valor da coordenada da face à lista de faces
-                    if v_index:
-                        faces['v'].append(int(v_index)-1)
-                    if v_normal:
-                        faces['n'].append(int(v_normal)-1)
-                else: faces['v'].append(int(v)-1)
-
-    if normal == True:
-        for v, n in zip(faces['v'], faces['n']):
-            output_vertices.append(vertices[v])
-            output_vertices.append(normais[n])
-    else:
-        for v in faces['v']:
-            output_vertices.append(vertices[v])
-    
-    # As coordenadas de centro recebem o ponto médio dos mínimos e máximos do objeto em cada eixo
-    obj_center = [(x_max+x_min)/2, (y_max+y_min)/2, (z_max+z_min)/2]
-    vertex_number = len(output_vertices)
-    vertex_array = np.asarray(output_vertices, dtype='float32').flatten()
+    normal = meta['normal']
+    uv_malha = meta['uv']
+
+    # Coordenadas mais extremas do objeto em cada eixo
+    x_min, y_min, z_min = meta['bounds_min']
+    x_max, y_max, z_max = meta['bounds_max']
+
+    # Cada canto de triângulo vira um vértice (posição e, se houver, normal e coordenada de textura)
+    vertex_number = meta['vertex_number']
+    vertex_array = arrays['vertex_array']
+    if indexado:
+        index_array = arrays['index_array']
+        lods = meta['lods']
+
+    # Raio da esfera envolvente (metade da diagonal da caixa envolvente)
+    raio_malha = float(np.linalg.norm(np.subtract(meta['bounds_max'], meta['bounds_min']))) / 2.0
+    limites_malha = (meta['bounds_min'], meta['bounds_max'], meta['obj_center'], raio_malha)
+
+    formato_malha = meta['formato']
+    dequantizacao = np.array(meta['dequantizacao'], dtype='float32')
+
+# Método que abre e decodifica a imagem usada como textura
+# (roda em uma thread de leitura, sem chamadas OpenGL)
+def load_texture(image_name):
+    # Níveis de mipmap lidos do cache (sem decodificar a imagem) ou calculados
+    niveis = mm.loadMipmaps(image_name)
+    print('opened file: size=', niveis[0].shape[1::-1], 'channels=', niveis[0].shape[2], 'levels=', len(niveis))
+    return niveis
+
+## Load assets.
+#
+# Starts reading the obj and decoding the texture on worker threads.
+def loadAssets():
+    global loader
+    loader = al.AssetLoader()
+    loader.submit('obj', lambda _: initData(), load_obj)
+    loader.submit('textura', initTexture, load_texture, sys.argv[2])
+    if recarregar:
+        startReload()
 
 ## Init vertex data.
 #
-# Defines the coordinates for vertices, creates the arrays for OpenGL.
+# Creates the arrays for OpenGL from the data read by load_obj.
 def initData():
 
     # Uses vertex arrays.
-    global VAO, VBO, VTO
+    global VAO, VBO, EBO
 
     # Usa os array de vertices, faces, matriz de transforamção e centro do objeto
     global vertex_array, normal, M, obj_center
-    
-    # Chama o método que vai ler o arquivo .obj
-    load_obj()
-    # Abre a imagem que será usada como textura
-    img = Image.open(sys.argv[2])
-    print('opened file: size=', img.size, 'format=', img.format)
-    imageData = np.array(list(img.getdata()), np.uint8)
 
     # Primeira translação para levar o centro do objeto para a origem dos eixos
     # (corrigindo o caso dele ser definido com centro fora da origem)
@@ -443,6 +911,7 @@ def initData():
     obj_center[2] -= obj_center[2]
 
     # Vertex array.
+    global espelho_vbo, espelho_ebo
     VAO = gl.glGenVertexArrays(1)
     gl.glBindVertexArray(VAO)
 
@@ -450,36 +919,16 @@ def initData():
     VBO = gl.glGenBuffers(1)
     gl.glBindBuffer(gl.GL_ARRAY_BUFFER, VBO)
     gl.glBufferData(gl.GL_ARRAY_BUFFER, vertex_array.nbytes, vertex_array, gl.GL_STATIC_DRAW)
+    espelho_vbo = hr.BufferMirror(gl.GL_ARRAY_BUFFER, VBO, vertex_array)
+
+    # Element buffer (apenas na geometria indexada)
+    if indexado:
+        EBO = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, EBO)
+        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, index_array.nbytes, index_array, gl.GL_STATIC_DRAW)
+        espelho_ebo = hr.BufferMirror(gl.GL_ELEMENT_ARRAY_BUFFER, EBO, index_array)
     
-    # Texture data
-    VTO = gl.glGenTextures(1)
-    gl.glBindTexture(gl.GL_TEXTURE_CUBE_MAP, VTO)
-
-    # Texture settings
-    for i in range(6):
-      gl.glTexImage2D(gl.GL_TEXTURE_CUBE_MAP_POSITIVE_X + i, 0, gl.GL_RGB, img.size[0], img.size[1], 0, gl.GL_RGB, gl.GL_UNSIGNED_BYTE, imageData)
-
-    gl.glTexParameteri(gl.GL_TEXTURE_CUBE_MAP, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
-    gl.glTexParameteri(gl.GL_TEXTURE_CUBE_MAP, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
-    gl.glTexParameteri(gl.GL_TEXTURE_CUBE_MAP, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
-    gl.glTexParameteri(gl.GL_TEXTURE_CUBE_MAP, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
-    gl.glTexParameteri(gl.GL_TEXTURE_CUBE_MAP, gl.GL_TEXTURE_WRAP_R, gl.GL_CLAMP_TO_EDGE)  
-    
-    # Set attributes
-    if normal == True:
-        # Posição
-        gl.glEnableVertexAttribArray(0)
-        gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 6*vertex_array.itemsize, None)
-        # Normal
-        gl.glEnableVertexAttribArray(1)
-        gl.glVertexAttribPointer(1, 3, gl.GL_FLOAT, gl.GL_FALSE, 6*vertex_array.itemsize, c_void_p(3*vertex_array.itemsize))
-    else:
-        # Posição
-        gl.glEnableVertexAttribArray(0)
-        gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
-    
-    # Unbind Vertex Array Object.
-    gl.glEnableVertexAttribArray(0)
+    setAttributes()
 
     gl.glEnable(gl.GL_DEPTH_TEST)
     gl.glDepthFunc(gl.GL_LESS)
@@ -487,18 +936,146 @@ def initData():
     # Unbind Vertex Array Object.
     gl.glBindVertexArray(0)
 
+## Start reload.
+#
+# Passa a observar o arquivo obj. A verificação periódica (checkReload) é
+# um timer do GLUT, registrado em main depois da criação da janela.
+def startReload():
+    global observador
+    observador = hr.FileWatcher(sys.argv[1])
+
+## Check reload.
+#
+# Timer que recarrega o obj quando o arquivo mudou.
+def checkReload(value):
+    global lendo_recarga
+    if VAO is not None and not lendo_recarga and observador.changed():
+        if malha_incremental is None:
+            # Primeira mudança: o obj inteiro é lido em blocos numa thread,
+            # e as recargas seguintes releem só os blocos que mudarem
+            lendo_recarga = True
+            submitAsset('recarga', firstReload, read_incremental, observador.file_name)
+        else:
+            try:
+                reload_obj()
+            except ValueError as e:
+                # Arquivo com erro (por exemplo, no meio de uma edição): a malha atual é mantida
+                print('Recarga de %s falhou: %s' % (observador.file_name, e))
+    glut.glutTimerFunc(INTERVALO_RECARGA, checkReload, 0)
+
+## Read incremental.
+#
+# Roda numa thread de leitura.
+#
+# @param obj_name Arquivo obj.
+# @return hr.IncrementalObj, ou o ValueError de um arquivo com erro.
+def read_incremental(obj_name):
+    try:
+        return hr.IncrementalObj(obj_name)
+    except ValueError as e:
+        return e
+
+## First reload.
+#
+# Aplica a primeira leitura em blocos do obj.
+#
+# @param inc Resultado de read_incremental.
+def firstReload(inc):
+    global malha_incremental, lendo_recarga
+    lendo_recarga = False
+    if isinstance(inc, ValueError):
+        # Na próxima mudança o arquivo é lido inteiro de novo
+        print('Recarga de %s falhou: %s' % (observador.file_name, inc))
+        return
+    malha_incremental = inc
+    reload_obj(inc.mesh)
+
+## Reload OBJ.
+#
+# Relê só os blocos do obj que mudaram, remonta os arrays (sem os níveis de
+# detalhe e sem a ordem para o cache, lentos demais para uma recarga, e com
+# os vértices e triângulos que não mudaram no mesmo lugar) e envia para a GPU
+# só os trechos do VBO e do EBO que mudaram.
+#
+# @param mesh Malha já lida (None para reler os blocos que mudaram).
+def reload_obj(mesh=None):
+    global bvh_malha
+
+    inicio = time.perf_counter()
+    if mesh is None:
+        mesh = malha_incremental.load()
+    arrays, meta = build_arrays(mesh, False, True)
+    antes = (formato_malha, normal, uv_malha)
+    apply_mesh(arrays, meta)
+    leitura = time.perf_counter() - inicio
+
+    gl.glBindVertexArray(VAO)
+    enviados, trechos, realocado = espelho_vbo.update(vertex_array)
+    if indexado:
+        e, t, r = espelho_ebo.update(index_array)
+        enviados, trechos, realocado = enviados + e, trechos + t, realocado or r
+    if (formato_malha, normal, uv_malha) != antes:
+        setAttributes()
+    gl.glBindVertexArray(0)
+
+    # A BVH é refeita no próximo clique
+    bvh_malha = None
+    print('Recarga: %d bytes relidos, %.1f ms; %d bytes enviados em %d trechos%s (%.1f ms no total)' % (
+        malha_incremental.parsed, 1000*leitura, enviados, trechos, ', buffer realocado' if realocado else '',
+        1000*(time.perf_counter() - inicio)))
+    glut.glutPostRedisplay()
+
+## Set attributes.
+#
+# Aponta os atributos do VAO ligado para o VBO (posição e, se houver, normal
+# e coordenada de textura, no formato da malha).
+def setAttributes():
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, VBO)
+    stride, attribs = vf.attributes(formato_malha, normal, uv_malha)
+    for location, size, gl_type, normalized, offset in attribs:
+        gl.glEnableVertexAttribArray(location)
+        gl.glVertexAttribPointer(location, size, gl_type, normalized, stride, c_void_p(offset))
+    if not normal:
+        gl.glDisableVertexAttribArray(1)
+    if not uv_malha:
+        gl.glDisableVertexAttribArray(2)
+
+## Init texture.
+#
+# Uploads the image decoded by load_texture.
+#
+# @param image Níveis de mipmap (arrays uint8 (altura, largura, canais)) de mipmap.loadMipmaps.
+def initTexture(image):
+    global VTO, imagens, imagem_atual
+
+    # Texture data (uma única textura 2D: com vt ela é amostrada pelas
+    # coordenadas do obj, sem vt o shader a projeta nas seis faces de um cubo)
+    VTO = texturas.put(sys.argv[2], image)
+    texturas.pinned = {sys.argv[2]}
+
+    # Imagens da mesma pasta, para a troca de textura em execução
+    pasta = os.path.dirname(sys.argv[2]) or '.'
+    imagens = sorted(os.path.join(pasta, f) for f in os.listdir(pasta)
+                     if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+    if sys.argv[2] not in imagens:
+        imagens.insert(0, sys.argv[2])
+    imagem_atual = imagens.index(sys.argv[2])
+
 ## Create program (shaders).
 #
 # Compile shaders and create programs.
 def initShaders():
     global program
-    program = ut.createShaderProgram(vertex_code, fragment_code)
+    program = sh.ShaderProgram(vertex_code, fragment_code)
 
 ## Main function.
 #
 # Init GLUT and the window settings. Also, defines the callback functions used in the program.
 def main():
 
+    # A leitura do obj e da textura começa antes da criação da janela
+    loadAssets()
+
     glut.glutInit()
     glut.glutInitContextVersion(3, 3)
     glut.glutInitContextProfile(glut.GLUT_CORE_PROFILE)
@@ -506,13 +1083,16 @@ def main():
     glut.glutInitWindowSize(win_width,win_height)
     glut.glutCreateWindow('Mesh I&T')
 
-    initData()
     initShaders()
 
     glut.glutReshapeFunc(reshape)
     glut.glutDisplayFunc(display)
+    glut.glutIdleFunc(idle)
     glut.glutKeyboardFunc(keyboard)
     glut.glutSpecialFunc(special_keyboard)
+    glut.glutMouseFunc(mouse)
+    if observador is not None:
+        glut.glutTimerFunc(INTERVALO_RECARGA, checkReload, 0)
 
     glut.glutMainLoop()
 
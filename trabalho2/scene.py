@@ -0,0 +1,257 @@
+#!/usr/bin/python
+
+## @file scene.py
+# Cena com vários arquivos .obj, todos no mesmo vertex buffer e no mesmo
+# index buffer (MeshArena). Cada arquivo ocupa um único trecho da arena, e suas
+# cópias diferem só pela matriz model, um atributo por instância. Cada quadro
+# faz um único bind e uma chamada de desenho instanciada por arquivo.
+#
+# Uso: python3 scene.py a.obj b.obj ... [--copias N]
+#
+# @author Mateus Raganhan Figênio
+
+
+import sys
+import numpy as np
+import OpenGL.GL as gl
+import OpenGL.GLUT as glut
+import utils as ut
+
+sys.path.append('../lib/')
+import arena as ar
+import culling as cl
+import shader as sh
+
+
+### --- VARIÁVEIS GLOBAIS --- ###
+
+## Largura da janela
+win_width  = 800
+## Altura da janela
+win_height = 600
+## Abertura de FOVY
+fovy = np.radians(45.0)
+## Distância entre os centros dos objetos na grade
+espacamento = 1.5
+## Distância da câmera ao centro da cena
+z_dist = 5.0
+## Matriz de rotação da cena
+M = np.identity(4, dtype='float32')
+
+## Malhas da cena, em um único VBO/EBO
+arena = None
+## Malha da arena de cada objeto
+objetos = np.zeros(0, dtype='int64')
+## Matriz model de cada objeto (centraliza, escala e põe na grade)
+modelos = np.zeros((0, 4, 4), dtype='float32')
+## Contadores de objetos desenhados e descartados
+descarte = cl.CullStats()
+## Variável do programa (sh.ShaderProgram)
+program = None
+
+## Vertex shader.
+vertex_code = """
+#version 330 core
+layout (location = 0) in vec3 position;
+layout (location = 1) in vec3 normal;
+layout (location = 3) in mat4 model;
+
+uniform mat4 view;
+uniform mat4 projection;
+
+out vec3 vNormal;
+out vec3 fragPosition;
+
+void main()
+{
+    gl_Position = projection * view * model * vec4(position, 1.0);
+    fragPosition = vec3(view * model * vec4(position, 1.0));
+    vNormal = mat3(view * model) * normal;
+}
+"""
+
+## Fragment shader.
+fragment_code = """
+#version 330 core
+in vec3 vNormal;
+in vec3 fragPosition;
+
+out vec4 fragColor;
+
+uniform vec3 objectColor;
+uniform vec3 lightPosition;
+
+void main()
+{
+    vec3 n = normalize(vNormal);
+    vec3 l = normalize(lightPosition - fragPosition);
+    vec3 v = normalize(-fragPosition);
+    vec3 r = reflect(-l, n);
+
+    float diff = max(dot(n, l), 0.0);
+    float spec = pow(max(dot(v, r), 0.0), 16.0);
+    fragColor = vec4((0.3 + 0.7*diff + 0.5*spec) * objectColor, 1.0);
+}
+"""
+
+## Drawing function.
+#
+# Draws the scene.
+def display():
+    gl.glClearColor(0.2, 0.3, 0.3, 1.0)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+
+    program.use()
+
+    view = np.matmul(ut.matTranslate(0.0, 0.0, -z_dist), ut.matRotateX(np.radians(30.0)))
+    projection = ut.matPerspective(fovy, win_width/win_height, 0.1, 4.0*z_dist)
+
+    program.set("view", view)
+    program.set("projection", projection)
+    program.set("objectColor", (0.8, 0.3, 0.2))
+    program.set("lightPosition", (0.0, 2.0*z_dist, 0.0))
+    if program.endFrame():
+        print('Uniforms enviados: %d, repetidos: %d' % (program.frame_uploads, program.frame_skips))
+
+    # Descarte por frustum de todos os objetos de uma vez, cada um com a sua
+    # matriz model e os limites da sua malha, e um desenho instanciado por
+    # malha para os visíveis
+    model = np.matmul(M, modelos)
+    lo, hi, centro, raio = arena.bounds()
+    visivel = cl.visible(np.matmul(np.matmul(projection, view), model),
+                         lo[objetos], hi[objetos], centro[objetos], raio[objetos])
+    if descarte.update(visivel):
+        print('Objetos desenhados: %d, descartados: %d' % (descarte.drawn, descarte.culled))
+
+    arena.bind()
+    arena.drawInstances(objetos[visivel], model[visivel])
+    gl.glBindVertexArray(0)
+
+    glut.glutSwapBuffers()
+
+
+## Reshape function.
+#
+# Called when window is resized.
+#
+# @param width New window width.
+# @param height New window height.
+def reshape(width, height):
+    global win_width, win_height
+    win_width = width
+    win_height = height
+    gl.glViewport(0, 0, win_width, win_height)
+    glut.glutPostRedisplay()
+
+
+## Special keyboard function.
+#
+# Setas giram a cena.
+def special_keyboard(key, x, y):
+    global M
+    if key == glut.GLUT_KEY_UP:
+        M = np.matmul(ut.matRotateX(np.radians(-10.0)), M)
+    elif key == glut.GLUT_KEY_DOWN:
+        M = np.matmul(ut.matRotateX(np.radians(10.0)), M)
+    elif key == glut.GLUT_KEY_RIGHT:
+        M = np.matmul(ut.matRotateY(np.radians(10.0)), M)
+    elif key == glut.GLUT_KEY_LEFT:
+        M = np.matmul(ut.matRotateY(np.radians(-10.0)), M)
+    glut.glutPostRedisplay()
+
+
+## Keyboard function.
+#
+# 'a' e 'd' aproximam e afastam a câmera.
+#
+# @param key Pressed key.
+# @param x Mouse x coordinate when key pressed.
+# @param y Mouse y coordinate when key pressed.
+def keyboard(key, x, y):
+    global z_dist
+    if key == b'a':
+        z_dist *= 0.9
+    elif key == b'd':
+        z_dist /= 0.9
+    elif key == b'\x1b' or key == b'q':
+        sys.exit()
+    glut.glutPostRedisplay()
+
+
+## Load scene.
+#
+# Lê os arquivos .obj da linha de comando para a arena, uma vez cada. Cada
+# objeto é uma cópia cuja matriz model centraliza a malha, a escala para caber
+# em um cubo unitário e a põe em uma célula de uma grade no plano xz.
+def load_scene():
+    global arena, objetos, modelos, z_dist
+
+    args = sys.argv[1:]
+    copias = 1
+    if '--copias' in args:
+        i = args.index('--copias')
+        copias = int(args[i + 1])
+        del args[i:i + 2]
+
+    total = len(args) * copias
+    lado = int(np.ceil(np.sqrt(max(total, 1))))
+    z_dist = max(lado * espacamento * 1.5, 3.0)
+
+    arena = ar.MeshArena()
+    objetos, modelos = [], []
+    for obj_name in args:
+        vertices, indices = ar.loadObj(obj_name)
+        malha = arena.add(obj_name, vertices, indices)
+        lo, hi = vertices[:, :3].min(axis=0), vertices[:, :3].max(axis=0)
+        escala = 1.0 / max(float((hi - lo).max()), 1e-12)
+        centro = (lo + hi) / 2.0
+        centralizar = np.matmul(ut.matScale(escala, escala, escala), ut.matTranslate(*-centro))
+
+        for _ in range(copias):
+            j = len(objetos)
+            celula = (np.array([j % lado, 0.0, j // lado]) - [(lado - 1) / 2.0, 0.0, (lado - 1) / 2.0]) * espacamento
+            objetos.append(malha)
+            modelos.append(np.matmul(ut.matTranslate(*celula), centralizar))
+    objetos = np.array(objetos, dtype='int64')
+    modelos = np.array(modelos, dtype='float32').reshape(-1, 4, 4)
+
+    print('Cena: %d objetos de %d malhas, %d vértices, %d índices em um VBO e um EBO' % (
+        len(objetos), arena.size(), arena.vertices.size, arena.indices.size))
+
+
+## Create program (shaders).
+#
+# Compile shaders and create programs.
+def initShaders():
+    global program
+    program = sh.ShaderProgram(vertex_code, fragment_code)
+
+
+## Main function.
+#
+# Init GLUT and the window settings. Also, defines the callback functions used in the program.
+def main():
+    load_scene()
+
+    glut.glutInit()
+    glut.glutInitContextVersion(3, 3)
+    glut.glutInitContextProfile(glut.GLUT_CORE_PROFILE)
+    glut.glutInitDisplayMode(glut.GLUT_DOUBLE | glut.GLUT_RGBA | glut.GLUT_DEPTH)
+    glut.glutInitWindowSize(win_width, win_height)
+    glut.glutCreateWindow('Scene')
+
+    initShaders()
+    arena.upload()
+
+    gl.glEnable(gl.GL_DEPTH_TEST)
+    gl.glDepthFunc(gl.GL_LESS)
+
+    glut.glutReshapeFunc(reshape)
+    glut.glutDisplayFunc(display)
+    glut.glutKeyboardFunc(keyboard)
+    glut.glutSpecialFunc(special_keyboard)
+
+    glut.glutMainLoop()
+
+if __name__ == '__main__':
+    main()